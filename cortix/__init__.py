@@ -13,5 +13,6 @@ from .support.units import Units
 from .support.phase import Phase
 from .support.quantity import Quantity
 from .support.species import Species
+from .support.writer import Writer
 from .support.chemeng.reaction_mechanism import ReactionMechanism
 from .support.chemeng.reaction_mechanism import print_reaction_sub_mechanisms
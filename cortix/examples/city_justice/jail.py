@@ -88,6 +88,8 @@ class Jail(Module):
         # Phase state
         self.population_phase = Phase(self.initial_time, time_unit='s',
                 quantities=quantities)
+        for name in ('fjg', 'cj0g', 'cjpg'):
+            self.population_phase.declare_vector(name, (self.n_groups,))
 
         self.population_phase.set_value('fjg', fjg_0, self.initial_time)
 
@@ -224,6 +226,9 @@ class Jail(Module):
         # Update current values
         self.population_phase.set_value('fjg', u_vec, time)
 
+        # Live view in the root process when the network streams
+        self.stream_phase(self.population_phase, 'population')
+
         return time
 
     def __compute_outflow_rates(self, time, name):
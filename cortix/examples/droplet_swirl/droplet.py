@@ -94,6 +94,8 @@ class Droplet(Module):
         # Liquid phase 
         self.liquid_phase = Phase(self.initial_time, time_unit='s', species=species, \
                 quantities=quantities)
+        self.liquid_phase.declare_vector('position', (3,))
+        self.liquid_phase.declare_vector('velocity', (3,))
         self.liquid_phase.set_value('water', water.massCC, self.initial_time)
 
         # Domain box dimensions: LxLxH m^3 box with given H.
@@ -254,13 +256,11 @@ class Droplet(Module):
 
            u_vec = u_vec_hist[1,:]  # solution vector at final time step
 
-        values = self.liquid_phase.get_row(time) # values at previous time
-
         time += self.time_step
 
-        self.liquid_phase.add_row(time, values)
-
-        if not self.bottom_impact:
+        if self.bottom_impact:
+            self.liquid_phase.append_step(time) # values at previous time
+        else:
 
             # Ground impact with bouncing drop
             if u_vec[2] <= 0.0 and self.bounce:
@@ -277,11 +277,14 @@ class Droplet(Module):
                 u_vec[3:] = 0.0  # zero velocity
                 self.bottom_impact = True
 
-            # Update current values
-            self.liquid_phase.set_value('position', u_vec[0:3], time)
-            self.liquid_phase.set_value('velocity', u_vec[3:], time)
-            self.liquid_phase.set_value('speed', np.linalg.norm(u_vec[3:]), time)
-            self.liquid_phase.set_value('radial-position', np.linalg.norm(u_vec[0:2]),
-                    time)
+            # New values; the others are those at previous time
+            self.liquid_phase.append_step(time, **{
+                'position': u_vec[0:3],
+                'velocity': u_vec[3:],
+                'speed': np.linalg.norm(u_vec[3:]),
+                'radial-position': np.linalg.norm(u_vec[0:2])})
+
+        # Live view in the root process when the network streams
+        self.stream_phase(self.liquid_phase, 'liquid')
 
         return time
@@ -2,7 +2,6 @@
 from cortix import Cortix
 from cortix import Module
 from cortix import Network
-from cortix import Port
 from body import Body
 
 from mpl_toolkits.mplot3d import Axes3D
@@ -22,56 +21,23 @@ def main():
     cortix = Cortix(use_mpi=um)
     cortix.network = Network()
 
-    earth_mass = 5.9740e+24
-    earth_pos = np.array([1.4960e+11, 0.0, 0.0])
-    earth_vel = np.array([(0.0, 2.9800e+04, 0.0)])
-    earth = Body(earth_mass, earth_pos, earth_vel)
-    earth.name = "earth"
-    cortix.network.module(earth)
-
-    mars_mass = 6.4190e+23
-    mars_pos = np.array([2.2790e+11, 0.0, 0.0])
-    mars_vel = np.array([0.0, 2.4100e+04, 0.0])
-    mars = Body(mars_mass, mars_pos, mars_vel)
-    mars.name = "mars"
-    cortix.network.module(mars)
-
-    mercury_mass = 3.3020e+23
-    mercury_pos = np.array([5.7900e+10, 0.0, 0.0])
-    mercury_vel = np.array([0.0, 4.7900e+04, 0.0])
-    mercury = Body(mercury_mass, mercury_pos, mercury_vel)
-    mercury.name = "mercury"
-    cortix.network.module(mercury)
-
-    venus_mass = 4.8690e+24
-    venus_pos = np.array([1.0820e+11, 0.0, 0.0])
-    venus_vel = np.array([0.0, 3.5000e+04 , 0.0])
-    venus = Body(venus_mass, venus_pos, venus_vel)
-    venus.name = "venus"
-    cortix.network.module(venus)
-
-    sun_mass = 1.9890e+30
-    sun_pos = np.array([0.0, 0.0, 0.0])
-    sun_vel = np.array([0.0, 0.0, 0.0])
-    sun = Body(sun_mass, sun_pos, sun_vel)
-    sun.name = "sun"
-    cortix.network.module(sun)
-
-    for x, i in enumerate(cortix.network.modules):
-        i.save = True
-        i.dt = time_step
-        i.time = sim_time
-        for y, j in enumerate(cortix.network.modules):
-            pi = Port("body_{}".format(y), um)
-
-            if x != y and pi not in i.ports:
-                i.ports.append(pi)
-
-                pj = Port("body_{}".format(x), um)
-                j.ports.append(pj)
-
-                pj.connect(pi)
-                cortix.network.gv_edges.append((str(x), str(y)))
+    bodies = [("earth", 5.9740e+24, [1.4960e+11, 0.0, 0.0], [(0.0, 2.9800e+04, 0.0)]),
+              ("mars", 6.4190e+23, [2.2790e+11, 0.0, 0.0], [0.0, 2.4100e+04, 0.0]),
+              ("mercury", 3.3020e+23, [5.7900e+10, 0.0, 0.0], [0.0, 4.7900e+04, 0.0]),
+              ("venus", 4.8690e+24, [1.0820e+11, 0.0, 0.0], [0.0, 3.5000e+04, 0.0]),
+              ("sun", 1.9890e+30, [0.0, 0.0, 0.0], [0.0, 0.0, 0.0])]
+
+    # Every body exchanges data with every other body through port "body_<index>"
+    spec = {"modules": [{"name": name, "class": Body,
+                         "kwargs": {"mass": mass, "rad": np.array(pos), "vel": np.array(vel),
+                                    "time": sim_time, "dt": time_step},
+                         "attributes": {"save": True}}
+                        for (name, mass, pos, vel) in bodies],
+            "connections": [{"pattern": "all-to-all",
+                             "modules": [name for (name, _, _, _) in bodies],
+                             "ports": ["body_{b}", "body_{a}"]}]}
+
+    cortix.network.build(spec)
 
     cortix.run()
     cortix.network.draw()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of the Cortix toolkit environment
+# https://cortix.org
+"""CPU affinity of module processes.
+
+Policies map modules onto the CPUs this process may use (Linux only):
+
+    'compact'  fill the cores of one socket (NUMA domain) before the next.
+    'scatter'  spread modules round-robin over the sockets.
+    dict       module index mapped to a CPU or a list of CPUs.
+
+With `connected` pairs, communicating modules are first grouped on the same socket
+(see `cortix.src.placement.partition`), then laid out compactly within it.
+
+A process is pinned at creation: the launching thread sets its own affinity, starts
+the process (which inherits it, together with every thread it will create, e.g.
+BLAS thread pools) and restores its affinity.
+"""
+
+import os
+import glob
+import collections
+import contextlib
+
+from cortix.src.placement import partition
+
+def cpu_topology():
+    """CPUs available to this process with their socket and core.
+
+    Sockets are NUMA nodes when the system reports them, else physical packages.
+
+    Returns
+    -------
+    topology: list(tuple(int,int,int))
+        `(cpu, socket, core)` sorted by socket, core and cpu.
+    """
+
+    if hasattr(os, 'sched_getaffinity'):
+        cpus = sorted(os.sched_getaffinity(0))
+    else:
+        cpus = list(range(os.cpu_count() or 1))
+
+    numa = dict()
+    for node_dir in glob.glob('/sys/devices/system/node/node[0-9]*'):
+        node = int(os.path.basename(node_dir)[4:])
+        try:
+            with open(os.path.join(node_dir, 'cpulist')) as fin:
+                for cpu in parse_cpu_list(fin.read()):
+                    numa[cpu] = node
+        except OSError:
+            continue
+
+    topology = list()
+    for cpu in cpus:
+        base = '/sys/devices/system/cpu/cpu{}/topology/'.format(cpu)
+        socket = numa.get(cpu, _read_int(base + 'physical_package_id', 0))
+        core = _read_int(base + 'core_id', cpu)
+        topology.append((cpu, socket, core))
+
+    return sorted(topology, key=lambda t: (t[1], t[2], t[0]))
+
+def parse_cpu_list(text):
+    """Convert a kernel CPU list such as '0-3,8,10-11' into a list of ints."""
+
+    cpus = list()
+    for part in text.strip().split(','):
+        if not part:
+            continue
+        if '-' in part:
+            (first, last) = part.split('-')
+            cpus.extend(range(int(first), int(last) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+def _read_int(file_name, default):
+    try:
+        with open(file_name) as fin:
+            return int(fin.read())
+    except (OSError, ValueError):
+        return default
+
+def affinity_map(policy, num_modules, topology, connected=None):
+    """Map modules onto CPUs.
+
+    Parameters
+    ----------
+    policy: str or dict
+        'compact', 'scatter', or module index mapped to a CPU or list of CPUs.
+    num_modules: int
+    topology: list(tuple(int,int,int))
+        See `cpu_topology()`.
+    connected: dict(tuple(int,int):float) or None
+        Weighted module pairs that communicate; keep them on the same socket.
+
+    Returns
+    -------
+    cpus_of: dict(int:list(int))
+        Module index mapped to its CPUs; modules outside a dict policy are not pinned.
+    """
+
+    if isinstance(policy, dict):
+        cpus_of = dict()
+        for (idx, cpus) in policy.items():
+            assert 0 <= int(idx) < num_modules, 'no module with index %r'%idx
+            cpus_of[int(idx)] = [cpus] if isinstance(cpus, int) else list(cpus)
+        return cpus_of
+
+    assert policy in ('compact', 'scatter'), \
+        "affinity must be 'compact', 'scatter' or a dict; got %r"%policy
+    assert topology, 'no CPUs available'
+
+    by_socket = collections.OrderedDict()
+    for (cpu, socket, _) in topology:
+        by_socket.setdefault(socket, list()).append(cpu)
+    sockets = list(by_socket.values())
+
+    if connected:
+        assignment = partition(len(sockets), connected, [1.0]*num_modules,
+                               capacities=[len(cpus) for cpus in sockets])
+        members = [[idx for idx in range(num_modules) if assignment[idx] == s]
+                   for s in range(len(sockets))]
+        cpus_of = dict()
+        for (s, idxs) in enumerate(members):
+            for (k, idx) in enumerate(idxs):
+                cpus_of[idx] = [sockets[s][k % len(sockets[s])]]
+        return cpus_of
+
+    if policy == 'compact':
+        order = [cpu for cpus in sockets for cpu in cpus]
+    else:
+        order = list()
+        for k in range(max(len(cpus) for cpus in sockets)):
+            order.extend(cpus[k] for cpus in sockets if k < len(cpus))
+
+    return {idx: [order[idx % len(order)]] for idx in range(num_modules)}
+
+def host_affinity_map(idxs, policy, connected=None, topology=None):
+    """Map the modules run on this host onto its CPUs.
+
+    Parameters
+    ----------
+    idxs: list(int)
+        Network indices of the modules of this host.
+    policy: str or dict
+        See `affinity_map`; dict keys are network indices.
+    connected: dict(tuple(int,int):float) or None
+        Connected module pairs by network indices.
+    topology: list(tuple(int,int,int)) or None
+        Default: `cpu_topology()`.
+
+    Returns
+    -------
+    cpus_of: dict(int:list(int))
+        Network index mapped to CPUs.
+    """
+
+    if topology is None:
+        topology = cpu_topology()
+
+    local = {idx: k for (k, idx) in enumerate(idxs)}
+    if isinstance(policy, dict):
+        policy = {local[idx]: cpus for (idx, cpus) in policy.items() if idx in local}
+    if connected:
+        connected = {(local[i], local[j]): w for ((i, j), w) in connected.items()
+                     if i in local and j in local}
+
+    cpus_of = affinity_map(policy, len(idxs), topology, connected)
+    return {idxs[k]: cpus for (k, cpus) in cpus_of.items()}
+
+def socket_of(cpus, topology):
+    """Sockets of a list of CPUs."""
+
+    sockets = {cpu: socket for (cpu, socket, _) in topology}
+    return sorted({sockets.get(cpu) for cpu in cpus if cpu in sockets})
+
+@contextlib.contextmanager
+def pinned(cpus):
+    """Run the block with this thread's CPU affinity set to `cpus`; processes started in
+    the block inherit it. No effect when `cpus` is None or the platform lacks affinity."""
+
+    if cpus is None or not hasattr(os, 'sched_setaffinity'):
+        yield
+        return
+
+    saved = os.sched_getaffinity(0)
+    os.sched_setaffinity(0, cpus)
+    try:
+        yield
+    finally:
+        os.sched_setaffinity(0, saved)
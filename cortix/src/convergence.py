@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of the Cortix toolkit environment
+# https://cortix.org
+"""Network-wide steady-state detection and early termination.
+
+With a convergence monitor (`Network.converge()`), modules report a residual norm once
+per exchange interval with `Module.report_residual()`, e.g.
+
+    while time <= self.end_time:
+        ...exchange messages and step...
+        if self.report_residual(relative_change(u_new, u_old)):
+            break # the whole network is at steady state
+
+Each report updates a slot of shared memory (the residual, the number of intervals
+and how many consecutive intervals were below the tolerance); no message goes through
+the ports. A thread of the root process reduces the slots of all monitored modules:
+when every module has been below the tolerance for `num_intervals` intervals, it sets
+a common stop interval just past the furthest module, and every module ends its loop
+when it reports that interval. Lock-step modules thus make the same number of
+exchanges and none is left waiting on a port. For the same reason, when only some
+modules are monitored, no other module may be connected to them.
+"""
+
+import threading
+import numpy as np
+
+class ResidualReporter:
+    """Module end of a convergence monitor; one shared memory slot."""
+
+    def __init__(self, idx, tolerance, lock, residuals, below, intervals, stop_at):
+        """Constructs a ResidualReporter object; use `ConvergenceMonitor.reporter()`."""
+
+        self.idx = idx
+        self.tolerance = tolerance
+        self.lock = lock
+        self.residuals = residuals
+        self.below = below
+        self.intervals = intervals
+        self.stop_at = stop_at
+
+    def report(self, residual):
+        """Record the residual of one more interval.
+
+        Returns
+        -------
+        stop: bool
+            True when the network decided to stop at this interval.
+        """
+
+        idx = self.idx
+        with self.lock:
+            self.intervals[idx] += 1
+            self.residuals[idx] = residual
+            self.below[idx] = self.below[idx] + 1 if residual <= self.tolerance else 0
+            stop_at = self.stop_at.value
+            return 0 <= stop_at <= self.intervals[idx]
+
+class ConvergenceMonitor:
+    """Root process end of a convergence monitor."""
+
+    def __init__(self, tolerance, num_intervals=3, modules=None, poll_interval=0.01):
+        """Constructs a ConvergenceMonitor object; use `Network.converge()` instead.
+
+        Parameters
+        ----------
+        tolerance: float
+            Residual at or below which a module is steady.
+        num_intervals: int
+            Consecutive intervals every monitored module must be steady.
+        modules: list(int) or None
+            Indices of the monitored modules. Default: all modules.
+        poll_interval: float
+            Seconds between reductions in the root process.
+
+        Attributes
+        ----------
+        stop_interval: int or None
+            Interval at which the modules stopped in the last run; None if steady
+            state was not reached.
+        residuals: list(float)
+            Last residual of each module in the last run.
+        intervals: list(int)
+            Intervals reported by each module in the last run.
+        """
+
+        assert tolerance >= 0.0, 'tolerance must be non-negative; got %r'%tolerance
+        assert num_intervals >= 1, 'num_intervals must be positive; got %r'%num_intervals
+
+        self.tolerance = float(tolerance)
+        self.num_intervals = num_intervals
+        self.modules = modules
+        self.poll_interval = poll_interval
+
+        self.stop_interval = None
+        self.residuals = list()
+        self.intervals = list()
+
+        self.__shared = None
+        self.__watched = None
+        self.__thread = None
+        self.__done = threading.Event()
+
+    def setup(self, ctx, num_modules, edges=()):
+        """Allocate the shared memory of a run.
+
+        Parameters
+        ----------
+        ctx: multiprocessing context
+            Context of the module processes.
+        num_modules: int
+        edges: iterable(tuple(int,int))
+            Connected module pairs. A module connected to a monitored module must be
+            monitored: it would wait on its port once the monitored modules stop.
+        """
+
+        lock = ctx.Lock()
+        residuals = ctx.Array('d', num_modules, lock=False)
+        below = ctx.Array('q', num_modules, lock=False)
+        intervals = ctx.Array('q', num_modules, lock=False)
+        stop_at = ctx.Value('q', -1, lock=False)
+        self.__shared = (lock, residuals, below, intervals, stop_at)
+
+        if self.modules is None:
+            self.__watched = list(range(num_modules))
+        else:
+            self.__watched = sorted(self.modules)
+            assert all(0 <= idx < num_modules for idx in self.__watched), \
+                'monitored module index out of range: %r'%self.modules
+
+        watched = set(self.__watched)
+        for (i, j) in edges:
+            assert (i in watched) == (j in watched), \
+                'module %r is connected to module %r; monitor both or neither'%(i, j)
+
+        self.stop_interval = None
+
+    def reporter(self, idx):
+        """Reporter of the module with index `idx`; None if it is not monitored."""
+
+        if idx not in self.__watched:
+            return None
+
+        return ResidualReporter(idx, self.tolerance, *self.__shared)
+
+    def start(self):
+        """Start reducing in a thread of the root process."""
+
+        self.__done.clear()
+        self.__thread = threading.Thread(target=self.__reduce, daemon=True,
+                                         name='cortix-convergence-monitor')
+        self.__thread.start()
+
+    def stop(self):
+        """Stop reducing and keep the final counters; call when the modules are done."""
+
+        if self.__thread is None:
+            return
+
+        self.__done.set()
+        self.__thread.join()
+        self.__thread = None
+
+        (lock, residuals, below, intervals, stop_at) = self.__shared
+        self.residuals = list(residuals)
+        self.intervals = list(intervals)
+        if stop_at.value >= 0:
+            self.stop_interval = stop_at.value
+        self.__shared = None
+
+    def __reduce(self):
+        """Set the stop interval once every monitored module is steady long enough."""
+
+        (lock, residuals, below, intervals, stop_at) = self.__shared
+        watched = np.array(self.__watched, dtype=int)
+        below_view = np.frombuffer(below, dtype=np.int64)
+        intervals_view = np.frombuffer(intervals, dtype=np.int64)
+
+        while not self.__done.wait(self.poll_interval):
+            with lock:
+                if below_view[watched].min() >= self.num_intervals:
+                    stop_at.value = int(intervals_view[watched].max()) + 1
+                    return
+
+def relative_change(new, old, floor=1.0e-30):
+    """Norm of the change of a state over an interval relative to its norm.
+
+    Parameters
+    ----------
+    new: float or numpy.ndarray
+    old: float or numpy.ndarray
+    floor: float
+        Smallest norm of `old` divided by, to avoid division by zero.
+
+    Returns
+    -------
+    residual: float
+    """
+
+    new = np.asarray(new, dtype=float)
+    old = np.asarray(old, dtype=float)
+
+    return float(np.linalg.norm(new - old) / max(np.linalg.norm(old), floor))
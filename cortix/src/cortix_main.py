@@ -7,6 +7,8 @@ import os
 import sys
 import shutil
 import logging
+import logging.handlers
+import multiprocessing as multiproc
 import time
 import datetime
 
@@ -25,7 +27,10 @@ class Cortix:
     """
 
     def __init__(self, use_mpi=False, splash=False, log_filename_stem='cortix',
-                 save_dir_name_stem='ctx-saved', loglevel_console='debug'):
+                 save_dir_name_stem='ctx-saved', loglevel_console='debug',
+                 loglevel_file='debug', use_sockets=False, address='127.0.0.1:0',
+                 num_workers=1, spawn_local_workers=True, hybrid=False, affinity=None,
+                 affinity_connected=False):
         """Construct a Cortix simulation object.
 
         Parameters
@@ -38,6 +43,31 @@ class Cortix:
             The log file will be named log_filename_stem+'.log'
         save_dir_name_stem: str
             The directory for saving pickled Cortix modules will be named '.'+'save_dir_name_stem'
+        loglevel_console: str
+            Logging level of the console output: 'debug', 'info', 'warn', 'error', 'critical'.
+        loglevel_file: str
+            Logging level of the log file output. Same options as `loglevel_console`.
+        use_sockets: bool
+            True to run modules on worker processes connected over TCP sockets; see
+            `cortix.src.worker`. Takes effect only when not using MPI.
+        address: str
+            'host:port' the root process listens on for workers. Port 0 picks a free port.
+            Use a reachable interface, e.g. '0.0.0.0:7711', for workers on other hosts.
+        num_workers: int
+            Number of socket transport workers the run waits for.
+        spawn_local_workers: bool
+            Start `num_workers` workers on this host; set to False when the workers are
+            started with `cortix-worker --connect host:port` on other hosts.
+        hybrid: bool
+            With MPI, connect ports of modules whose ranks share a node through shared
+            memory; ports between nodes stay on MPI.
+        affinity: str, dict or None
+            Pin each module process to CPUs (Linux): 'compact' fills the cores of a
+            socket before the next, 'scatter' spreads modules over the sockets, and a
+            dict maps module indices to CPU(s). The pinning is recorded in the log.
+            Default: None (processes are not pinned).
+        affinity_connected: bool
+            With 'compact' or 'scatter', keep connected modules on the same socket.
 
         Attributes
         ----------
@@ -47,6 +77,9 @@ class Cortix:
             `True` for MPI, `False` for Multiprocessing.
         use_multiprocessing: bool
             `False` for MPI, `True` for Multiprocessing.
+        use_sockets: bool
+            `True` for the TCP socket transport; module processes are then started by
+            the workers with Multiprocessing.
         splash: bool
             Show the Cortix splash image.
         comm: mpi4py.MPI.Intracomm
@@ -55,6 +88,12 @@ class Cortix:
             The current MPI rank (if using MPI else None).
         size: int
             size of the group associated with MPI.COMM_WORLD.
+        log_queue: multiprocessing.Queue
+            Queue through which module processes send their log records to the
+            listener in the root process (multiprocessing only, else None).
+        log_level: int
+            Lowest of the console and file logging levels. Module loggers are set to this
+            level so that records nobody will output are discarded before formatting.
 
         """
         self.use_mpi = use_mpi
@@ -65,15 +104,33 @@ class Cortix:
 
         self.splash = splash
 
+        self.hybrid = hybrid
+
+        assert affinity is None or affinity in ('compact', 'scatter') or \
+               isinstance(affinity, dict), "affinity must be 'compact', 'scatter' or a dict"
+        self.affinity = affinity
+        self.affinity_connected = affinity_connected
+
+        self.use_sockets = use_sockets
+        self.address = address
+        self.num_workers = num_workers
+        self.spawn_local_workers = spawn_local_workers
+
         self.__network = None
 
         self.log = None
         self.log_filename_stem = log_filename_stem
         self.logger_name = self.log_filename_stem
+        self.log_queue = None
+        self.log_listener = None
+        self.log_level = logging.DEBUG
 
         assert loglevel_console in ['debug', 'info', 'warn', 'error', 'critical']
         self.loglevel_console = loglevel_console
 
+        assert loglevel_file in ['debug', 'info', 'warn', 'error', 'critical']
+        self.loglevel_file = loglevel_file
+
         self.save_dir_name_stem = save_dir_name_stem
 
         # Fall back to multiprocessing if mpi4py is not available
@@ -86,6 +143,11 @@ class Cortix:
             except ImportError:
                 self.use_mpi = False
 
+        if self.use_mpi:
+            self.use_sockets = False
+        else:
+            self.hybrid = False
+
         # Setup the global logger
         self.__create_logger()
 
@@ -115,6 +177,15 @@ class Cortix:
         n.size = self.size
         n.comm = self.comm
         n.log  = self.log
+        n.log_queue = self.log_queue
+        n.log_level = self.log_level
+        n.hybrid = self.hybrid
+        n.affinity = self.affinity
+        n.affinity_connected = self.affinity_connected
+        n.use_sockets = self.use_sockets
+        n.address = self.address
+        n.num_workers = self.num_workers
+        n.spawn_local_workers = self.spawn_local_workers
         self.__network = n
     def __get_network(self):
         return self.__network
@@ -142,6 +213,9 @@ class Cortix:
         if self.use_mpi:
             self.comm.Barrier()
 
+        if self.__network is not None:
+            self.__network._Network__close()
+
         if self.rank == 0 or self.use_multiprocessing:
 
             if self.splash:
@@ -153,6 +227,12 @@ class Cortix:
 
             self.log.info('close()::Elapsed wall clock time [s]: '+
                           str(round(self.wall_clock_time_end-self.wall_clock_time_start, 2)))
+
+            # Drain the records still in the queue before closing the handlers
+            if self.log_listener is not None:
+                self.log_listener.stop()
+                self.log_listener = None
+
             logging.shutdown()
 
             #self.log = None # do not eliminate the logger in case user cortix continues to run afte closing
@@ -161,19 +241,27 @@ class Cortix:
         """A helper function to setup the logging facility.
 
         The Python logging module is used to create two handlers, namely one for stdout output and
-        another for file output. File output in multiprocessing has its challenges. The implementation
-        here is experimental. The main process creates the Python logging logger. The issue is how
-        to share the logger with the Cortix modules that run in a separate process. If using MPI, the
-        logger is not implemented and modules will not share the logger. If using Python Multiprocessing
-        the logger is passed to the child process.
+        another for file output. Only the root process owns these handlers. If using Python
+        Multiprocessing, the module processes log through a `logging.handlers.QueueHandler` into
+        `self.log_queue` and a single `logging.handlers.QueueListener` thread in the root process
+        writes the records out; hence there is no contention on the log file. If using MPI, rank 0
+        writes to the log file and every other rank writes to its own buffered file named
+        `log_filename_stem+'-rank<n>.log'`.
 
         Note: help(logging). Levels: 0 = NOTSET, 10 = DEBUG, 20 = INFO, 30 = WARNING,
               40 = ERROR, 50 = FATAL
 
-        Cortix sets level to DEBUG to stdout and file output, hence all messages at this level and above
-        will be printed to terminal and log file.
+        The logger level is set to the lowest of the console and file levels, therefore messages
+        below both levels are discarded by the logger before any formatting takes place.
         """
 
+        levels = {'debug': logging.DEBUG, 'info': logging.INFO, 'warn': logging.WARN,
+                  'error': logging.ERROR, 'critical': logging.CRITICAL}
+
+        console_level = levels[self.loglevel_console]
+        file_level = levels[self.loglevel_file]
+        self.log_level = min(console_level, file_level)
+
         # File removal
         if self.rank == 0 or self.use_multiprocessing:
             if os.path.isfile(self.log_filename_stem+'.log'):
@@ -184,42 +272,50 @@ class Cortix:
             self.comm.Barrier()
 
         self.log = logging.getLogger(self.logger_name)
-        self.log.setLevel(logging.DEBUG)
-
+        self.log.setLevel(self.log_level)
 
         # Create handlers
-        if not self.log.hasHandlers():
-            file_handler = logging.FileHandler(self.log_filename_stem+'.log')
-            file_handler.setLevel(logging.DEBUG)
+        if not self.log.handlers:
+            if self.use_mpi and self.rank != 0:
+                rank_file_handler = logging.FileHandler(self.log_filename_stem +
+                                                        '-rank{}.log'.format(self.rank), mode='w')
+                rank_file_handler.setLevel(file_level)
+                # Buffer the writes; flush on errors, when full, or on shutdown
+                file_handler = logging.handlers.MemoryHandler(1024, flushLevel=logging.ERROR,
+                                                              target=rank_file_handler)
+            else:
+                file_handler = logging.FileHandler(self.log_filename_stem+'.log')
+            file_handler.setLevel(file_level)
 
             console_handler = logging.StreamHandler()
-            console_handler.setLevel(logging.DEBUG)
+            console_handler.setLevel(console_level)
             console_handler.setStream(sys.stdout)
 
-            if self.loglevel_console == 'info':
-                console_handler.setLevel(logging.INFO)
-            elif self.loglevel_console == 'warn':
-                console_handler.setLevel(logging.WARN)
-            elif self.loglevel_console == 'error':
-                console_handler.setLevel(logging.ERROR)
-            elif self.loglevel_console == 'critical':
-                console_handler.setLevel(logging.CRITICAL)
-
             # Formatter added to handlers
             if self.use_mpi:
                 fs = '[rank:{}] %(asctime)s - %(name)s - %(levelname)s - %(message)s'.format(self.rank)
             else:
-                fs = "[{}] %(asctime)s - %(name)s - %(levelname)s - %(message)s".format(os.getpid())
+                fs = "[%(process)d] %(asctime)s - %(name)s - %(levelname)s - %(message)s"
 
             formatter = logging.Formatter(fs)
             file_handler.setFormatter(formatter)
+            if self.use_mpi and self.rank != 0:
+                rank_file_handler.setFormatter(formatter)
             console_handler.setFormatter(formatter)
 
             # Add handlers to logger; this creates a handlers list
             self.log.addHandler(file_handler)
             self.log.addHandler(console_handler)
         else:
-            self.log.warn('Cortix logger already exists; overriding...')
+            self.log.warning('Cortix logger already exists; overriding...')
+
+        # Module processes log into a queue serviced by the handlers of the root process
+        if self.use_multiprocessing:
+            # Spawn context: module processes are started with spawn (see Network)
+            self.log_queue = multiproc.get_context('spawn').Queue(-1)
+            self.log_listener = logging.handlers.QueueListener(self.log_queue, *self.log.handlers,
+                                                               respect_handler_level=True)
+            self.log_listener.start()
 
     def __get_splash(self, begin=None, end=None):
         '''Returns the Cortix splash logo.
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of the Cortix toolkit environment
+# https://cortix.org
+"""Discrete-event execution of a network.
+
+In lock-step mode every module loops over all time steps in its own process and
+exchanges messages at each step, even when it has nothing to do. In event-driven mode
+(`Network.event_driven`), modules instead register a handler per port
+(`Module.on()`) and are called only when a timestamped message arrives on the port
+(`Module.post()`), or when an event they scheduled for themselves is due
+(`Module.schedule()`). A single global event queue orders all events by time; events
+at the same time are handled in the order they were posted. Modules with no pending
+events are not called and consume no CPU.
+"""
+
+import heapq
+
+class EventQueue:
+    """Global time-ordered queue of the events of a network."""
+
+    def __init__(self, start_time=0.0, end_time=None):
+        """Constructs an EventQueue object.
+
+        Parameters
+        ----------
+        start_time: float
+            Time of the first events.
+        end_time: float or None
+            Events after this time are not handled. Default: None (run until the
+            queue is empty).
+
+        Attributes
+        ----------
+        now: float
+            Time of the event being handled.
+        num_events: int
+            Events handled.
+        """
+
+        self.now = float(start_time)
+        self.end_time = end_time
+        self.num_events = 0
+
+        self.__heap = list()
+        self.__seq = 0 # order of posting among events at the same time
+
+    def __len__(self):
+        return len(self.__heap)
+
+    def push(self, time, module, target, data):
+        """Queue an event.
+
+        Parameters
+        ----------
+        time: float
+            Must not be earlier than the current time.
+        module: Module
+            Module handling the event.
+        target: str or callable
+            Name of the port the message arrives on, or the handler of an event the
+            module scheduled for itself.
+        data: any
+        """
+
+        assert time >= self.now, \
+            'event at time %r is earlier than the current time %r'%(time, self.now)
+
+        heapq.heappush(self.__heap, (float(time), self.__seq, module, target, data))
+        self.__seq += 1
+
+    def run(self):
+        """Handle the events in time order until the queue is empty or `end_time`."""
+
+        while self.__heap:
+            if self.end_time is not None and self.__heap[0][0] > self.end_time:
+                break
+            (time, _, module, target, data) = heapq.heappop(self.__heap)
+            self.now = time
+            self.num_events += 1
+            module._handle_event(time, target, data)
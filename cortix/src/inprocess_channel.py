@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of the Cortix toolkit environment
+# https://cortix.org
+"""In-memory channels between the modules of a nested network.
+
+The modules of a nested network run in threads of their parent module process. An
+`InProcessChannel` connects two of their ports with a pair of thread-safe queues;
+messages are passed by reference (no pickling, no copy), so a module must not modify
+data after sending it. A `BoundaryChannel` makes a port of a nested module use a port
+of the parent module, which is connected to the outer network.
+"""
+
+import queue
+
+class InProcessChannel:
+    """One end of an in-memory duplex connection between two ports."""
+
+    def __init__(self, out_queue, in_queue):
+        """Constructs an InProcessChannel object; use `InProcessChannel.pair()` instead.
+
+        Parameters
+        ----------
+        out_queue: queue.SimpleQueue
+            Queue this end sends to.
+        in_queue: queue.SimpleQueue
+            Queue this end receives from.
+        """
+
+        self.out_queue = out_queue
+        self.in_queue = in_queue
+
+        self.__pending = list() # messages taken off the in queue by `poll`
+
+    @classmethod
+    def pair(cls):
+        """Create the two ends of a connection.
+
+        Returns
+        -------
+        (end_a, end_b): tuple(InProcessChannel, InProcessChannel)
+        """
+
+        a_to_b = queue.SimpleQueue()
+        b_to_a = queue.SimpleQueue()
+
+        return (cls(a_to_b, b_to_a), cls(b_to_a, a_to_b))
+
+    def send(self, data):
+        """Send a reference to `data`."""
+
+        self.out_queue.put(data)
+
+    def recv(self):
+        """Receive the next message; blocks until one is available."""
+
+        if self.__pending:
+            return self.__pending.pop(0)
+        return self.in_queue.get()
+
+    def poll(self, timeout=0.0):
+        """Return True if data is available to be received within `timeout` seconds."""
+
+        if self.__pending:
+            return True
+        try:
+            self.__pending.append(self.in_queue.get(timeout=timeout))
+        except queue.Empty:
+            return False
+        return True
+
+    def flush(self):
+        """Messages are queued when sent; nothing to flush."""
+
+        return
+
+    def close(self):
+        """Nothing to release."""
+
+        return
+
+class BoundaryChannel:
+    """Channel of a nested module port that stands for a port of the parent module."""
+
+    def __init__(self, port):
+        """Constructs a BoundaryChannel object.
+
+        Parameters
+        ----------
+        port: Port
+            Port of the parent module, connected to the outer network.
+        """
+
+        self.port = port
+
+    def send(self, data):
+        """Send `data` through the parent module port."""
+
+        self.port.send(data)
+
+    def recv(self):
+        """Receive from the parent module port."""
+
+        return self.port.recv()
+
+    def flush(self):
+        """Flush the parent module port."""
+
+        if self.port.channel is not None:
+            self.port.channel.flush()
+
+    def close(self):
+        """The parent module port is released by its own network."""
+
+        return
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of the Cortix toolkit environment
+# https://cortix.org
+"""Lag-one (pipelined) coupling of two ports.
+
+In lock-step coupling a module sends its values of step n, waits for the values of
+its neighbour at step n, then computes; communication and computation never overlap.
+On a connection made with `Network.connect(..., lag=1)`, the step n exchange is in
+flight while the modules compute with the values of step n-1:
+
+    recv #0     waits for the first message (the exchange starts synchronized).
+    recv #n     returns message n-1 at once; message n is being received in the
+                background into the second of two receive slots.
+    send        hands the message to a background sender and returns; it waits only
+                when two messages are already pending.
+
+Per-connection messages keep their order. After a lagged loop, `Port.sync()` returns
+the message still in flight (the newest one) and switches the port back to lock-step
+receives, so the modules can exchange more messages in order (e.g. end markers).
+
+The background receiver reads a message only when one is asked for (at most one
+ahead of the module), so it never takes messages the module will not receive.
+`Port.close()` stops the transfer threads when the module run ends; a message still
+in flight then (no `sync()` after the loop) is received and dropped.
+"""
+
+import queue
+import threading
+
+class _Failure:
+    """Exception raised in a transfer thread, re-raised in the module thread."""
+
+    def __init__(self, error):
+        self.error = error
+
+_stop = object() # transfer thread sentinel
+
+class LagBuffer:
+    """Double-buffered, non-blocking transfers of one lagged port."""
+
+    def __init__(self, send, recv):
+        """Constructs a LagBuffer object; created by the port on first use.
+
+        Parameters
+        ----------
+        send: callable
+            Blocking send of the port transport.
+        recv: callable
+            Blocking receive of the port transport.
+        """
+
+        self.__send = send
+        self.__recv = recv
+
+        self.__outbox = queue.Queue(maxsize=2)
+        self.__requests = queue.Queue() # receives asked of the receiver thread
+        self.__inbox = queue.Queue()
+        self.__num_pending = 0          # receives asked and not yet taken
+        self.__sender = None
+        self.__receiver = None
+        self.__send_error = None
+        self.__recv_error = None
+
+        self.__num_recv = 0
+        self.__last = None
+        self.__synced = False
+
+    def send(self, data):
+        """Queue `data` for the background sender."""
+
+        if self.__send_error is not None:
+            raise self.__send_error
+
+        if self.__sender is None:
+            self.__sender = threading.Thread(target=self.__send_loop, daemon=True,
+                                             name='cortix-lag-sender')
+            self.__sender.start()
+
+        self.__outbox.put(data)
+
+    def recv(self):
+        """Message of the previous exchange (the first message on the first call)."""
+
+        if self.__synced:
+            return self.__get()
+
+        if self.__num_recv != 1:
+            self.__last = self.__get()
+            self.__request() # the next message is received in the background
+        self.__num_recv += 1
+
+        return self.__last
+
+    def sync(self):
+        """Newest message of the exchange; later receives are in lock-step order."""
+
+        if self.__synced:
+            return self.__get()
+
+        if self.__num_recv != 1:
+            self.__last = self.__get()
+        self.__synced = True
+
+        return self.__last
+
+    def flush(self):
+        """Wait until the queued messages are handed to the transport."""
+
+        if self.__sender is not None:
+            self.__outbox.put(_stop)
+            self.__sender.join()
+            self.__sender = None
+
+        if self.__send_error is not None:
+            raise self.__send_error
+
+    def close(self):
+        """Flush the sends and stop the transfer threads.
+
+        A receive still pending (a message in flight without `sync()`) ends the
+        receiver thread once the message arrives; the message is dropped.
+        """
+
+        self.flush()
+
+        if self.__receiver is not None:
+            self.__requests.put(_stop)
+            if self.__num_pending == 0:
+                self.__receiver.join()
+            self.__receiver = None
+
+    def __request(self):
+        """Ask the receiver thread for the next message."""
+
+        if self.__recv_error is not None:
+            return
+
+        if self.__receiver is None:
+            self.__receiver = threading.Thread(target=self.__recv_loop, daemon=True,
+                                               name='cortix-lag-receiver')
+            self.__receiver.start()
+
+        self.__requests.put(True)
+        self.__num_pending += 1
+
+    def __get(self):
+        if self.__recv_error is not None:
+            raise self.__recv_error
+
+        if self.__num_pending == 0:
+            self.__request()
+
+        data = self.__inbox.get()
+        self.__num_pending -= 1
+        if isinstance(data, _Failure):
+            self.__recv_error = data.error
+            raise data.error
+
+        return data
+
+    def __send_loop(self):
+        while True:
+            data = self.__outbox.get()
+            if data is _stop:
+                return
+            if self.__send_error is not None:
+                continue # keep taking messages so that senders do not block
+            try:
+                self.__send(data)
+            except Exception as error:
+                self.__send_error = error
+
+    def __recv_loop(self):
+        while self.__requests.get() is not _stop:
+            try:
+                data = self.__recv()
+            except Exception as error:
+                self.__inbox.put(_Failure(error))
+                return
+            self.__inbox.put(data)
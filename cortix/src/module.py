@@ -6,8 +6,10 @@
 import os
 import sys
 import logging
+import logging.handlers
 import pickle
 from cortix.src.port import Port
+from cortix.src.queue_channel import QueueChannel
 
 class Module:
     """Cortix module super class.
@@ -58,9 +60,35 @@ class Module:
             Default: None.
         log: A Python logging logger object created at the moment a module is added to
              a network.
-        __network: Network
-            An internal network inherited by the derived module for nested networks.
-            Future work.
+        log_queue: multiprocessing.Queue, None
+            Queue of the root process log listener; set by the network when launching
+            the module in multiprocessing mode. Default: None.
+        log_level: int
+            Level of the module logger; records below it are discarded before formatting.
+            Default: `logging.DEBUG`.
+        port_stats: dict(str:dict)
+            Counters of the bounded queues of ports in the last run (time blocked on full
+            queues, messages dropped or coalesced), by port name.
+        port_traffic: dict(str:int)
+            Messages sent through each port in the last run, by port name; recorded
+            when the module is saved.
+        network: Network
+            A nested network of modules run in-process by this module (see `run()`
+            and `boundary_port()`). Default: None.
+        stream_sink: StreamSink, None
+            Set by the network when streaming is enabled (see `stream_phase()`).
+            Default: None.
+        num_events: int
+            Events handled in the last event-driven run (see `on()`).
+        convergence: ResidualReporter, None
+            Set by the network when it monitors convergence (see `report_residual()`).
+            Default: None.
+        recorder: PortRecorder, None
+            Set by the network when the module is recorded (see `Network.record()`).
+            Default: None.
+        steady_state_interval: int, None
+            Interval at which the module stopped at network steady state in the last
+            run; None if it ran to its end.
        """
 
         self.name = self.__class__.__name__
@@ -69,12 +97,29 @@ class Module:
         self.use_mpi = False
         self.use_multiprocessing = True
         self.ports = list()
+        self.__ports_by_name = dict() # index of ports
+        self.__ports_list = self.ports
+        self.__ports_len = 0
         self.log = None
+        self.log_queue = None
+        self.log_level = logging.DEBUG
+        self.port_stats = dict()
+        self.port_traffic = dict()
         self.save = False
+        self.stream_sink = None
+        self.__streamed = dict() # phase name: [phase, number of rows streamed]
+        self.convergence = None
+        self.recorder = None
+        self.steady_state_interval = None
+        self.num_events = 0
+        self.__handlers = dict() # port name: handler of messages in event-driven runs
+        self.__events = None     # event queue of an event-driven run
+        self.__peers = None      # id(port): module owning the port, in that run
 
         self.id = None
 
         self.__network = None
+        self.__boundary_ports = dict() # port name: (nested module id, nested port name)
 
     def send(self, data, port):
         '''Send data through a given port.
@@ -86,12 +131,19 @@ class Module:
         port: Port, str
             A Port object to send the data through, or its string name
 
+        Note
+        ----
+        In an event-driven run, this posts the data at the current time (see `post()`).
         '''
 
+        if self.__events is not None:
+            self.post(data, port)
+            return
+
         if isinstance(port, str):
             port = self.get_port(port)
         elif isinstance(port, Port):
-            assert port in self.ports, "Unknown port!"
+            assert port.name in self.__port_index(), "Unknown port!"
         else:
             raise TypeError("port must be of Port or String type")
 
@@ -114,16 +166,56 @@ class Module:
         data: any
             The data received through the port
 
+        Note
+        ----
+        In an event-driven run, messages are handled by the handlers of the ports
+        (see `on()`); calling `recv()` raises a RuntimeError.
+
         '''
 
         if isinstance(port, str):
             port = self.get_port(port)
         elif isinstance(port, Port):
-            assert port in self.ports, 'Unknown port!'
+            assert port.name in self.__port_index(), 'Unknown port!'
         else:
             raise TypeError('port must be of Port or String type')
 
-        return port.recv()
+        if self.__events is not None:
+            # Sends are posted as events: nothing would ever arrive
+            raise RuntimeError('module {}: recv() on port {} in an event-driven run; '
+                               'handle its messages with on()'.format(self.name, port.name))
+
+        data = port.recv()
+        if self.recorder is not None:
+            self.recorder.record(port.name, data)
+
+        return data
+
+    def sync(self, port):
+        '''End a lagged exchange on a port: receive the message still in flight.
+
+        See `Network.connect()` (`lag`); a port without lag has none (returns None).
+
+        Parameters
+        ----------
+        port: Port, str
+            A Port object, or its string name
+
+        Returns
+        -------
+        data: any
+        '''
+
+        if isinstance(port, str):
+            port = self.get_port(port)
+        elif not isinstance(port, Port):
+            raise TypeError('port must be of Port or String type')
+
+        data = port.sync()
+        if self.recorder is not None and port.lag:
+            self.recorder.record(port.name, data)
+
+        return data
 
     def get_port(self, name):
         '''Get port by name; if it does not exist, create one.
@@ -141,12 +233,8 @@ class Module:
         '''
 
         assert isinstance(name, str), 'port name must be of type str'
-        port = None
 
-        for pti in self.ports:
-            if pti.name == name:
-                port = pti
-                break
+        port = self.__port_index().get(name)
 
         if port is None:
             if self.port_names_expected:
@@ -155,20 +243,209 @@ class Module:
                                                                     self.name, self.port_names_expected)
             port = Port(name, self.use_mpi)
             self.ports.append(port)
+            self.__ports_by_name[name] = port
+            self.__ports_len = len(self.ports)
 
         return port
 
+    def __port_index(self):
+        """Port name index of `self.ports`; rebuilt when the list was replaced or changed."""
+
+        if self.__ports_list is not self.ports or \
+           self.__ports_len != len(self.ports):
+            self.__ports_by_name = dict()
+            for port in reversed(self.ports): # first port of a name wins, as in a scan
+                self.__ports_by_name[port.name] = port
+            self.__ports_list = self.ports
+            self.__ports_len = len(self.ports)
+
+        return self.__ports_by_name
+
+    def __getstate__(self):
+        """Pickle without the port name index; it is rebuilt on first use."""
+
+        state = self.__dict__.copy()
+        state['_Module__ports_by_name'] = dict()
+        state['_Module__ports_list'] = None
+        state['_Module__events'] = None
+        state['_Module__peers'] = None
+        return state
+
+    def on(self, port, handler):
+        '''Handle the messages arriving on a port in event-driven runs.
+
+        The network calls `handler(time, data)` for every message posted to the port,
+        in time order over the whole network (see `cortix.src.event_queue`).
+
+        Parameters
+        ----------
+        port: Port, str
+            The port, or its name.
+        handler: callable
+        '''
+
+        if isinstance(port, Port):
+            port = port.name
+        assert isinstance(port, str), 'port must be of Port or String type'
+        assert callable(handler), 'handler must be callable'
+
+        self.__handlers[port] = handler
+
+    def on_start(self, time):
+        '''Called once when an event-driven run starts, before any event is handled.
+
+        Override to post or schedule the first events. Default: nothing.
+
+        Parameters
+        ----------
+        time: float
+            Start time of the run.
+        '''
+
+        return
+
+    def on_end(self, time):
+        '''Called once when an event-driven run ends. Default: nothing.
+
+        Parameters
+        ----------
+        time: float
+            Time of the last event handled.
+        '''
+
+        return
+
+    def post(self, data, port, time=None):
+        '''Send a timestamped message.
+
+        In an event-driven run the message is handled by the connected module at
+        `time`; otherwise `(time, data)` is sent through the port.
+
+        Parameters
+        ----------
+        data: any
+        port: Port, str
+            A Port object to send the data through, or its string name
+        time: float
+            Default: the time of the event being handled.
+        '''
+
+        if isinstance(port, str):
+            port = self.get_port(port)
+        elif not isinstance(port, Port):
+            raise TypeError('port must be of Port or String type')
+
+        if self.__events is None:
+            port.send((time, data))
+            return
+
+        if time is None:
+            time = self.__events.now
+        peer = port.connected_port
+        assert peer is not None, 'port %r of %r is not connected'%(port.name, self.name)
+        port.num_sent += 1
+
+        self.__events.push(time, self.__peers[id(peer)], peer.name, data)
+
+    def schedule(self, time, handler, data=None):
+        '''Call `handler(time, data)` of this module at `time` in an event-driven run.
+
+        Parameters
+        ----------
+        time: float
+        handler: callable
+        data: any
+        '''
+
+        assert self.__events is not None, 'events are scheduled in event-driven runs only'
+        assert callable(handler), 'handler must be callable'
+
+        self.__events.push(time, self, handler, data)
+
+    def _handle_event(self, time, target, data):
+        """Call the handler of an event; called by `cortix.src.event_queue.EventQueue`.
+
+        Parameters
+        ----------
+        time: float
+            Time of the event.
+        target: str or callable
+            Name of the port the message arrived on (its handler is set with `on()`),
+            or the handler of an event the module scheduled with `schedule()`.
+        data: any
+            The message, or the data of the scheduled event.
+        """
+
+        self.num_events += 1
+
+        if callable(target):
+            target(time, data)
+            return
+
+        handler = self.__handlers.get(target)
+        if handler is None:
+            raise RuntimeError('module {} has no handler for port {} (time {})'.format(
+                self.name, target, time))
+        handler(time, data)
+
+    def __attach_events(self, events, peers):
+        """Route sends through `events` (None to detach); `peers` maps `id(port)` to the
+        module owning the port."""
+
+        self.__events = events
+        self.__peers = peers
+        if events is not None:
+            self.num_events = 0
+
     def __set_network(self, n):
         # Must import be here to avoid infinite import loop
         from cortix.src.network import Network
         assert isinstance(n, Network)
-        n.use_mpi = self.use_mpi
-        n.use_multiprocessing = self.use_multiprocessing
+        # Nested networks run in-process; their ports never use MPI
+        n.use_mpi = False
+        n.use_multiprocessing = False
         self.__network = n
     def __get_network(self):
         return self.__network
     network = property(__get_network, __set_network, None, None)
 
+    def boundary_port(self, module, port, name=None):
+        '''Make a port of a nested network module talk to the outer network.
+
+        The returned port of this module is connected in the outer network as usual;
+        when the nested network runs, data sent or received through the nested module
+        port goes through it.
+
+        Parameters
+        ----------
+        module: Module
+            A module of the nested network `self.network`.
+        port: Port, str
+            The port of `module`, or its name.
+        name: str
+            Name of the port of this module. Default: the name of `port`.
+
+        Returns
+        -------
+        port: Port
+            The port of this module.
+        '''
+
+        assert self.__network is not None, 'set a nested network before boundary ports'
+        assert module in self.__network.modules, 'module %r not in the nested network'%module.name
+
+        if isinstance(port, Port):
+            port = port.name
+        assert isinstance(port, str), 'port must be of Port or String type'
+        module.get_port(port)
+
+        if name is None:
+            name = port
+        assert name not in self.__boundary_ports, 'boundary port %r already exists'%name
+        self.__boundary_ports[name] = (module.id, port)
+
+        return self.get_port(name)
+
     def run(self, *args):
         '''Module run function
 
@@ -200,7 +477,9 @@ class Module:
 
         Warning
         -------
-        This function must be overridden by all Cortix modules
+        This function must be overridden by all Cortix modules, except modules that
+        only run a nested network: by default, a module with a `network` runs its
+        modules in threads of this process (see `run_network()`).
 
         **This is not current: revise in the future**
         Parameters
@@ -215,12 +494,57 @@ class Module:
             method before `return`. In addition, self.state must be `pickle-able`.
 
         '''
+
+        if self.__network is not None:
+            self.run_network()
+            return
+
         raise NotImplementedError('Module must implement run()')
 
+    def run_network(self):
+        '''Run the nested network in threads of this process until all its modules finish.
+
+        Nested modules exchange data through in-memory ports (by reference); nested ports
+        made boundary ports with `boundary_port()` go through the ports of this module.
+        '''
+
+        assert self.__network is not None, 'module %r has no nested network'%self.name
+
+        boundary = list()
+        for (name, (idx, port_name)) in self.__boundary_ports.items():
+            boundary.append((self.__network.modules[idx].get_port(port_name),
+                             self.get_port(name)))
+
+        self.__network._Network__run_in_process(self.log, boundary)
+
     def run_and_save(self, *args):
 
+        # Route module logging to the root process listener (multiprocessing only)
+        if self.log_queue is not None:
+            self.rebuild_logger(args[0].name)
+
+        if self.recorder is not None:
+            self.recorder.start(self)
+
         self.run(args)
 
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+        self.flush_streams()
+        self.convergence = None # shared memory can only be pickled when spawning
+
+        # Deliver the messages lagged ports still hold and stop their threads
+        for port in self.ports:
+            port.close()
+
+        # Release bounded queues and keep their counters
+        for port in self.ports:
+            if isinstance(port.channel, QueueChannel):
+                self.port_stats[port.name] = port.channel.stats()
+                port.channel.close()
+
         if self.save:
             #file_name = os.path.join('.ctx-saved', '{}_'.format(self.__class__.__name__))
             save_dir_name = args[1]
@@ -233,9 +557,11 @@ class Module:
                 file_name += str(os.getpid())
             file_name += '.pkl'
 
+            self.port_traffic = {port.name: port.num_sent for port in self.ports}
             self.ports = list() # reset ports since they can't be pickled
 
             self.log = None # no harm in closing the logger after a run is finished
+            self.log_queue = None # queues can only be pickled when spawning a process
 
             try:
                 with open(file_name, 'wb') as fout:
@@ -243,16 +569,127 @@ class Module:
             except pickle.PicklingError:
                 print('Unable to pickle {}!'.format(file_name))
 
+    def stream_phase(self, phase, name=None, flush=False):
+        '''Stream the rows added to a phase history since the last call to the root process.
+
+        Call it as the phase advances, e.g. after the values of each time step are set;
+        rows are sent once at least `batch_size` of them accumulate (see
+        `Network.stream()`), and the rest when the module finishes. Does nothing when
+        streaming is not enabled. Of a phase bounded with `PhaseNew.retain()`, each
+        row is sent once: a last row that may still be replaced or combined waits
+        until it is final, and rows dropped before they were sent are skipped.
+
+        Parameters
+        ----------
+        phase: PhaseNew
+            Or any object with a `df` property holding its history indexed by time.
+        name: str
+            Name of the stream. Default: `phase.name`.
+        flush: bool
+            Send the new rows now, however few.
+        '''
+
+        if self.stream_sink is None:
+            return
+
+        self.__stream(phase, name, flush, final=True)
+
+    def __stream(self, phase, name, flush, final):
+        """Send the new rows of a phase; see `stream_phase()`.
+
+        With `final`, a last row that the retention policy of the phase may still
+        change is held back.
+        """
+
+        if name is None:
+            name = phase.name
+        entry = self.__streamed.setdefault(name, [phase, 0])
+        entry[0] = phase
+
+        from cortix.src.phase_stream import new_rows, history_size
+
+        size = history_size(phase, final)
+        num_new = size - entry[1]
+        if num_new <= 0 or (num_new < self.stream_sink.batch_size and not flush):
+            return
+
+        rows = new_rows(phase, entry[1], size)
+        entry[1] = size
+        if len(rows): # rows dropped by retention are not sent
+            self.stream_sink.put((self.name, name, rows))
+
+    def report_residual(self, residual):
+        '''Report the residual norm of this module for one exchange interval.
+
+        Call once per interval, after the exchange (see `cortix.src.convergence`).
+
+        Parameters
+        ----------
+        residual: float
+            E.g. the relative change of the module state over the interval.
+
+        Returns
+        -------
+        stop: bool
+            True when every monitored module has been steady long enough; the module
+            should end its time loop now (all modules stop at the same interval).
+            Always False when the network does not monitor convergence.
+        '''
+
+        if self.convergence is None:
+            return False
+
+        stop = self.convergence.report(residual)
+        if stop:
+            self.steady_state_interval = self.convergence.intervals[self.convergence.idx]
+            if self.log is not None:
+                self.log.info('Module {} at network steady state; stopping at interval '
+                              '{}'.format(self.name, self.steady_state_interval))
+        return stop
+
+    def flush_streams(self):
+        '''Send the remaining rows of all streamed phases and close the stream.
+
+        Called when the module finishes running.
+        '''
+
+        if self.stream_sink is None:
+            return
+
+        for (name, (phase, _)) in list(self.__streamed.items()):
+            self.__stream(phase, name, flush=True, final=False) # the phase is done
+
+        self.stream_sink.close()
+        self.stream_sink = None
+        self.__streamed = dict()
+
     def rebuild_logger(self, logger_name):
         """Rebuild the logger in multiprocessing mode.
 
         In multiprocessing mode the Process() method will start a child process with only limited amounts
         of data inherited from the Module usertype. Specifically the logger will lose information. This
-        function will rebuild the data on the child process and attempt to use logging in parallel both on
-        the console and permanent storage. This is experimental. Parallel file writing is challenging.
+        function will rebuild the logger on the child process. If the network provided a log queue,
+        records are put in the queue and written out by a single listener in the root process; the
+        logger level is set so that records below the configured level are discarded before any
+        formatting takes place. Calling this method again has no side effect. Without a queue, a
+        logger that already has handlers (e.g. MPI rank set up by `Cortix`) is left alone; otherwise
+        each process opens its own console and file handlers (legacy; parallel file writing is
+        challenging).
         """
         self.log = logging.getLogger(logger_name)
-        self.log.setLevel(logging.DEBUG)
+
+        if self.log_queue is not None:
+            for handler in list(self.log.handlers):
+                self.log.removeHandler(handler)
+            self.log.setLevel(self.log_level)
+            self.log.addHandler(logging.handlers.QueueHandler(self.log_queue))
+            self.log.propagate = False
+            return
+
+        if self.log.handlers:
+            return
+
+        self.log.setLevel(self.log_level)
 
         file_handler = logging.FileHandler(logger_name+'.log')
         file_handler.setLevel(logging.DEBUG)
@@ -262,7 +699,9 @@ class Module:
         console_handler.setStream(sys.stdout)
 
         if self.use_mpi:
-            fs = '[rank:{}] %(asctime)s - %(name)s - %(levelname)s - %(message)s'.format(self.rank)
+            from mpi4py import MPI
+            fs = '[rank:{}] %(asctime)s - %(name)s - %(levelname)s - %(message)s'.format(
+                MPI.COMM_WORLD.rank)
         else:
             fs = "[{}] %(asctime)s - %(name)s - %(levelname)s - %(message)s".format(os.getpid())
 
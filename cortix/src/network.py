@@ -11,6 +11,8 @@ import multiprocessing as multiproc
 
 from cortix.src.module import Module
 from cortix.src.port import Port
+from cortix.src.queue_channel import QueueChannel
+from cortix.src.affinity import cpu_topology, host_affinity_map, socket_of, pinned
 
 class Network:
     """Cortix network.
@@ -34,30 +36,115 @@ class Network:
               root process. This can generate an `out of memory` condition. This variable
               sets the maximum number of processes for which the data will be copied.
               Default is 1000.
+          hybrid: bool
+              When using MPI, route the ports of modules whose ranks share a node
+              through shared memory; ports across nodes stay on MPI. Default: False.
+          shm_ring_capacity: int
+              Size in bytes of each shared memory ring (one per port direction).
+              Default: 1 MB.
+          placement: dict(int:int) or None
+              When using the socket transport, maps the index of a module in `modules`
+              to the index of the worker it runs on; under MPI, to the rank it runs on.
+              Default: None (round-robin; under MPI, rank = index + 1).
+          auto_placement: bool
+              Place modules with the topology-aware placement engine when launching:
+              onto socket transport workers grouped by host, or onto MPI ranks grouped
+              by node. Ignored when `placement` is set. Default: False.
+          placement_file: str or None
+              JSON file with a placement report. If it exists, its placement is pinned
+              for the run; otherwise the computed placement is written to it.
+          edge_volumes: dict(tuple(int,int):float)
+              Declared message volume of connections (see `connect`).
+          measured_volumes: dict(tuple(int,int):float)
+              Messages sent through connections in the last run of saved modules.
+          module_loads: dict(int:float)
+              Relative compute load of modules by index; default load is 1.
+          socket_batch_size: int
+              Number of messages a port accumulates before writing to its TCP stream
+              when using the socket transport. Default: 1 (no batching).
+          affinity: str, dict or None
+              Pin module processes to CPUs: 'compact', 'scatter', or a dict of module
+              index to CPU(s); see `cortix.src.affinity`. Default: None (not pinned).
+          affinity_connected: bool
+              With 'compact' or 'scatter', keep connected modules on the same socket.
+          event_driven: bool
+              Run the modules as discrete-event handlers ordered by a global event queue
+              in this process instead of lock-step processes; see `Module.on()` and
+              `cortix.src.event_queue`. Default: False.
+          event_start_time: float
+              Start time of event-driven runs. Default: 0.0.
+          event_end_time: float or None
+              Events after this time are not handled. Default: None (run until no
+              event is left).
+          record_path: str or None
+              Directory of the port message recordings of the modules selected with
+              `record()`. Default: None (no recording).
+          convergence_monitor: ConvergenceMonitor or None
+              Steady-state detection of the last `converge()` call. Default: None.
+          stream_collector: StreamCollector or None
+              Root process view of the Phase rows streamed by the modules during a run;
+              see `stream()`. Default: None (no streaming).
        """
 
         self.id = Network.num_networks
 
         self.name = 'network-'+str(self.id)
         self.log = None
+        self.log_queue = None
+        self.log_level = None
 
         self.max_n_modules_for_data_copy_on_root = 1000
 
         self.modules = list()
+        self.__module_index = dict() # id(module): position in modules
 
         self.gv_edges = list()
+        self.__gv_edges_seen = set()   # index of gv_edges
+        self.__gv_edges_list = self.gv_edges
+        self.__gv_edges_len = 0
         self.gv_info = 'undirectional'
 
         self.use_mpi = None
         self.use_multiprocessing = None
         self.is_multiproc_start_method_set = False
 
+        self.hybrid = False
+        self.shm_ring_capacity = 1024*1024
+
+        self.use_sockets = False
+        self.address = None
+        self.num_workers = None
+        self.spawn_local_workers = False
+        self.affinity = None
+        self.affinity_connected = False
+        self.placement = None
+        self.auto_placement = False
+        self.placement_file = None
+        self.placement_report = None
+        self.edge_volumes = dict()
+        self.measured_volumes = dict()
+        self.module_loads = dict()
+        self.__edge_ports = dict()
+        self.__bounded_ports = dict()
+        self.__module_of_rank = dict()
+        self.socket_batch_size = 1
+        self.__worker_pool = None
+
         self.rank = None
         self.size = None
         self.comm = None
 
         self.save = False # save all network modules
 
+        self.stream_collector = None
+        self.convergence_monitor = None
+        self.record_path = None
+        self.__recorded = list() # indices of recorded modules
+
+        self.event_driven = False
+        self.event_start_time = 0.0
+        self.event_end_time = None
+
         Network.num_networks += 1
 
     def module(self, m):
@@ -66,22 +153,74 @@ class Network:
 
         assert isinstance(m, Module), 'm must be a module'
 
-        if m not in self.modules:
+        if self.__index(m, trust_misses=True) is None:
             m.use_mpi = self.use_mpi
             m.use_multiprocessing = self.use_multiprocessing
             self.modules.append(m)
             m.id = len(self.modules)-1  # see module doc for module id
+            self.__module_index[id(m)] = m.id
             if not m.name:
              m.name = m.__class__.__name__
             m.log = self.log
 
+    def __index(self, m, trust_misses=False):
+        """Position of module `m` in `self.modules`, or None; constant time.
+
+        A module not found is searched again in a fresh index (the list may have been
+        changed outside of `module()`) unless `trust_misses` and the index size matches.
+        """
+
+        idx = self.__module_index.get(id(m))
+        if idx is not None and idx < len(self.modules) and self.modules[idx] is m:
+            return idx
+        if idx is None and trust_misses and len(self.__module_index) == len(self.modules):
+            return None
+
+        # The list was changed outside of `module()`; re-index it
+        self.__module_index = {id(mod): i for (i, mod) in enumerate(self.modules)}
+        return self.__module_index.get(id(m))
+
+    def build(self, spec, use_cache=True):
+        """Add the modules and connections of a declarative network spec.
+
+        Parameters
+        ----------
+        spec: dict or str
+            Spec, or the name of a JSON or YAML file holding it; see
+            `cortix.src.network_spec` for the format.
+        use_cache: bool
+            Reuse the compiled form of a spec built before. Default: True.
+
+        Returns
+        -------
+        modules: dict(str:Module)
+            The modules created, by name.
+        """
+
+        from cortix.src.network_spec import compile_spec, instantiate
+
+        compiled = compile_spec(spec, use_cache=use_cache)
+        modules = instantiate(compiled)
+
+        for mod in modules:
+            self.module(mod)
+
+        for (idx_a, port_a, idx_b, port_b, options) in compiled.connections:
+            if port_a is None:
+                self.connect(modules[idx_a], modules[idx_b], **options)
+            else:
+                self.connect([modules[idx_a], port_a], [modules[idx_b], port_b], **options)
+
+        return {mod.name: mod for mod in modules}
+
     def add_module(self, m):
         """Alternative name to `module()`.
         """
 
         self.module(m)
 
-    def connect(self, module_port_a, module_port_b, info=None):
+    def connect(self, module_port_a, module_port_b, info=None, volume=None, depth=None,
+                policy='block', lag=0):
         """Connect two modules using either their ports directly or inferred ports.
 
         A connection always opens a channel for data communication in both ways.
@@ -114,8 +253,36 @@ class Network:
             if set to 'undirectional' will create a plain edge lines. If set to 'directional' will
             create edges with the arrow pointing in one direction dictated by the edge ordering.
             If left as the default, None, a undirected edge will be drawn which means bidirectionality.
+
+        volume: float
+            Expected message volume through this connection (any consistent unit, e.g.
+            messages per run). Used to weigh the connection for automatic placement.
+            Default: None, the volume measured in a previous run or 1.
+
+        depth: int
+            Maximum number of messages queued in each direction of the connection. When
+            set, the ports exchange messages through bounded queues instead of a pipe
+            (multiprocessing only). Default: None, a pipe.
+
+        policy: str
+            What a send does when the queue holds `depth` messages: 'block' until the
+            receiver takes one, 'drop-oldest' queued message, or 'coalesce-latest' (drop
+            all queued messages). See `cortix.src.queue_channel`. Default: 'block'.
+
+        lag: int
+            1 for lag-one (pipelined) coupling: each receive returns the message of the
+            previous exchange while the current one is in flight, overlapping
+            communication with computation (see `cortix.src.lag_buffer`). Only for
+            couplings that tolerate the explicit lag. Default: 0, lock-step.
         """
 
+        assert lag in (0, 1), 'lag must be 0 or 1; got %r'%lag
+
+        if depth is not None:
+            assert isinstance(depth, int) and depth >= 1, 'depth must be a positive int'
+            assert policy in QueueChannel.policies, \
+                'policy must be one of %r; got %r'%(QueueChannel.policies, policy)
+
         if info:
             assert isinstance(info, str)
             assert info in ['undirectional', 'directional', 'bidirectional']
@@ -128,25 +295,28 @@ class Network:
 
             assert module_a.name and module_b.name  # sanity check
 
-            assert module_a in self.modules, 'module %r not in network.'%module_a.name
-            assert module_b in self.modules, 'module %r not in network.'%module_b.name
+            idx_a = self.__index(module_a)
+            idx_b = self.__index(module_b)
+            assert idx_a is not None, 'module %r not in network.'%module_a.name
+            assert idx_b is not None, 'module %r not in network.'%module_b.name
 
             # Connect ports
             port_a = module_a.get_port(module_b.name.lower())
             port_b = module_b.get_port(module_a.name.lower())
 
             port_a.connect(port_b)
+            (port_a.lag, port_b.lag) = (lag, lag)
 
-            # Record connectivity for graph viz.
-            idx_a = self.modules.index(module_a)
-            idx_b = self.modules.index(module_b)
+            self.__record_edge(idx_a, idx_b, port_a, port_b, volume)
+            if depth is not None:
+                self.__bounded_ports[(idx_a, port_a.name)] = (idx_b, port_b.name, depth, policy)
 
-            if (str(idx_a), str(idx_b), info) not in self.gv_edges:
-                self.gv_edges.append((str(idx_a), str(idx_b), info))
+            # Record connectivity for graph viz.
+            self.__add_gv_edge((str(idx_a), str(idx_b), info))
 
-                # Double edges for bidiectional: deprecated
-                #if self.gv_info == 'bidirectional' and (str(idx_b), str(idx_a)) not in self.gv_edges:
-                #    self.gv_edges.append((str(idx_b), str(idx_a)))
+            # Double edges for bidiectional: deprecated
+            #if self.gv_info == 'bidirectional' and (str(idx_b), str(idx_a)) not in self.gv_edges:
+            #    self.gv_edges.append((str(idx_b), str(idx_a)))
 
         elif isinstance(module_port_a, list) and isinstance(module_port_b, list):
 
@@ -161,13 +331,12 @@ class Network:
 
             assert module_a.name and module_b.name  # sanity check
 
-            assert module_a in self.modules, 'module %r not in network.'%module_a.name
-            assert module_b in self.modules, 'module %r not in network.'%module_b.name
-
-            idx_a = self.modules.index(module_a)
-            idx_b = self.modules.index(module_b)
+            idx_a = self.__index(module_a)
+            idx_b = self.__index(module_b)
+            assert idx_a is not None, 'module %r not in network.'%module_a.name
+            assert idx_b is not None, 'module %r not in network.'%module_b.name
 
-            self.gv_edges.append((str(idx_a), str(idx_b), info))
+            self.__add_gv_edge((str(idx_a), str(idx_b), info), unique=False)
 
             # Double edges for bidirectional: deprecated
             #if self.gv_info == 'bidirectional':
@@ -188,12 +357,182 @@ class Network:
                 assert False, 'help!'
 
             port_a.connect(port_b)
+            (port_a.lag, port_b.lag) = (lag, lag)
+
+            self.__record_edge(idx_a, idx_b, port_a, port_b, volume)
+            if depth is not None:
+                self.__bounded_ports[(idx_a, port_a.name)] = (idx_b, port_b.name, depth, policy)
 
         else:
             assert False, ' not implemented.'
 
         return
 
+    def stream(self, path=None, batch_size=16, callback=None):
+        """Stream the Phase histories of modules to the root process during runs.
+
+        Modules send the new rows of their phases with `Module.stream_phase()`; the
+        returned collector holds the rows received so far (`view()`), can be read from
+        another thread while the network runs, and calls `callback` on every batch.
+
+        Parameters
+        ----------
+        path: str or None
+            Directory where modules append their rows; the root process reads them as
+            they are written. Required under MPI or the socket transport (the directory
+            must then be shared with the module processes). Default: None, rows go
+            through a queue to the root process (multiprocessing only).
+        batch_size: int
+            Minimum number of new rows of a phase a module sends at once.
+        callback: callable or None
+            `callback(module_name, phase_name, rows)`, called in the collector thread
+            with a DataFrame of the new rows of each batch.
+
+        Returns
+        -------
+        collector: StreamCollector
+        """
+
+        from cortix.src.phase_stream import StreamCollector
+
+        self.stream_collector = StreamCollector(path, batch_size, callback)
+
+        return self.stream_collector
+
+    def converge(self, tolerance, num_intervals=3, modules=None):
+        """Stop runs early when the network reaches steady state.
+
+        Modules report a residual norm each exchange interval with
+        `Module.report_residual()`; when every monitored module has been at or below
+        `tolerance` for `num_intervals` consecutive intervals, all of them stop at the
+        same interval. See `cortix.src.convergence`. Multiprocessing only.
+
+        Parameters
+        ----------
+        tolerance: float
+        num_intervals: int
+        modules: list(Module) or None
+            Modules whose residuals decide; the others are not stopped, so no other
+            module may be connected to them. Default: all.
+
+        Returns
+        -------
+        monitor: ConvergenceMonitor
+        """
+
+        from cortix.src.convergence import ConvergenceMonitor
+
+        idxs = None
+        if modules is not None:
+            idxs = list()
+            for m in modules:
+                idx = self.__index(m)
+                assert idx is not None, 'module %r not in network.'%m.name
+                idxs.append(idx)
+
+        self.convergence_monitor = ConvergenceMonitor(tolerance, num_intervals, idxs)
+
+        return self.convergence_monitor
+
+    def record(self, path, modules=None):
+        """Record the messages modules receive in the next runs, for standalone replay.
+
+        Each recorded module writes `<path>/<name>_<index>.rec` (see
+        `cortix.src.replay`), overwritten every run. Under MPI or the socket transport
+        the module processes write the files on their own hosts.
+
+        Parameters
+        ----------
+        path: str or None
+            Directory of the recordings; None stops recording.
+        modules: list(Module) or None
+            Modules to record. Default: all modules.
+        """
+
+        self.record_path = path
+        if path is None:
+            self.__recorded = list()
+            return
+
+        if modules is None:
+            self.__recorded = None # all modules, including those added later
+        else:
+            self.__recorded = list()
+            for m in modules:
+                idx = self.__index(m)
+                assert idx is not None, 'module %r not in network.'%m.name
+                self.__recorded.append(idx)
+
+    def __set_recorders(self):
+        """Give the recorded modules their recorder."""
+
+        from cortix.src.replay import PortRecorder
+
+        idxs = self.__recorded
+        if idxs is None:
+            idxs = range(len(self.modules))
+
+        for idx in idxs:
+            mod = self.modules[idx]
+            mod.recorder = PortRecorder(os.path.join(self.record_path,
+                                                     '{}_{}.rec'.format(mod.name, idx)))
+
+    def __start_streams(self):
+        """Start the stream collector and give every module its sink."""
+
+        collector = self.stream_collector
+        if collector.path is None and (self.use_mpi or self.use_sockets):
+            self.log.warning('Network::run(): streaming through a queue applies to '
+                             'multiprocessing only; give Network.stream() a path. '
+                             'Streaming disabled for this run.')
+            return False
+
+        if not self.use_mpi or self.rank == 0:
+            collector.start(multiproc.get_context('spawn'), self.log)
+        if self.use_mpi:
+            self.comm.Barrier() # old stream files are removed
+
+        for (idx, mod) in enumerate(self.modules):
+            mod.stream_sink = collector.sink('{}_{}'.format(mod.name, idx))
+
+        return True
+
+    def __stop_streams(self):
+        """Take in the last batches once all modules are finished."""
+
+        for mod in self.modules:
+            mod.stream_sink = None
+
+        if not self.use_mpi or self.rank == 0:
+            self.stream_collector.stop()
+            for (module_name, phase_name) in self.stream_collector.streams():
+                self.log.info('Streamed {} row(s) of {}.{}'.format(
+                    self.stream_collector.num_rows(module_name, phase_name),
+                    module_name, phase_name))
+
+    def __add_gv_edge(self, edge, unique=True):
+        """Append `edge` to `self.gv_edges`, if `unique` only when absent; constant time."""
+
+        if self.__gv_edges_list is not self.gv_edges or \
+           self.__gv_edges_len != len(self.gv_edges):
+            # The list was replaced or changed outside of `connect()`; re-index it
+            self.__gv_edges_seen = set(self.gv_edges)
+            self.__gv_edges_list = self.gv_edges
+
+        if not unique or edge not in self.__gv_edges_seen:
+            self.gv_edges.append(edge)
+            self.__gv_edges_seen.add(edge)
+
+        self.__gv_edges_len = len(self.gv_edges)
+
+    def __record_edge(self, idx_a, idx_b, port_a, port_b, volume):
+        """Record the ports and declared volume of a connection for placement."""
+
+        self.__edge_ports[(idx_a, idx_b)] = (port_a.name, port_b.name)
+        if volume is not None:
+            assert volume >= 0.0
+            self.edge_volumes[(idx_a, idx_b)] = float(volume)
+
     def __run(self, save=False, save_dir_name=None):
         """
         Internal method to run the network simulation. Do not use this method, it is
@@ -211,6 +550,14 @@ class Network:
         """
         assert len(self.modules) >= 1, 'the network must have a list of modules.'
 
+        if self.event_driven:
+            # Modules are handlers called in this process; only the MPI root runs them
+            if not self.use_mpi or self.rank == 0:
+                self.__run_events()
+            if self.use_mpi:
+                self.comm.Barrier()
+            return
+
         # Create directory for saving modules states
         if self.rank == 0 or self.use_multiprocessing:
             #shutil.rmtree('.ctx-saved', ignore_errors=True)
@@ -218,6 +565,19 @@ class Network:
             #os.makedirs('.ctx-saved')
             os.makedirs(save_dir_name)
 
+        if self.__bounded_ports and (self.use_mpi or self.use_sockets):
+            self.log.warning('Network::run(): bounded port queues apply to multiprocessing '
+                             'only; connections use the transport defaults.')
+
+        if self.convergence_monitor is not None and (self.use_mpi or self.use_sockets):
+            self.log.warning('Network::run(): steady-state detection applies to '
+                             'multiprocessing only; modules run to their end time.')
+
+        streaming = self.stream_collector is not None and self.__start_streams()
+
+        if self.record_path is not None:
+            self.__set_recorders()
+
         # Running under MPI
         #------------------
         if self.use_mpi:
@@ -228,12 +588,18 @@ class Network:
                 (len(self.modules) + 1, self.size)
             self.comm.Barrier()
 
-            # Assign an mpi rank to all ports of a module using the module list index
-            # If a port has rank assignment from a previous run; leave it alone
-            for mod in self.modules:
-                rank = self.modules.index(mod)+1
+            # Rank of each module: list index + 1, or topology-aware placement
+            rank_of_module = {idx: idx+1 for idx in range(len(self.modules))}
+            if self.auto_placement or self.placement is not None:
+                rank_of_module = self.__mpi_placement()
+            self.__module_of_rank = {rank: idx for (idx, rank) in rank_of_module.items()}
+
+            # Assign an mpi rank to all ports of a module
+            # If a port has rank assignment from a previous run; leave it alone unless placed
+            for (idx, mod) in enumerate(self.modules):
+                rank = rank_of_module[idx]
                 for port in mod.ports:
-                    if port.rank is None:
+                    if port.rank is None or self.auto_placement or self.placement is not None:
                         port.rank = rank
 
             # Assign a unique port id to all ports
@@ -246,15 +612,33 @@ class Network:
                         port.id = i
                         i += 1
 
+            # Route ports between modules on the same node through shared memory
+            shm_channels = list()
+            if self.hybrid:
+                shm_channels = self.__setup_shared_memory()
+
+            # Pin the module ranks of each node
+            if self.affinity is not None:
+                self.__pin_mpi_rank()
+
             # Parallel run module in MPI
             if self.rank != 0:
-                mod = self.modules[self.rank-1]
+                mod = self.modules[self.__module_of_rank[self.rank]]
                 self.log.info('Launching Module {}'.format(mod))
                 mod.run_and_save(save, save_dir_name)
 
+            for channel in shm_channels:
+                channel.close()
+
             # Sync here at the end
             self.comm.Barrier()
 
+        # Running on workers over TCP sockets
+        #------------------------------------
+        elif self.use_sockets:
+
+            self.__run_sockets(save_dir_name)
+
         # Running under Python multiprocessing
         #-------------------------------------
         else:
@@ -270,19 +654,78 @@ class Network:
 
             processes = list()
 
+            # Bounded queues for connections with a depth; new queues every run
+            ctx = multiproc.get_context('spawn')
+            for ((idx_a, name_a), (idx_b, name_b, depth, policy)) in self.__bounded_ports.items():
+                (end_a, end_b) = QueueChannel.pair(ctx, depth, policy)
+                self.modules[idx_a].get_port(name_a).channel = end_a
+                self.modules[idx_b].get_port(name_b).channel = end_b
+
+            # Pipes of the other connections; module processes cannot open them later
             for mod in self.modules:
+                for port in mod.ports:
+                    if port.channel is None:
+                        port.open_pipe()
+                        port.pipe_required = True
+
+            cpus_of = dict()
+            if self.affinity is not None:
+                cpus_of = self.__affinity_map(list(range(len(self.modules))))
+
+            # Residual slots of the modules in shared memory
+            monitor = self.convergence_monitor
+            if monitor is not None:
+                from cortix.src.placement import network_graph
+                (edges, _) = network_graph(self)
+                monitor.setup(ctx, len(self.modules), edges)
+                for (idx, mod) in enumerate(self.modules):
+                    mod.convergence = monitor.reporter(idx)
+                monitor.start()
+
+            for (idx, mod) in enumerate(self.modules):
                 self.log.info('Launching Module {}'.format(mod))
+                # Module process logs through the root process queue listener
+                mod.log_queue = self.log_queue
+                if self.log_level is not None:
+                    mod.log_level = self.log_level
                 # Note: on the other end, args will arrive as a doubly tuple: ((self.log,),)
                 proc = multiproc.Process(target=mod.run_and_save, args=(self.log, save_dir_name))
                 #proc = multiproc.Process(target=mod.run_and_save, args=(self.log,))
                 #proc = multiproc.Process(target=mod.run_and_save, args=(self.log,), kwargs={'logger':self.log})
                 processes.append(proc)
-                proc.start()
+                with pinned(cpus_of.get(idx)): # the process inherits the CPU affinity
+                    proc.start()
+                mod.log_queue = None # the module was pickled into the child at start
+                mod.stream_sink = None
+                mod.convergence = None
+                mod.recorder = None
 
             # Synchronize at the end
             for proc in processes:
                 proc.join()
 
+            if monitor is not None:
+                monitor.stop()
+                if monitor.stop_interval is None:
+                    self.log.info('Network::run(): steady state not reached (tolerance '
+                                  '{}); last residuals {}'.format(monitor.tolerance,
+                                                                  monitor.residuals))
+                else:
+                    self.log.info('Network::run(): steady state (tolerance {} for {} '
+                                  'intervals); modules stopped at interval {}'.format(
+                                      monitor.tolerance, monitor.num_intervals,
+                                      monitor.stop_interval))
+
+            for mod in self.modules:
+                for port in mod.ports:
+                    port.channel = None
+
+        if streaming:
+            self.__stop_streams()
+
+        for mod in self.modules:
+            mod.recorder = None
+
         # Reload saved modules
         #---------------------
         if self.use_mpi:
@@ -303,18 +746,359 @@ class Network:
                     module = pickle.load(fin)
                     # Reintroduce logging
                     module.log = self.log
+                    self.__module_index.pop(id(self.modules[module.id]), None)
                     self.modules[module.id] = module
+                    self.__module_index[id(module)] = module.id
 
         if num_files and num_files != len(self.modules):
             self.log.warning('Network::run(): not all modules reloaded from disk.\
                               # modules = %i; # files = %i'%(len(self.modules), num_files))
 
+        for mod in self.modules:
+            for (name, stats) in sorted(mod.port_stats.items()):
+                self.log.info('Port {}.{} queue (depth {}, {}): blocked {:.3f} s in {} send(s); '
+                              'dropped {}; coalesced {}'.format(mod.name, name, stats['depth'],
+                                  stats['policy'], stats['blocked_time'], stats['num_blocked'],
+                                  stats['num_dropped'], stats['num_coalesced']))
+
+        # Messages sent in this run weigh the connections for the next placement
+        for ((idx_a, idx_b), (name_a, name_b)) in self.__edge_ports.items():
+            traffic_a = self.modules[idx_a].port_traffic
+            traffic_b = self.modules[idx_b].port_traffic
+            if name_a in traffic_a or name_b in traffic_b:
+                self.measured_volumes[(idx_a, idx_b)] = float(traffic_a.get(name_a, 0) +
+                                                              traffic_b.get(name_b, 0))
+
         if self.use_mpi:
             # Make double sure all are in sync here before going forward
             # this solves the problem of processes running behind reading files
             # that do not exist anymore
             self.comm.Barrier()
 
+    def __run_events(self):
+        """Run the network as discrete events handled in time order in this process."""
+
+        from cortix.src.event_queue import EventQueue
+
+        events = EventQueue(self.event_start_time, self.event_end_time)
+
+        peers = dict() # id(port): module owning the port
+        for mod in self.modules:
+            for port in mod.ports:
+                peers[id(port)] = mod
+
+        for mod in self.modules:
+            mod._Module__attach_events(events, peers)
+        try:
+            for mod in self.modules:
+                mod.on_start(events.now)
+            events.run()
+            for mod in self.modules:
+                mod.on_end(events.now)
+        finally:
+            for mod in self.modules:
+                mod._Module__attach_events(None, None)
+
+        for mod in self.modules:
+            self.log.info('Module {} handled {} event(s)'.format(mod.name, mod.num_events))
+        self.log.info('Network::run(): {} event(s) up to time {}; {} left'.format(
+            events.num_events, events.now, len(events)))
+
+    def __run_in_process(self, log, boundary=()):
+        """Run the modules of a nested network in threads of the calling process.
+
+        Connections between the modules are in-memory channels; nested ports standing for
+        ports of the parent module forward to them. Channels are removed afterwards so the
+        modules can be pickled with their parent.
+
+        Parameters
+        ----------
+        log: logging.Logger
+            Logger of the parent module; used by the nested modules.
+        boundary: list(tuple(Port, Port))
+            Nested module port and the parent module port it stands for.
+        """
+
+        import threading
+        import traceback
+        from cortix.src.inprocess_channel import InProcessChannel, BoundaryChannel
+
+        self.log = log
+
+        for (port, outer_port) in boundary:
+            port.channel = BoundaryChannel(outer_port)
+
+        owned = {id(port) for mod in self.modules for port in mod.ports}
+        for mod in self.modules:
+            mod.log = log
+            for port in mod.ports:
+                peer = port.connected_port
+                if port.channel is None and peer is not None and id(peer) in owned:
+                    (port.channel, peer.channel) = InProcessChannel.pair()
+
+        errors = list()
+        def target(mod):
+            try:
+                mod.run((log, None))
+                for port in mod.ports:
+                    port.close()
+            except Exception:
+                errors.append('module {}:\n{}'.format(mod.name, traceback.format_exc()))
+
+        threads = [threading.Thread(target=target, args=(mod,), name=mod.name, daemon=True)
+                   for mod in self.modules]
+        for thread in threads:
+            thread.start()
+
+        # Peers of a failed module may wait forever; stop waiting at the first failure
+        while not errors and any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(0.1)
+
+        for mod in self.modules:
+            for port in mod.ports:
+                port.channel = None
+
+        if errors:
+            raise RuntimeError('nested network failed in ' + '\n'.join(errors))
+
+    def __affinity_map(self, idxs, topology=None, quiet=False):
+        """Map modules onto the CPUs of this host and log the pinning.
+
+        Parameters
+        ----------
+        idxs: list(int)
+            Indices of the modules run on this host.
+        topology: list(tuple) or None
+            See `cortix.src.affinity.cpu_topology`. Default: this process' CPUs.
+        quiet: bool
+            Do not log the pinning.
+
+        Returns
+        -------
+        cpus_of: dict(int:list(int))
+            Module index mapped to CPUs.
+        """
+
+        if topology is None:
+            topology = cpu_topology()
+
+        cpus_of = host_affinity_map(idxs, self.affinity, self.__affinity_pairs(), topology)
+
+        if not quiet:
+            for (idx, cpus) in sorted(cpus_of.items()):
+                self.log.info('Module {} pinned to CPU(s) {} (socket {})'.format(
+                    self.modules[idx].name, cpus, socket_of(cpus, topology)))
+
+        return cpus_of
+
+    def __affinity_pairs(self):
+        """Connected module pairs to keep on a socket, or None."""
+
+        if not self.affinity_connected or isinstance(self.affinity, dict):
+            return None
+
+        from cortix.src.placement import network_graph
+        (edges, _) = network_graph(self)
+        return edges
+
+    def __pin_mpi_rank(self):
+        """Pin the calling MPI rank according to `affinity` among the ranks of its node.
+
+        Collective call.
+        """
+
+        from mpi4py import MPI
+        node_comm = self.comm.Split_type(MPI.COMM_TYPE_SHARED)
+        idx = self.__module_of_rank.get(self.rank) # root rank has no module
+        idxs = [i for i in node_comm.allgather(idx) if i is not None]
+        node_comm.Free()
+
+        if idx is None:
+            return
+
+        topology = cpu_topology()
+        cpus_of = self.__affinity_map(idxs, topology, quiet=True)
+        if idx in cpus_of and hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, cpus_of[idx])
+            self.log.info('Module {} pinned to CPU(s) {} (socket {})'.format(
+                self.modules[idx].name, cpus_of[idx], socket_of(cpus_of[idx], topology)))
+
+    def __setup_shared_memory(self):
+        """Connect the ports of co-located MPI ranks through shared memory rings.
+
+        Collective call: every rank, including the root, must enter it. Nodes are found with
+        `MPI.Comm.Split_type(MPI.COMM_TYPE_SHARED)`. Each rank creates the rings its own ports
+        write to, all ranks synchronize, and then each rank attaches to the rings its ports
+        read from. Segment names are unlinked as soon as every rank is attached.
+
+        Returns
+        -------
+        channels: list(SharedMemoryChannel)
+            Channels of the module run by this rank (empty on the root rank).
+        """
+
+        from mpi4py import MPI
+        from cortix.src.shm_channel import SharedMemoryRing, SharedMemoryChannel
+
+        node_comm = self.comm.Split_type(MPI.COMM_TYPE_SHARED)
+        node_leader = node_comm.bcast(self.rank, root=0)  # world rank of the node leader
+        node_of_rank = self.comm.allgather(node_leader)
+        node_comm.Free()
+
+        token = self.comm.bcast(os.urandom(4).hex() if self.rank == 0 else None, root=0)
+
+        def ring_name(port):
+            return 'ctx-{}-{}'.format(token, port.id)
+
+        def is_local(port):
+            return port.connected_port is not None and \
+                   node_of_rank[port.rank] == node_of_rank[port.connected_port.rank]
+
+        if self.rank == 0:
+            n_ports = sum(1 for mod in self.modules for port in mod.ports if port.connected_port)
+            n_local = sum(1 for mod in self.modules for port in mod.ports if is_local(port))
+            self.log.info('Hybrid run on {} node(s): {} of {} port(s) use shared memory'.format(
+                len(set(node_of_rank)), n_local, n_ports))
+
+        local_ports = list()
+        out_rings = dict()
+        if self.rank != 0:
+            local_ports = [port for port in self.modules[self.__module_of_rank[self.rank]].ports
+                           if is_local(port)]
+            for port in local_ports:
+                out_rings[port.id] = SharedMemoryRing.create(ring_name(port),
+                                                             self.shm_ring_capacity)
+
+        self.comm.Barrier()
+
+        channels = list()
+        for port in local_ports:
+            in_ring = SharedMemoryRing.attach(ring_name(port.connected_port))
+            port.channel = SharedMemoryChannel(out_rings[port.id], in_ring)
+            channels.append(port.channel)
+
+        self.comm.Barrier()
+
+        for ring in out_rings.values():
+            ring.unlink()
+
+        return channels
+
+    def __run_sockets(self, save_dir_name):
+        """Run the modules on socket transport workers.
+
+        The workers are started (or waited for) on the first run and serve every
+        subsequent run until the network is closed.
+        """
+
+        # Import here to avoid broken dependency. Only this method needs sockets.
+        from cortix.src.socket_transport import WorkerPool
+
+        if self.__worker_pool is None:
+            self.__worker_pool = WorkerPool(self.address, self.num_workers, self.log,
+                                            spawn_local_workers=self.spawn_local_workers)
+
+        if self.placement is None and self.auto_placement:
+            placement = self.__auto_place(self.__worker_pool.hosts)
+        elif self.placement is None:
+            placement = {idx: idx % self.num_workers for idx in range(len(self.modules))}
+        else:
+            placement = self.placement
+            assert set(placement) == set(range(len(self.modules))), \
+                'placement must assign every module to a worker.'
+            assert all(0 <= w < self.num_workers for w in placement.values()), \
+                'placement refers to a worker index outside [0, %r).'%self.num_workers
+
+        log_level = self.log_level if self.log_level is not None else self.log.level
+
+        # Workers pin their module processes on their own hosts
+        affinity = None
+        if self.affinity is not None:
+            affinity = (self.affinity, self.__affinity_pairs())
+
+        self.__worker_pool.run(self.modules, placement, save_dir_name, self.log.name, log_level,
+                               batch_size=self.socket_batch_size, affinity=affinity)
+
+    def __auto_place(self, workers, imbalance=0.05):
+        """Compute (or read the pinned) placement of the modules onto workers and report it.
+
+        Parameters
+        ----------
+        workers: list(str)
+            Node label of each worker; workers with the same label share a node.
+        imbalance: float
+            Allowed relative load excess of a worker.
+
+        Returns
+        -------
+        placement: dict(int:int)
+            Module index mapped to worker index.
+        """
+
+        from cortix.src import placement as plc
+
+        (edges, loads) = plc.network_graph(self)
+
+        pinned = self.placement_file is not None and os.path.isfile(self.placement_file)
+        if pinned:
+            placement = plc.read_placement(self.placement_file)
+        else:
+            placement = plc.place(edges, loads, workers, imbalance=imbalance)
+
+        self.placement_report = plc.report(edges, loads, placement, workers)
+
+        if self.rank == 0 or self.use_multiprocessing:
+            report = self.placement_report
+            self.log.info('Placement ({}) on {} worker(s), {} node(s): cut weight {} (across '
+                          'nodes {}) of total {}; worker loads {}'.format(
+                              'pinned' if pinned else 'computed', len(workers), len(set(workers)),
+                              report['cut_weight'], report['node_cut_weight'],
+                              report['total_weight'], report['worker_loads']))
+            self.log.info('Placement module:worker {}'.format(report['placement']))
+            if self.placement_file is not None and not pinned:
+                plc.write_placement(self.placement_file, report)
+
+        return placement
+
+    def __mpi_placement(self):
+        """Map modules onto MPI ranks, one module per rank, grouping connected modules by node.
+
+        Collective call; every rank computes the same placement.
+
+        Returns
+        -------
+        rank_of_module: dict(int:int)
+        """
+
+        if self.placement is not None:
+            placement = {idx: rank-1 for (idx, rank) in self.placement.items()}
+        else:
+            from mpi4py import MPI
+            node_comm = self.comm.Split_type(MPI.COMM_TYPE_SHARED)
+            node_leader = node_comm.bcast(self.rank, root=0)
+            node_comm.Free()
+            node_of_rank = self.comm.allgather(node_leader)
+            workers = [str(node_of_rank[rank]) for rank in range(1, self.size)]
+
+            # Exactly one module per rank: balance counts, not loads
+            module_loads = self.module_loads
+            self.module_loads = dict()
+            placement = self.__auto_place(workers, imbalance=0.0)
+            self.module_loads = module_loads
+
+        assert sorted(placement.values()) == list(range(len(self.modules))), \
+            'MPI placement must map each module to a distinct rank in [1, %r].'%len(self.modules)
+
+        return {idx: w+1 for (idx, w) in placement.items()}
+
+    def __close(self):
+        """Internal method to release resources held across runs; called by Cortix."""
+
+        if self.__worker_pool is not None:
+            self.__worker_pool.close()
+            self.__worker_pool = None
+
     def draw(self, graph_attr=None, node_attr=None, engine='twopi', lr=False,
              size=None, ports=False, node_shape='hexagon'):
         """Build a `graphviz` graph and draw the network saving it to a file.
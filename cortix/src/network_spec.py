@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of the Cortix toolkit environment
+# https://cortix.org
+"""Declarative network specification.
+
+A spec is a dict (or a JSON or YAML file holding one) with a list of modules and a
+list of connections; `Network.build(spec)` instantiates it. Example:
+
+    {"modules": [
+        {"name": "sun", "class": "cortix.examples.nbody.body.Body",
+         "kwargs": {"mass": 1.989e30}, "attributes": {"save": true}},
+        {"name": "body", "class": "cortix.examples.nbody.body.Body", "count": 4}],
+     "connections": [
+        {"pattern": "all-to-all", "modules": ["sun", "body"],
+         "ports": ["body_{b}", "body_{a}"]},
+        {"from": ["sun", "light"], "to": ["body_0", "light"], "info": "directional"}]}
+
+Module entries
+    name        module name; with `count`, the modules are named `name_0`, `name_1`, ...
+                and the entry defines a group referred to by `name`.
+    class       class object or dotted import path.
+    args        constructor positional arguments (list).
+    kwargs      constructor keyword arguments (dict).
+    attributes  attributes set on each module after construction (e.g. save, end_time).
+    count       number of modules of this entry. Default: 1.
+
+Connection entries
+    from, to    two modules (names), connected through inferred ports as in
+                `Network.connect(module_a, module_b)`; or two [module, port] pairs.
+    pattern     'all-to-all', 'ring', 'star' or 'grid' among `modules`, a list of
+                module or group names (or a single one). 'star' uses `hub` as the
+                center; 'ring' takes `closed` (default true); 'grid' takes `shape`
+                [rows, cols] (row major over `modules`) and `periodic` (default false).
+    ports       [port_a, port_b] name templates of the two ends of each generated
+                connection; fields: {a}, {b} (positions in `modules`; the hub of a
+                star is position 0), {a_name}, {b_name} (module names) and {side_a},
+                {side_b} ('peer' for all-to-all; 'next'/'prev' for ring; 'spoke'/'hub'
+                for star; 'east'/'west' and 'south'/'north' for grid). Default: the
+                lower case name of the peer module on each end, as for inferred ports.
+    info, volume, depth, policy, lag
+                Passed to `Network.connect()`.
+
+Compiling a spec resolves classes and generates the connection index arrays of the
+patterns with NumPy; compiled specs are cached by content (files by path and
+modification time), so building the same network again skips this work. Only specs
+made of plain values (None, bools, numbers, strings, lists, tuples, dicts, NumPy
+arrays and scalars, and importable classes) are cached; a spec holding any other
+object is compiled every time. The cache keeps the last `_cache_size` specs used.
+"""
+
+import os
+import copy
+import json
+import importlib
+import collections
+import numpy as np
+
+_cache = collections.OrderedDict() # least recently used first
+_cache_size = 64
+
+class _Uncacheable(Exception):
+    """A spec value without a content key."""
+
+def load_spec(source):
+    """Load a spec from a dict, or from a JSON or YAML file name.
+
+    Parameters
+    ----------
+    source: dict or str
+
+    Returns
+    -------
+    spec: dict
+    """
+
+    if isinstance(source, dict):
+        return source
+
+    assert isinstance(source, str), 'spec must be a dict or a file name'
+
+    with open(source) as fin:
+        if source.endswith(('.yaml', '.yml')):
+            # Import here to avoid broken dependency
+            import yaml
+            spec = yaml.safe_load(fin)
+        else:
+            spec = json.load(fin)
+
+    assert isinstance(spec, dict), 'spec file %r must hold a mapping'%source
+    return spec
+
+class CompiledSpec:
+    """Network spec with resolved classes and generated connections.
+
+    Attributes
+    ----------
+    modules: list(tuple)
+        `(name, cls, args, kwargs, attributes)` of every module, in network order.
+    connections: list(tuple)
+        `(idx_a, port_a, idx_b, port_b, options)` of every connection; `port_a` and
+        `port_b` are None for inferred ports; `options` are keyword arguments of
+        `Network.connect()`.
+    """
+
+    def __init__(self, modules, connections):
+        self.modules = modules
+        self.connections = connections
+
+def compile_spec(source, use_cache=True):
+    """Compile a spec (see module documentation); cached by content.
+
+    Parameters
+    ----------
+    source: dict or str
+        Spec or JSON/YAML file name.
+    use_cache: bool
+
+    Returns
+    -------
+    compiled: CompiledSpec
+    """
+
+    key = None
+    if use_cache:
+        if isinstance(source, str):
+            key = ('file', os.path.abspath(source), os.stat(source).st_mtime_ns)
+        else:
+            try:
+                key = ('dict', _content_key(source))
+            except _Uncacheable:
+                key = None # compiled without the cache
+
+    if key is not None and key in _cache:
+        _cache.move_to_end(key)
+        return _cache[key]
+
+    spec = load_spec(source)
+
+    assert 'modules' in spec, 'spec requires a list of modules'
+    unknown = set(spec) - {'modules', 'connections'}
+    assert not unknown, 'unknown spec keys %r'%sorted(unknown)
+
+    modules = list()
+    groups = dict() # entry name: list of module indices
+    for entry in spec['modules']:
+        unknown = set(entry) - {'name', 'class', 'args', 'kwargs', 'attributes', 'count'}
+        assert not unknown, 'unknown module keys %r'%sorted(unknown)
+        assert 'name' in entry and 'class' in entry, 'modules require a name and a class'
+
+        name = entry['name']
+        assert name not in groups, 'duplicate module name %r'%name
+        cls = _resolve_class(entry['class'])
+        args = list(entry.get('args', list()))
+        kwargs = dict(entry.get('kwargs', dict()))
+        attributes = dict(entry.get('attributes', dict()))
+        count = entry.get('count', None)
+
+        if count is None:
+            groups[name] = [len(modules)]
+            modules.append((name, cls, args, kwargs, attributes))
+        else:
+            assert isinstance(count, int) and count >= 1, 'count of %r must be positive'%name
+            groups[name] = list(range(len(modules), len(modules) + count))
+            for i in range(count):
+                modules.append(('{}_{}'.format(name, i), cls, args, kwargs, attributes))
+
+    names = {m[0]: idx for (idx, m) in enumerate(modules)}
+    assert len(names) == len(modules), 'module names must be unique'
+
+    def lookup(ref):
+        if ref in groups:
+            return groups[ref]
+        assert ref in names, 'unknown module or group %r'%ref
+        return [names[ref]]
+
+    connections = list()
+    for entry in spec.get('connections', list()):
+        options = {k: entry[k] for k in ('info', 'volume', 'depth', 'policy', 'lag')
+                   if k in entry}
+        if 'pattern' in entry:
+            connections.extend(_pattern_connections(entry, lookup, modules, options))
+        else:
+            assert 'from' in entry and 'to' in entry, \
+                'connections require from/to or a pattern; got %r'%entry
+            ends = list()
+            for ref in (entry['from'], entry['to']):
+                if isinstance(ref, str):
+                    (idxs, port) = (lookup(ref), None)
+                else:
+                    assert len(ref) == 2, '[module, port] expected; got %r'%ref
+                    (idxs, port) = (lookup(ref[0]), ref[1])
+                assert len(idxs) == 1, '%r is a group; use a pattern to connect groups'%ref
+                ends.append((idxs[0], port))
+            assert (ends[0][1] is None) == (ends[1][1] is None), \
+                'give ports on both ends or on neither; got %r'%entry
+            connections.append((ends[0][0], ends[0][1], ends[1][0], ends[1][1], options))
+
+    compiled = CompiledSpec(modules, connections)
+    if key is not None:
+        _cache[key] = compiled
+        if len(_cache) > _cache_size:
+            _cache.popitem(last=False)
+
+    return compiled
+
+def _pattern_connections(entry, lookup, modules, options):
+    """Generate the connections of a pattern entry."""
+
+    pattern = entry['pattern']
+    refs = entry.get('modules', list())
+    if isinstance(refs, str):
+        refs = [refs]
+    members = np.array([idx for ref in refs for idx in lookup(ref)], dtype=int)
+
+    if pattern == 'all-to-all':
+        (pos_a, pos_b) = np.triu_indices(len(members), 1)
+        sides = [('peer', 'peer', pos_a, pos_b)]
+
+    elif pattern == 'ring':
+        pos_a = np.arange(len(members))
+        pos_b = np.roll(pos_a, -1)
+        if not entry.get('closed', True) or len(members) <= 2:
+            (pos_a, pos_b) = (pos_a[:-1], pos_b[:-1])
+        sides = [('next', 'prev', pos_a, pos_b)]
+
+    elif pattern == 'star':
+        assert 'hub' in entry, 'star pattern requires a hub'
+        hub = lookup(entry['hub'])
+        assert len(hub) == 1, 'the hub of a star must be a single module'
+        members = np.concatenate([hub, members[members != hub[0]]]).astype(int)
+        pos_b = np.arange(1, len(members))
+        sides = [('spoke', 'hub', np.zeros_like(pos_b), pos_b)]
+
+    elif pattern == 'grid':
+        assert 'shape' in entry, 'grid pattern requires a shape'
+        (rows, cols) = entry['shape']
+        assert rows * cols == len(members), \
+            'grid shape %r does not match %r modules'%(entry['shape'], len(members))
+        pos = np.arange(rows * cols).reshape(rows, cols)
+        periodic = entry.get('periodic', False)
+        east = (pos[:, :-1].ravel(), pos[:, 1:].ravel())
+        south = (pos[:-1, :].ravel(), pos[1:, :].ravel())
+        if periodic and cols > 2:
+            east = (np.concatenate([east[0], pos[:, -1]]), np.concatenate([east[1], pos[:, 0]]))
+        if periodic and rows > 2:
+            south = (np.concatenate([south[0], pos[-1, :]]),
+                     np.concatenate([south[1], pos[0, :]]))
+        sides = [('east', 'west') + east, ('south', 'north') + south]
+
+    else:
+        assert False, 'unknown pattern %r'%pattern
+
+    templates = entry.get('ports', None)
+    if templates is not None:
+        assert len(templates) == 2, 'ports must hold two name templates'
+
+    connections = list()
+    for (side_a, side_b, pos_a, pos_b) in sides:
+        for (a, b) in zip(pos_a.tolist(), pos_b.tolist()):
+            (idx_a, idx_b) = (int(members[a]), int(members[b]))
+            (name_a, name_b) = (modules[idx_a][0], modules[idx_b][0])
+            if templates is None:
+                (port_a, port_b) = (name_b.lower(), name_a.lower())
+            else:
+                fields = {'a': a, 'b': b, 'a_name': name_a, 'b_name': name_b,
+                          'side_a': side_a, 'side_b': side_b}
+                (port_a, port_b) = (templates[0].format(**fields),
+                                    templates[1].format(**fields))
+            connections.append((idx_a, port_a, idx_b, port_b, options))
+
+    return connections
+
+def _resolve_class(cls):
+    """Class object of a class or of a dotted import path."""
+
+    if isinstance(cls, type):
+        return cls
+
+    assert isinstance(cls, str) and '.' in cls, 'class must be a class or a dotted path'
+    (module_name, class_name) = cls.rsplit('.', 1)
+    return getattr(importlib.import_module(module_name), class_name)
+
+def _content_key(obj):
+    """Hashable key equal for specs of equal content.
+
+    Raises
+    ------
+    _Uncacheable
+        For values whose content cannot be keyed, e.g. arbitrary objects.
+    """
+
+    if obj is None or isinstance(obj, (bool, int, str)):
+        return (type(obj).__name__, obj)
+    if isinstance(obj, float):
+        return ('float', repr(obj)) # tells -0.0 from 0.0
+    if isinstance(obj, (list, tuple)):
+        return (type(obj).__name__,) + tuple(_content_key(item) for item in obj)
+    if isinstance(obj, dict):
+        items = [(_content_key(key), _content_key(value)) for (key, value) in obj.items()]
+        return ('dict',) + tuple(sorted(items, key=lambda item: repr(item[0])))
+    if isinstance(obj, type):
+        # Only a class found again by its name; a redefined class is another class
+        module = importlib.import_module(obj.__module__)
+        if getattr(module, obj.__qualname__, None) is not obj:
+            raise _Uncacheable(obj)
+        return ('class', obj.__module__, obj.__qualname__)
+    if isinstance(obj, (np.ndarray, np.generic)) and obj.dtype != object:
+        return ('numpy', obj.dtype.str, np.shape(obj), np.ascontiguousarray(obj).tobytes())
+
+    raise _Uncacheable(obj)
+
+def instantiate(compiled):
+    """Create the modules of a compiled spec.
+
+    Parameters
+    ----------
+    compiled: CompiledSpec
+
+    Returns
+    -------
+    modules: list(Module)
+    """
+
+    modules = list()
+    for (name, cls, args, kwargs, attributes) in compiled.modules:
+        # Constructors may keep or change their arguments; the compiled spec is reused
+        module = cls(*copy.deepcopy(args), **copy.deepcopy(kwargs)) if args or kwargs \
+                 else cls()
+        module.name = name
+        for (attr, value) in attributes.items():
+            setattr(module, attr, copy.copy(value))
+        modules.append(module)
+
+    return modules
@@ -0,0 +1,359 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of the Cortix toolkit environment
+# https://cortix.org
+"""Live streaming of module Phase histories to the root process.
+
+Module results are normally visible only when the network reloads the saved modules
+at the end of a run. With streaming enabled (`Network.stream()`), a module calls
+`Module.stream_phase(phase)` as it advances (e.g. after each time step); the rows
+added to the phase since the last call are sent in batches to a `StreamCollector`
+in the root process, which keeps an incrementally updated view of every stream.
+
+Batches travel through one of two sinks:
+
+    queue  an unbounded `multiprocessing.Queue` drained by a thread of the root
+           process (multiprocessing only).
+    file   one file per module in a directory, holding length-prefixed pickled
+           batches that the root process reads as they are appended (any transport;
+           under MPI or on socket workers the directory must be shared).
+
+Producers never wait on the collector: a queue put returns at once and a file append
+is a single buffered write.
+
+Rows are numbered from the first row a phase history ever stored, so that a history
+bounded with `PhaseNew.retain()` streams each row once: rows dropped before they
+were streamed are skipped (keep them with a spill file), and a last row that the
+retention policy may still replace or combine is held back until it is final or the
+module finishes.
+"""
+
+import os
+import glob
+import queue
+import pickle
+import struct
+import threading
+
+import pandas
+
+_header = struct.Struct('<Q') # length of a pickled batch in a stream file
+
+class StreamSink:
+    """Module end of a stream; sends batches of new Phase rows."""
+
+    def __init__(self, out_queue=None, file_name=None, batch_size=16):
+        """Constructs a StreamSink object; created by the network for each module.
+
+        Parameters
+        ----------
+        out_queue: multiprocessing.Queue or None
+            Queue of the root process collector.
+        file_name: str or None
+            Stream file of the module, when streaming to a directory.
+        batch_size: int
+            Minimum number of new rows of a phase sent in one batch.
+        """
+
+        assert (out_queue is None) != (file_name is None), 'give a queue or a file name'
+        assert batch_size >= 1, 'batch size must be positive; got %r'%batch_size
+
+        self.out_queue = out_queue
+        self.file_name = file_name
+        self.batch_size = batch_size
+
+        self.__file = None
+
+    def put(self, batch):
+        """Send a batch `(module_name, phase_name, rows)`; `rows` is a DataFrame."""
+
+        if self.out_queue is not None:
+            self.out_queue.put(batch)
+            return
+
+        if self.__file is None:
+            self.__file = open(self.file_name, 'ab')
+        payload = pickle.dumps(batch, protocol=pickle.HIGHEST_PROTOCOL)
+        self.__file.write(_header.pack(len(payload)) + payload)
+        self.__file.flush()
+
+    def close(self):
+        """Close the stream file; queued batches are delivered when the process exits."""
+
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+    def __getstate__(self):
+        """Pickle without the open file."""
+
+        state = self.__dict__.copy()
+        state['_StreamSink__file'] = None
+        return state
+
+def new_rows(phase, start, stop=None):
+    """Rows of a phase history numbered from `start` up to `stop`.
+
+    Parameters
+    ----------
+    phase: PhaseNew
+        Or any object with a `df` property holding its history indexed by time.
+    start: int
+        Row number; see `history_size()`. Rows dropped by the retention policy of
+        the history are skipped.
+    stop: int or None
+        Default: all rows.
+
+    Returns
+    -------
+    rows: pandas.DataFrame
+    """
+
+    if hasattr(phase, 'num_rows_stored'): # copy only the new rows
+        offset = phase.num_rows_stored - phase.num_time_stamps # rows dropped
+        if stop is not None:
+            stop = max(stop - offset, 0)
+        return phase.history_frame(max(start - offset, 0), stop)
+
+    return phase.df.iloc[start:stop].copy()
+
+def history_size(phase, final=True):
+    """Number of rows of a phase history, including the rows retention dropped.
+
+    Parameters
+    ----------
+    phase: PhaseNew
+        Or any object with a `df` property holding its history indexed by time.
+    final: bool
+        Do not count a last row that the retention policy may still replace or
+        combine.
+
+    Returns
+    -------
+    size: int
+    """
+
+    if hasattr(phase, 'num_rows_stored'):
+        if final and not phase.last_row_final:
+            return phase.num_rows_stored - 1
+        return phase.num_rows_stored
+
+    return len(phase.df.index)
+
+class StreamCollector:
+    """Root process end of the streams of all modules of a network.
+
+    Rows are kept per `(module name, phase name)` stream; `view()` returns the rows
+    received so far and can be called from any thread while the network runs.
+    """
+
+    def __init__(self, path=None, batch_size=16, callback=None, poll_interval=0.5):
+        """Constructs a StreamCollector object; use `Network.stream()` instead.
+
+        Parameters
+        ----------
+        path: str or None
+            Directory of the stream files; None streams through a queue.
+        batch_size: int
+            Minimum number of new rows a module sends at once.
+        callback: callable or None
+            Called as `callback(module_name, phase_name, rows)` in the collector thread
+            for every batch received; `rows` is a DataFrame with the new rows.
+        poll_interval: float
+            Seconds between reads of the stream files.
+        """
+
+        assert batch_size >= 1, 'batch size must be positive; got %r'%batch_size
+        assert callback is None or callable(callback), 'callback must be callable'
+
+        self.path = path
+        self.batch_size = batch_size
+        self.callback = callback
+        self.poll_interval = poll_interval
+        self.log = None
+
+        self.__queue = None
+        self.__thread = None
+        self.__stop = threading.Event()
+        self.__lock = threading.Lock()
+        self.__offsets = dict()  # stream file name: bytes read
+        self.__frames = dict()   # stream: rows consolidated by the last view
+        self.__chunks = dict()   # stream: batches received since
+        self.__num_rows = dict() # stream: rows received
+
+    def sink(self, file_stem):
+        """Sink of a module; the queue is created by `start()`.
+
+        Parameters
+        ----------
+        file_stem: str
+            Stream file name (without directory and extension) of the module.
+        """
+
+        if self.path is None:
+            assert self.__queue is not None, 'start the collector before creating sinks'
+            return StreamSink(out_queue=self.__queue, batch_size=self.batch_size)
+
+        return StreamSink(file_name=os.path.join(self.path, file_stem + '.stream'),
+                          batch_size=self.batch_size)
+
+    def start(self, ctx=None, log=None):
+        """Clear the rows of a previous run and start collecting.
+
+        Parameters
+        ----------
+        ctx: multiprocessing context or None
+            Context of the module processes; required to stream through a queue.
+        log: logging.Logger or None
+        """
+
+        self.log = log
+        with self.__lock:
+            self.__frames = dict()
+            self.__chunks = dict()
+            self.__num_rows = dict()
+
+        if self.path is None:
+            assert ctx is not None, 'streaming through a queue requires multiprocessing'
+            self.__queue = ctx.Queue()
+        else:
+            os.makedirs(self.path, exist_ok=True)
+            for file_name in glob.glob(os.path.join(self.path, '*.stream')):
+                os.remove(file_name)
+            self.__offsets = dict()
+
+        self.__stop.clear()
+        self.__thread = threading.Thread(target=self.__collect, daemon=True,
+                                         name='cortix-stream-collector')
+        self.__thread.start()
+
+    def stop(self):
+        """Take in the remaining batches and stop the collector thread.
+
+        Call when the module processes are finished.
+        """
+
+        if self.__thread is None:
+            return
+
+        self.__stop.set()
+        self.__thread.join()
+        self.__thread = None
+
+        if self.__queue is not None:
+            self.__queue.close()
+            self.__queue = None
+
+    def __collect(self):
+        """Collector thread: take in batches until stopped, then drain the sources."""
+
+        while not self.__stop.is_set():
+            if self.path is None:
+                try:
+                    self.__ingest(self.__queue.get(timeout=self.poll_interval))
+                except queue.Empty:
+                    pass
+            else:
+                self.__read_files()
+                self.__stop.wait(self.poll_interval)
+
+        if self.path is None:
+            while True:
+                try:
+                    self.__ingest(self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+        else:
+            self.__read_files()
+
+    def __read_files(self):
+        """Take in the complete batches appended to the stream files since the last read."""
+
+        for file_name in sorted(glob.glob(os.path.join(self.path, '*.stream'))):
+            offset = self.__offsets.get(file_name, 0)
+            with open(file_name, 'rb') as fin:
+                fin.seek(offset)
+                data = fin.read()
+            pos = 0
+            while pos + _header.size <= len(data):
+                (size,) = _header.unpack_from(data, pos)
+                if pos + _header.size + size > len(data):
+                    break # the writer is appending this batch
+                start = pos + _header.size
+                self.__ingest(pickle.loads(data[start:start + size]))
+                pos = start + size
+            self.__offsets[file_name] = offset + pos
+
+    def __ingest(self, batch):
+        (module_name, phase_name, rows) = batch
+        key = (module_name, phase_name)
+
+        with self.__lock:
+            self.__chunks.setdefault(key, list()).append(rows)
+            self.__num_rows[key] = self.__num_rows.get(key, 0) + len(rows.index)
+
+        if self.callback is not None:
+            try:
+                self.callback(module_name, phase_name, rows)
+            except Exception:
+                if self.log is not None:
+                    self.log.exception('StreamCollector: callback failed on {}.{}'.format(
+                        module_name, phase_name))
+
+    def streams(self):
+        """Streams received so far.
+
+        Returns
+        -------
+        streams: list(tuple(str,str))
+            `(module name, phase name)` pairs.
+        """
+
+        with self.__lock:
+            return sorted(self.__num_rows)
+
+    def num_rows(self, module_name, phase_name=None):
+        """Number of rows received on a stream (see `view()` for the arguments)."""
+
+        with self.__lock:
+            key = self.__key(module_name, phase_name)
+            return self.__num_rows.get(key, 0) if key is not None else 0
+
+    def view(self, module_name, phase_name=None):
+        """Rows received so far on a stream.
+
+        Only the batches received since the previous view are concatenated; the frame
+        returned is not modified by later batches.
+
+        Parameters
+        ----------
+        module_name: str
+        phase_name: str or None
+            Default: the only stream of the module.
+
+        Returns
+        -------
+        rows: pandas.DataFrame or None
+            None if nothing was received on the stream.
+        """
+
+        with self.__lock:
+            key = self.__key(module_name, phase_name)
+            if key is None:
+                return None
+            chunks = self.__chunks.pop(key, list())
+            if chunks:
+                if key in self.__frames:
+                    chunks.insert(0, self.__frames[key])
+                self.__frames[key] = pandas.concat(chunks) if len(chunks) > 1 else chunks[0]
+            return self.__frames.get(key)
+
+    def __key(self, module_name, phase_name):
+        if phase_name is not None:
+            key = (module_name, phase_name)
+            return key if key in self.__num_rows else None
+
+        keys = [key for key in self.__num_rows if key[0] == module_name]
+        assert len(keys) <= 1, \
+            'module %r streams phases %r; give a phase name'%(module_name, [k[1] for k in keys])
+        return keys[0] if keys else None
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of the Cortix toolkit environment
+# https://cortix.org
+"""Topology-aware placement of modules onto workers and nodes.
+
+The network connectivity is a weighted graph: vertices are modules weighted by their
+load, edges are connections weighted by their message volume. Placement partitions the
+graph first across nodes and then across the workers of each node, so that as much of
+the traffic as possible stays on a node, and within a node on a worker, while the load
+is balanced. Partitioning is deterministic: every MPI rank computes the same result.
+"""
+
+import json
+import collections
+
+def network_graph(network):
+    """Build the weighted module graph of a network.
+
+    Edges come from the connections recorded by the network. An edge weight is the
+    declared volume (`Network.connect(..., volume=)`), else the volume measured in the
+    previous run (messages sent through its ports), else 1.
+
+    Parameters
+    ----------
+    network: Network
+
+    Returns
+    -------
+    edges: dict(tuple(int,int):float)
+        Undirected edges `(i, j)` with `i < j` mapped to their weight.
+    loads: list(float)
+        Load of each module; `Network.module_loads` or 1.
+    """
+
+    pairs = set(network._Network__edge_ports)
+    for edge in network.gv_edges:
+        pairs.add((int(edge[0]), int(edge[1])))
+    pairs.update(network.edge_volumes)
+    pairs.update(network.measured_volumes)
+
+    edges = collections.OrderedDict()
+    for (i, j) in sorted(pairs):
+        if i == j:
+            continue
+        if (i, j) in network.edge_volumes:
+            weight = network.edge_volumes[(i, j)]
+        elif (i, j) in network.measured_volumes:
+            weight = network.measured_volumes[(i, j)]
+        else:
+            weight = 1.0
+        key = (min(i, j), max(i, j))
+        edges[key] = edges.get(key, 0.0) + float(weight)
+
+    loads = [float(network.module_loads.get(i, 1.0)) for i in range(len(network.modules))]
+
+    return (edges, loads)
+
+def cut_weight(edges, assignment):
+    """Total weight of the edges whose ends are assigned to different parts."""
+
+    return sum(w for ((i, j), w) in edges.items() if assignment[i] != assignment[j])
+
+def partition(num_parts, edges, loads, capacities=None, imbalance=0.05, max_passes=10):
+    """Partition a weighted graph minimizing the cut under a load balance constraint.
+
+    A greedy graph-growing pass builds the parts one at a time from the most connected
+    free vertex; passes of single vertex moves and pairwise swaps then reduce the cut
+    while keeping each part load within its capacity.
+
+    Parameters
+    ----------
+    num_parts: int
+    edges: dict(tuple(int,int):float)
+    loads: list(float)
+        Vertex loads; the number of vertices is `len(loads)`.
+    capacities: list(float) or None
+        Relative capacity of each part (e.g. number of workers on a node). Default: equal.
+    imbalance: float
+        Allowed relative load excess over a part's share. Use 0 for exact fills.
+    max_passes: int
+
+    Returns
+    -------
+    assignment: list(int)
+        Part index of each vertex.
+    """
+
+    num = len(loads)
+    assert num_parts >= 1
+
+    if capacities is None:
+        capacities = [1.0] * num_parts
+    assert len(capacities) == num_parts
+
+    total = sum(loads)
+    share = [total * c / sum(capacities) for c in capacities]
+    limit = [s * (1.0 + imbalance) + 1.0e-9 for s in share]
+
+    adj = [dict() for _ in range(num)]
+    for ((i, j), w) in edges.items():
+        adj[i][j] = adj[i].get(j, 0.0) + w
+        adj[j][i] = adj[j].get(i, 0.0) + w
+
+    # Greedy graph growing
+    assignment = [-1] * num
+    part_load = [0.0] * num_parts
+    free = set(range(num))
+    degree = [sum(a.values()) for a in adj]
+
+    for part in range(num_parts):
+        if not free:
+            break
+        last = part == num_parts - 1
+        conn = dict() # free vertex: connection weight to this part
+        while free:
+            if conn:
+                v = max(conn, key=lambda u: (conn[u], -u))
+            else:
+                v = max(free, key=lambda u: (degree[u], -u))
+            if not last and part_load[part] > 0.0 and part_load[part] + loads[v] > limit[part]:
+                break
+            free.discard(v)
+            conn.pop(v, None)
+            assignment[v] = part
+            part_load[part] += loads[v]
+            for (u, w) in adj[v].items():
+                if u in free:
+                    conn[u] = conn.get(u, 0.0) + w
+            if not last and part_load[part] >= share[part]:
+                break
+
+    def gain(v, target):
+        own = assignment[v]
+        return sum(w for (u, w) in adj[v].items() if assignment[u] == target) - \
+               sum(w for (u, w) in adj[v].items() if assignment[u] == own)
+
+    for _ in range(max_passes):
+        improved = False
+
+        # Single vertex moves into parts with room
+        for v in range(num):
+            own = assignment[v]
+            targets = {assignment[u] for u in adj[v]} - {own}
+            best = None
+            for q in sorted(targets):
+                if part_load[q] + loads[v] > limit[q]:
+                    continue
+                g = gain(v, q)
+                if g > 1.0e-12 and (best is None or g > best[0]):
+                    best = (g, q)
+            if best is not None:
+                q = best[1]
+                assignment[v] = q
+                part_load[own] -= loads[v]
+                part_load[q] += loads[v]
+                improved = True
+
+        # Pairwise swaps of boundary vertices between parts (keeps loads when the vertex
+        # loads are equal)
+        boundary = collections.defaultdict(list) # (p, q): vertices of p adjacent to q
+        for v in range(num):
+            for q in sorted({assignment[u] for u in adj[v]} - {assignment[v]}):
+                boundary[(assignment[v], q)].append(v)
+
+        for (p, q) in sorted(boundary):
+            if p > q or (q, p) not in boundary:
+                continue
+            cand_p = sorted(boundary[(p, q)], key=lambda v: (-gain(v, q), v))
+            cand_q = sorted(boundary[(q, p)], key=lambda v: (-gain(v, p), v))
+            for (a, b) in zip(cand_p, cand_q):
+                if assignment[a] != p or assignment[b] != q:
+                    continue
+                g = gain(a, q) + gain(b, p) - 2.0 * adj[a].get(b, 0.0)
+                if g <= 1.0e-12:
+                    break
+                new_p = part_load[p] - loads[a] + loads[b]
+                new_q = part_load[q] - loads[b] + loads[a]
+                if new_p > limit[p] or new_q > limit[q]:
+                    continue
+                (assignment[a], assignment[b]) = (q, p)
+                (part_load[p], part_load[q]) = (new_p, new_q)
+                improved = True
+
+        if not improved:
+            break
+
+    return assignment
+
+def place(edges, loads, workers, imbalance=0.05):
+    """Place modules onto workers grouped by node.
+
+    Parameters
+    ----------
+    edges: dict(tuple(int,int):float)
+    loads: list(float)
+    workers: list(str)
+        Node label of each worker (e.g. host name); workers with the same label share a node.
+    imbalance: float
+
+    Returns
+    -------
+    placement: dict(int:int)
+        Module index mapped to worker index.
+    """
+
+    nodes = list(collections.OrderedDict.fromkeys(workers))
+    node_workers = [[w for (w, label) in enumerate(workers) if label == node] for node in nodes]
+
+    by_node = partition(len(nodes), edges, loads,
+                        capacities=[len(ws) for ws in node_workers], imbalance=imbalance)
+
+    placement = dict()
+    for (n, ws) in enumerate(node_workers):
+        members = [i for i in range(len(loads)) if by_node[i] == n]
+        local = {m: k for (k, m) in enumerate(members)}
+        sub_edges = {(local[i], local[j]): w for ((i, j), w) in edges.items()
+                     if i in local and j in local}
+        by_worker = partition(len(ws), sub_edges, [loads[m] for m in members],
+                              imbalance=imbalance)
+        for (k, m) in enumerate(members):
+            placement[m] = ws[by_worker[k]]
+
+    return placement
+
+def report(edges, loads, placement, workers):
+    """Summarize a placement.
+
+    Returns
+    -------
+    summary: dict
+        'placement', 'cut_weight' across workers, 'node_cut_weight' across nodes,
+        'total_weight' and 'worker_loads'.
+    """
+
+    node_of = {m: workers[w] for (m, w) in placement.items()}
+    worker_loads = [0.0] * len(workers)
+    for (m, w) in placement.items():
+        worker_loads[w] += loads[m]
+
+    return {'placement': {int(m): int(w) for (m, w) in placement.items()},
+            'cut_weight': cut_weight(edges, placement),
+            'node_cut_weight': cut_weight(edges, node_of),
+            'total_weight': sum(edges.values()),
+            'worker_loads': worker_loads}
+
+def write_placement(file_name, summary):
+    """Write a placement summary (see `report`) to a JSON file."""
+
+    with open(file_name, 'w') as fout:
+        json.dump(summary, fout, indent=1)
+
+def read_placement(file_name):
+    """Read a pinned placement from a JSON file written by `write_placement`.
+
+    Returns
+    -------
+    placement: dict(int:int)
+    """
+
+    with open(file_name) as fin:
+        summary = json.load(fin)
+    return {int(m): int(w) for (m, w) in summary['placement'].items()}
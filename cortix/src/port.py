@@ -30,6 +30,23 @@ class Port:
             id: int
             name: string
             use_mpi: bool
+            channel: SocketChannel, SharedMemoryChannel, QueueChannel, InProcessChannel,
+                     BoundaryChannel or None
+                Connection to the connected port when running with the socket
+                transport, with hybrid MPI, through a bounded queue, or in a nested
+                network. Default: None.
+            num_sent: int
+                Number of messages sent through the port; weighs the connection for
+                automatic placement in later runs.
+            lag: int
+                1 for lag-one (pipelined) coupling with the connected port: receives
+                return the message of the previous exchange while the current one is
+                in flight (see `cortix.src.lag_buffer`); 0 for lock-step. Set by
+                `Network.connect()`. Default: 0.
+            pipe_required: bool
+                True once `Network.run()` opened the pipe of the port for the module
+                processes (multiprocessing only): a port without a pipe then raises
+                instead of opening a pipe no other process holds. Default: False.
         """
 
         self.id = None
@@ -42,8 +59,13 @@ class Port:
             self.rank = None
         else:
             self.pipe = None
+            self.pipe_required = False
 
         self.connected_port = None
+        self.channel = None
+        self.num_sent = 0
+        self.lag = 0
+        self.__lag_buffer = None
 
     def connect(self, port):
         """Connect this port to another port
@@ -66,13 +88,37 @@ class Port:
         port.connected_port = self
         port.use_mpi = self.use_mpi
 
+        # The OS pipe is opened when the network runs (or on first use); connections of
+        # large networks do not hold file descriptors while being built
         if not port.use_mpi:
-            (self.pipe, port.pipe) = Pipe()
+            self.pipe = None
+            port.pipe = None
+
+    def open_pipe(self):
+        """Open the pipe to the connected port unless it is open (multiprocessing only).
+
+        Must be called before the module processes are started; `Network.run()` does it.
+        """
+
+        if self.connected_port and self.pipe is None:
+            (self.pipe, self.connected_port.pipe) = Pipe()
+
+    def __use_pipe(self):
+        """The pipe to the connected port; opened on first use outside a network run."""
+
+        if self.pipe is None:
+            if self.pipe_required:
+                raise RuntimeError('port {} has no pipe to port {}; pipes are opened by '
+                                   'Network.run() before the module processes start'.format(
+                                       self.name, self.connected_port.name))
+            self.open_pipe()
+
+        return self.pipe
 
     def send(self, data, tag=None):
         """Send data to the connected port.
 
-        If the sending port is not connected do nothing.
+        If the sending port is not connected (and has no channel) do nothing.
 
         Parameters
         ----------
@@ -82,18 +128,29 @@ class Port:
            MPI tag used in sending data.
         """
 
-        if not tag:
-            tag = self.id
-
-        if self.connected_port:
-            if self.use_mpi:
-                # This is an MPI blocking send
-                self.comm.send(data, dest=self.connected_port.rank, tag=tag)
+        if self.connected_port or self.channel is not None:
+            if self.lag:
+                self.__get_lag_buffer().send(data)
             else:
-                self.pipe.send(data)
+                self.__send(data, tag)
+            self.num_sent += 1
 
         return
 
+    def __send(self, data, tag=None):
+        """Blocking send through the transport of the port."""
+
+        if not tag:
+            tag = self.id
+
+        if self.channel is not None:
+            self.channel.send(data)
+        elif self.use_mpi:
+            # This is an MPI blocking send
+            self.comm.send(data, dest=self.connected_port.rank, tag=tag)
+        else:
+            self.__use_pipe().send(data)
+
     def __is_connected(self):
         """Check for a connected port.
 
@@ -125,16 +182,76 @@ class Port:
         data: any
         """
 
-        if self.connected_port:
-            if self.use_mpi:
-                # This is an MPI blocking receive
-                return self.comm.recv(source=self.connected_port.rank,
-                        tag=self.connected_port.id)
-            else:
-                return self.pipe.recv()
+        if self.connected_port or self.channel is not None:
+            if self.lag:
+                return self.__get_lag_buffer().recv()
+            return self.__recv()
 
         return
 
+    def __recv(self):
+        """Blocking receive through the transport of the port."""
+
+        if self.channel is not None:
+            return self.channel.recv()
+        elif self.use_mpi:
+            # This is an MPI blocking receive
+            return self.comm.recv(source=self.connected_port.rank,
+                    tag=self.connected_port.id)
+        else:
+            return self.__use_pipe().recv()
+
+    def __get_lag_buffer(self):
+        if self.__lag_buffer is None:
+            # Import here: only lagged ports need transfer threads
+            from cortix.src.lag_buffer import LagBuffer
+            self.__lag_buffer = LagBuffer(self.__send, self.__recv)
+        return self.__lag_buffer
+
+    def sync(self):
+        """End a lagged exchange: return the message still in flight.
+
+        Receives that follow return messages in order, as in lock-step coupling. A port
+        without lag has no message in flight.
+
+        Returns
+        -------
+        data: any
+            None without lag.
+        """
+
+        if self.lag and (self.connected_port or self.channel is not None):
+            return self.__get_lag_buffer().sync()
+
+        return None
+
+    def flush(self):
+        """Wait until the messages sent by a lagged port are handed to the transport.
+
+        Called when the module finishes running; no effect without lag.
+        """
+
+        if self.__lag_buffer is not None:
+            self.__lag_buffer.flush()
+
+    def close(self):
+        """Deliver the messages of a lagged port and stop its transfer threads.
+
+        Called when the module finishes running, so that a port of a nested module
+        leaves the parent module port to the parent; no effect without lag.
+        """
+
+        if self.__lag_buffer is not None:
+            self.__lag_buffer.close()
+            self.__lag_buffer = None
+
+    def __getstate__(self):
+        """Pickle without the transfer threads of a lagged port."""
+
+        state = self.__dict__.copy()
+        state['_Port__lag_buffer'] = None
+        return state
+
     def __eq__(self, other):
         """Check for port equality."""
 
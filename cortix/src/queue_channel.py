@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of the Cortix toolkit environment
+# https://cortix.org
+"""Bounded message queues between module processes with backpressure.
+
+A `QueueChannel` is one end of a duplex connection made of two bounded
+`multiprocessing.Queue` objects, one per direction. When the queue a port writes to
+holds `depth` messages, the sender applies the connection policy:
+
+    'block'            wait until the receiver takes a message (lossless).
+    'drop-oldest'      discard the oldest queued message to make room.
+    'coalesce-latest'  discard all queued messages; the receiver gets only the latest.
+
+The two lossy policies decouple a fast producer (e.g. a module sending to a plotting
+module every time step) from a slow consumer without stalling the producer. Each end
+counts the time spent blocked on a full queue and the messages dropped or coalesced.
+"""
+
+import time
+import queue
+
+class QueueChannel:
+    """One end of a bounded duplex connection between two ports."""
+
+    policies = ('block', 'drop-oldest', 'coalesce-latest')
+
+    def __init__(self, out_queue, in_queue, depth, policy='block'):
+        """Constructs a QueueChannel object; use `QueueChannel.pair()` instead.
+
+        Parameters
+        ----------
+        out_queue: multiprocessing.Queue
+            Queue this end sends to; bounded to `depth` messages.
+        in_queue: multiprocessing.Queue
+            Queue this end receives from.
+        depth: int
+        policy: str
+            One of `QueueChannel.policies`.
+
+        Attributes
+        ----------
+        blocked_time: float
+            Seconds spent in `send` waiting on a full queue.
+        num_blocked: int
+            Number of sends that found the queue full and waited.
+        num_dropped: int
+            Messages discarded by the 'drop-oldest' policy.
+        num_coalesced: int
+            Messages discarded by the 'coalesce-latest' policy.
+        """
+
+        assert depth >= 1, 'queue depth must be positive; got %r'%depth
+        assert policy in QueueChannel.policies, \
+            'policy must be one of %r; got %r'%(QueueChannel.policies, policy)
+
+        self.out_queue = out_queue
+        self.in_queue = in_queue
+        self.depth = depth
+        self.policy = policy
+
+        self.blocked_time = 0.0
+        self.num_blocked = 0
+        self.num_dropped = 0
+        self.num_coalesced = 0
+
+        self.__pending = list() # messages taken off the in queue by `poll`
+
+    @classmethod
+    def pair(cls, ctx, depth, policy='block'):
+        """Create the two ends of a connection.
+
+        Parameters
+        ----------
+        ctx: multiprocessing context
+            Context of the module processes (queues must be created with the same start
+            method as the processes sharing them).
+        depth: int
+            Maximum number of messages queued in each direction.
+        policy: str
+            Backpressure policy, one of `QueueChannel.policies`.
+
+        Returns
+        -------
+        (end_a, end_b): tuple(QueueChannel, QueueChannel)
+        """
+
+        a_to_b = ctx.Queue(depth)
+        b_to_a = ctx.Queue(depth)
+
+        return (cls(a_to_b, b_to_a, depth, policy), cls(b_to_a, a_to_b, depth, policy))
+
+    def send(self, data):
+        """Send `data` (must be pickleable) applying the policy when the queue is full."""
+
+        try:
+            self.out_queue.put_nowait(data)
+            return
+        except queue.Full:
+            pass
+
+        if self.policy == 'block':
+            start = time.perf_counter()
+            self.out_queue.put(data)
+            self.blocked_time += time.perf_counter() - start
+            self.num_blocked += 1
+            return
+
+        # Lossy policies: the sender takes messages back off the full queue; the receiver
+        # may be taking some at the same time, so retry until the message fits
+        while True:
+            if self.policy == 'drop-oldest':
+                discard = 1
+            else:
+                discard = self.depth
+            for _ in range(discard):
+                try:
+                    self.out_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if self.policy == 'drop-oldest':
+                    self.num_dropped += 1
+                else:
+                    self.num_coalesced += 1
+            try:
+                self.out_queue.put_nowait(data)
+                return
+            except queue.Full:
+                continue
+
+    def recv(self):
+        """Receive the next message; blocks until one is available."""
+
+        if self.__pending:
+            return self.__pending.pop(0)
+        return self.in_queue.get()
+
+    def poll(self, timeout=0.0):
+        """Return True if data is available to be received within `timeout` seconds."""
+
+        if self.__pending:
+            return True
+        try:
+            self.__pending.append(self.in_queue.get(timeout=timeout))
+        except queue.Empty:
+            return False
+        return True
+
+    def flush(self):
+        """Messages are queued when sent; nothing to flush."""
+
+        return
+
+    def stats(self):
+        """Counters of this end as a dict."""
+
+        return {'depth': self.depth, 'policy': self.policy,
+                'blocked_time': self.blocked_time, 'num_blocked': self.num_blocked,
+                'num_dropped': self.num_dropped, 'num_coalesced': self.num_coalesced}
+
+    def close(self):
+        """Stop using the queues.
+
+        With a lossy policy the receiver may never take the last messages; do not wait
+        for them to be written out when the process exits.
+        """
+
+        if self.policy != 'block':
+            self.out_queue.cancel_join_thread()
@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of the Cortix toolkit environment
+# https://cortix.org
+"""Recording of port messages and standalone replay of a module.
+
+With `Network.record(path)`, each recorded module writes `<path>/<name>_<index>.rec`:
+a snapshot of the module when its run starts, then every message it receives, with
+the port name and the time since the start. The file is a gzip stream of pickles, so
+received data (e.g. NumPy arrays) is replayed bit for bit.
+
+`replay()` runs the module alone in the calling process: it is rebuilt from the
+snapshot (or given), its ports return the recorded messages in order, and what it
+sends is collected instead of delivered. A single expensive module can thus be
+profiled or benchmarked in isolation, as fast as it computes or at the recorded
+message arrival times.
+
+Example
+-------
+    network.record('recordings', modules=[reactor])
+    cortix.run()
+    ...
+    result = replay('recordings/Reactor_0.rec')
+    print(result.elapsed, result.sent['coolant'][:3])
+"""
+
+import os
+import gzip
+import time
+import pickle
+import logging
+
+_version = 1
+
+class PortRecorder:
+    """Writes the recording of a module; created by the network for each module."""
+
+    def __init__(self, file_name):
+        """Constructs a PortRecorder object.
+
+        Parameters
+        ----------
+        file_name: str
+        """
+
+        self.file_name = file_name
+
+        self.__file = None
+        self.__start = None
+
+    def start(self, module):
+        """Open the recording and write the snapshot of `module` before it runs."""
+
+        directory = os.path.dirname(self.file_name)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # The snapshot leaves out ports and runtime links; replay recreates the ports
+        state = module.__getstate__()
+        for key in ('ports', 'log', 'log_queue', 'recorder', 'stream_sink', 'convergence'):
+            if key in state:
+                state[key] = list() if key == 'ports' else None
+        port_names = [port.name for port in module.ports]
+        try:
+            snapshot = pickle.dumps((module.__class__, state),
+                                    protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            snapshot = None # replay needs the module given
+
+        self.__file = gzip.open(self.file_name, 'wb', compresslevel=1)
+        self.__write(('header', _version, module.name, port_names, snapshot))
+        self.__start = time.perf_counter()
+
+    def record(self, port_name, data):
+        """Append a received message."""
+
+        if self.__file is not None:
+            self.__write((port_name, time.perf_counter() - self.__start, data))
+
+    def close(self):
+        """Close the recording."""
+
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+    def __write(self, item):
+        payload = pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)
+        self.__file.write(len(payload).to_bytes(8, 'little') + payload)
+
+    def __getstate__(self):
+        """Pickle without the open file."""
+
+        state = self.__dict__.copy()
+        state['_PortRecorder__file'] = None
+        return state
+
+class Recording:
+    """Contents of a recording file."""
+
+    def __init__(self, file_name):
+        """Load a recording.
+
+        Parameters
+        ----------
+        file_name: str
+
+        Attributes
+        ----------
+        module_name: str
+        port_names: list(str)
+            Ports of the module, in order.
+        messages: list(tuple(str, float, any))
+            `(port name, seconds since the start, data)` of every message received, in
+            order.
+        """
+
+        self.file_name = file_name
+        self.messages = list()
+
+        with gzip.open(file_name, 'rb') as fin:
+            data = fin.read()
+
+        items = list()
+        pos = 0
+        while pos + 8 <= len(data):
+            size = int.from_bytes(data[pos:pos+8], 'little')
+            if pos + 8 + size > len(data):
+                break # the recording was cut short
+            items.append(pickle.loads(data[pos+8:pos+8+size]))
+            pos += 8 + size
+
+        assert items and items[0][0] == 'header', 'not a recording: %r'%file_name
+        (_, version, self.module_name, self.port_names, self.__snapshot) = items[0]
+        assert version == _version, 'unsupported recording version %r'%version
+        self.messages = items[1:]
+
+    def module(self):
+        """New module in the state it had when the recorded run started."""
+
+        assert self.__snapshot is not None, \
+            'module %r could not be pickled when recording; give the module to replay'% \
+            self.module_name
+        (cls, state) = pickle.loads(self.__snapshot)
+        module = cls.__new__(cls)
+        module.__dict__.update(state)
+
+        return module
+
+    def port_messages(self):
+        """Messages by port name.
+
+        Returns
+        -------
+        messages: dict(str:list(tuple(float, any)))
+        """
+
+        by_port = {name: list() for name in self.port_names}
+        for (port_name, offset, data) in self.messages:
+            by_port.setdefault(port_name, list()).append((offset, data))
+
+        return by_port
+
+class ReplayChannel:
+    """Port channel returning recorded messages and collecting sent ones."""
+
+    def __init__(self, port_name, messages, sent, start, realtime):
+        self.port_name = port_name
+        self.messages = messages
+        self.sent = sent
+        self.start = start
+        self.realtime = realtime
+        self.__next = 0
+
+    def send(self, data):
+        self.sent.append(data)
+
+    def recv(self):
+        if self.__next >= len(self.messages):
+            raise RuntimeError('replay: the recording of port {} has no more messages '
+                               '({} received)'.format(self.port_name, self.__next))
+        (offset, data) = self.messages[self.__next]
+        self.__next += 1
+
+        if self.realtime:
+            delay = self.start[0] + offset - time.perf_counter()
+            if delay > 0.0:
+                time.sleep(delay)
+
+        return data
+
+    def flush(self):
+        return
+
+    def close(self):
+        return
+
+    def num_left(self):
+        return len(self.messages) - self.__next
+
+class ReplayResult:
+    """Outcome of a replay.
+
+    Attributes
+    ----------
+    module: Module
+        The module after its run.
+    sent: dict(str:list)
+        Messages the module sent, by port name.
+    num_received: int
+        Recorded messages the module received.
+    num_left: int
+        Recorded messages the module did not receive.
+    elapsed: float
+        Wall clock seconds of the run.
+    """
+
+    def __init__(self, module, sent, num_received, num_left, elapsed):
+        self.module = module
+        self.sent = sent
+        self.num_received = num_received
+        self.num_left = num_left
+        self.elapsed = elapsed
+
+def replay(file_name, module=None, realtime=False, log=None):
+    """Run a recorded module alone, its ports fed from the recording.
+
+    Parameters
+    ----------
+    file_name: str
+        Recording written by a network run with `Network.record()`.
+    module: Module or None
+        Module to run, in the state of the recorded run start. Default: rebuilt from
+        the snapshot in the recording.
+    realtime: bool
+        Deliver each message no earlier than its recorded time since the start;
+        default: as soon as the module asks.
+    log: logging.Logger or None
+        Logger passed to the module run. Default: logger 'cortix-replay'.
+
+    Returns
+    -------
+    result: ReplayResult
+    """
+
+    recording = Recording(file_name)
+    if module is None:
+        module = recording.module()
+
+    if log is None:
+        log = logging.getLogger('cortix-replay')
+
+    module.use_mpi = False
+    module.log = log
+    start = [None]
+    sent = dict()
+    channels = list()
+    by_port = recording.port_messages()
+    for name in list(recording.port_names) + sorted(set(by_port) - set(recording.port_names)):
+        port = module.get_port(name)
+        port.lag = 0 # recorded messages are those the module received after any lag
+        sent[name] = list()
+        port.channel = ReplayChannel(name, by_port.get(name, list()), sent[name], start,
+                                     realtime)
+        channels.append(port.channel)
+
+    start[0] = time.perf_counter()
+    module.run((log, None))
+    elapsed = time.perf_counter() - start[0]
+
+    for port in module.ports:
+        port.channel = None
+
+    num_left = sum(channel.num_left() for channel in channels)
+    num_received = len(recording.messages) - num_left
+
+    return ReplayResult(module, sent, num_received, num_left, elapsed)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of the Cortix toolkit environment
+# https://cortix.org
+"""Shared memory channels between module processes on the same host.
+
+A `SharedMemoryRing` is a single-producer single-consumer byte ring held in a
+`multiprocessing.shared_memory.SharedMemory` segment. The writer owns a running count of
+bytes written (tail) and the reader owns a running count of bytes read (head); each side
+only ever stores its own counter, so no lock is needed. Messages larger than the ring are
+streamed through it in pieces.
+
+A `SharedMemoryChannel` pairs an outgoing and an incoming ring into the duplex
+connection a `Port` expects, exchanging length-prefixed pickled messages.
+"""
+
+import sys
+import time
+import struct
+import pickle
+from multiprocessing import shared_memory
+from multiprocessing import resource_tracker
+
+_COUNTER = struct.Struct('<Q')
+_HEADER = struct.Struct('!Q')
+
+_HEAD_OFFSET = 0   # bytes read; stored by the reader
+_TAIL_OFFSET = 64  # bytes written; stored by the writer (separate cache line)
+_DATA_OFFSET = 128
+
+def _backoff(count):
+    """Wait a little longer each time a ring is found full or empty."""
+
+    if count < 100:
+        return
+    elif count < 1000:
+        time.sleep(0)
+    else:
+        time.sleep(min(1.0e-3, 1.0e-6 * (count - 999)))
+
+class SharedMemoryRing:
+    """Single-producer single-consumer byte ring in a shared memory segment."""
+
+    def __init__(self, shm, capacity, owner):
+        """Use `SharedMemoryRing.create()` or `SharedMemoryRing.attach()` instead."""
+
+        self.shm = shm
+        self.name = shm.name
+        self.capacity = capacity
+        self.owner = owner
+        self.__buf = shm.buf
+
+    @classmethod
+    def create(cls, name, capacity=1024*1024):
+        """Create a ring segment named `name` holding `capacity` bytes."""
+
+        assert capacity > 0
+        shm = shared_memory.SharedMemory(name=name, create=True, size=_DATA_OFFSET + capacity)
+        _COUNTER.pack_into(shm.buf, _HEAD_OFFSET, 0)
+        _COUNTER.pack_into(shm.buf, _TAIL_OFFSET, 0)
+        return cls(shm, capacity, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """Attach to the ring segment `name` created by another process."""
+
+        # The creator is responsible for unlinking; keep the segment out of this process'
+        # resource tracker, which would unlink it when this process exits
+        if sys.version_info >= (3, 13):
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            shm = shared_memory.SharedMemory(name=name) # registers the segment
+            # A tracker inherited from a multiprocessing parent is the creator's one:
+            # registering again changed nothing, unregistering would drop its entry
+            if resource_tracker._resource_tracker._pid is not None:
+                resource_tracker.unregister(shm._name, 'shared_memory')
+        return cls(shm, shm.size - _DATA_OFFSET, owner=False)
+
+    def __head(self):
+        return _COUNTER.unpack_from(self.__buf, _HEAD_OFFSET)[0]
+
+    def __tail(self):
+        return _COUNTER.unpack_from(self.__buf, _TAIL_OFFSET)[0]
+
+    def write(self, data):
+        """Write all of `data` (bytes-like); blocks while the ring is full."""
+
+        data = memoryview(data).cast('B')
+        size = len(data)
+        tail = self.__tail()
+        pos = 0
+        count = 0
+        while pos < size:
+            free = self.capacity - (tail - self.__head())
+            if free == 0:
+                count += 1
+                _backoff(count)
+                continue
+            count = 0
+            start = tail % self.capacity
+            nbytes = min(free, size - pos, self.capacity - start)
+            self.__buf[_DATA_OFFSET + start:_DATA_OFFSET + start + nbytes] = data[pos:pos + nbytes]
+            pos += nbytes
+            tail += nbytes
+            _COUNTER.pack_into(self.__buf, _TAIL_OFFSET, tail)
+
+    def read(self, size):
+        """Read exactly `size` bytes; blocks while the ring is empty."""
+
+        out = bytearray(size)
+        head = self.__head()
+        pos = 0
+        count = 0
+        while pos < size:
+            available = self.__tail() - head
+            if available == 0:
+                count += 1
+                _backoff(count)
+                continue
+            count = 0
+            start = head % self.capacity
+            nbytes = min(available, size - pos, self.capacity - start)
+            out[pos:pos + nbytes] = self.__buf[_DATA_OFFSET + start:_DATA_OFFSET + start + nbytes]
+            pos += nbytes
+            head += nbytes
+            _COUNTER.pack_into(self.__buf, _HEAD_OFFSET, head)
+        return out
+
+    def available(self):
+        """Number of bytes written and not read yet."""
+
+        return self.__tail() - self.__head()
+
+    def unlink(self):
+        """Remove the segment name; attached processes keep their mapping."""
+
+        if self.owner:
+            self.shm.unlink()
+            self.owner = False
+
+    def close(self):
+        """Release this process' mapping of the segment."""
+
+        self.__buf = None
+        self.shm.close()
+
+class SharedMemoryChannel:
+    """Duplex message channel over two shared memory rings."""
+
+    def __init__(self, out_ring, in_ring):
+        """Constructs a SharedMemoryChannel object.
+
+        Parameters
+        ----------
+        out_ring: SharedMemoryRing
+            Ring this end writes to.
+        in_ring: SharedMemoryRing
+            Ring this end reads from.
+        """
+
+        self.out_ring = out_ring
+        self.in_ring = in_ring
+
+    def send(self, data):
+        """Send `data` (must be pickleable)."""
+
+        payload = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        self.out_ring.write(_HEADER.pack(len(payload)))
+        self.out_ring.write(payload)
+
+    def recv(self):
+        """Receive the next message; blocks until one is available."""
+
+        (size,) = _HEADER.unpack(self.in_ring.read(_HEADER.size))
+        return pickle.loads(self.in_ring.read(size))
+
+    def poll(self, timeout=0.0):
+        """Return True if data is available to be received within `timeout` seconds."""
+
+        end = time.time() + timeout
+        count = 0
+        while not self.in_ring.available():
+            if time.time() >= end:
+                return False
+            count += 1
+            _backoff(count)
+        return True
+
+    def flush(self):
+        """Messages are written when sent; nothing to flush."""
+
+        return
+
+    def close(self):
+        """Release both rings."""
+
+        for ring in (self.out_ring, self.in_ring):
+            ring.unlink()
+            ring.close()
@@ -0,0 +1,485 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of the Cortix toolkit environment
+# https://cortix.org
+"""TCP socket transport for running Cortix networks across hosts without MPI.
+
+The root process (the one running `Cortix`) listens on a control address. Worker
+processes, started with `cortix-worker --connect host:port` on any host (or spawned
+locally by Cortix), connect to it and receive the modules placed on them. Every module
+runs in its own process on its worker host; each pair of connected ports is a framed
+TCP stream between the two module processes with Nagle's algorithm disabled.
+
+A frame is an 8-byte big-endian length followed by a pickled object.
+"""
+
+import os
+import sys
+import socket
+import struct
+import pickle
+import logging
+import threading
+import subprocess
+import queue
+
+_HEADER = struct.Struct('!Q')
+
+def send_frame(sock, obj):
+    """Send one pickled object as a length-prefixed frame.
+
+    Parameters
+    ----------
+    sock: socket.socket
+    obj: any
+        Must be pickleable.
+    """
+
+    payload = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+def recv_exact(sock, size):
+    """Receive exactly `size` bytes; raise `EOFError` if the stream closes first."""
+
+    buf = bytearray(size)
+    view = memoryview(buf)
+    pos = 0
+    while pos < size:
+        nbytes = sock.recv_into(view[pos:], size - pos)
+        if nbytes == 0:
+            raise EOFError('socket closed by peer')
+        pos += nbytes
+    return buf
+
+def recv_frame(sock):
+    """Receive one frame and return the unpickled object."""
+
+    (size,) = _HEADER.unpack(recv_exact(sock, _HEADER.size))
+    return pickle.loads(recv_exact(sock, size))
+
+def parse_address(address):
+    """Convert a 'host:port' string into a `(host, port)` tuple."""
+
+    assert isinstance(address, str) and ':' in address, \
+        'address must be of the form host:port; got %r'%address
+    (host, port) = address.rsplit(':', 1)
+    return (host, int(port))
+
+class SocketChannel:
+    """One end of a framed TCP stream connecting two ports.
+
+    Sends are batched: frames are accumulated in a buffer and written with a single
+    `sendall` when either `batch_size` frames or `batch_bytes` bytes are pending. All
+    channels of a process are flushed before any channel blocks on a receive, so
+    batching cannot deadlock a send/recv exchange between modules.
+
+    A channel may be used from several threads (a lagged port sends and receives in
+    transfer threads, see `cortix.src.lag_buffer`, while other receives flush every
+    channel). One thread at a time writes; it takes whole batches from the buffer
+    under a lock and writes them outside of it, so that a thread blocked in `sendall`
+    never holds the lock other threads need to queue messages.
+    """
+
+    _channels = list() # all open channels in this process
+    _channels_lock = threading.Lock()
+
+    def __init__(self, sock, batch_size=1, batch_bytes=64*1024):
+        """Constructs a SocketChannel object.
+
+        Parameters
+        ----------
+        sock: socket.socket
+            A connected TCP socket.
+        batch_size: int
+            Number of messages accumulated before a write. Default: 1 (no batching).
+        batch_bytes: int
+            Number of bytes accumulated before a write. Default: 64 kB.
+        """
+
+        assert batch_size >= 1
+
+        self.sock = sock
+        if sock.family in (socket.AF_INET, socket.AF_INET6):
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.batch_size = batch_size
+        self.batch_bytes = batch_bytes
+
+        self.__buffer = list()
+        self.__buffer_bytes = 0
+        self.__cond = threading.Condition()
+        self.__writing = False # a thread is writing batches taken from the buffer
+
+        with SocketChannel._channels_lock:
+            SocketChannel._channels.append(self)
+
+    def send(self, data):
+        """Queue `data` for sending; write out the batch when it is full."""
+
+        payload = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.__cond:
+            self.__buffer.append(_HEADER.pack(len(payload)))
+            self.__buffer.append(payload)
+            self.__buffer_bytes += _HEADER.size + len(payload)
+            full = len(self.__buffer)//2 >= self.batch_size or \
+                   self.__buffer_bytes >= self.batch_bytes
+
+        if full:
+            self.__drain(wait=False)
+
+    def flush(self):
+        """Write out all pending messages; return when they are written."""
+
+        self.__drain(wait=True)
+
+    def __drain(self, wait):
+        """Write the buffer until it is empty.
+
+        If another thread is writing, it also writes what is queued now; with `wait`
+        return only when it is done, otherwise return at once.
+        """
+
+        with self.__cond:
+            if self.__writing:
+                if wait:
+                    self.__cond.wait_for(lambda: not self.__writing)
+                return
+            self.__writing = True
+
+        try:
+            while True:
+                with self.__cond:
+                    if not self.__buffer:
+                        # Under the same lock as the check: a message queued later
+                        # finds no writer and is written by its sender
+                        self.__writing = False
+                        self.__cond.notify_all()
+                        return
+                    data = b''.join(self.__buffer)
+                    self.__buffer = list()
+                    self.__buffer_bytes = 0
+                self.sock.sendall(data)
+        except BaseException:
+            with self.__cond:
+                self.__writing = False
+                self.__cond.notify_all()
+            raise
+
+    def recv(self):
+        """Receive the next message; blocks until one is available."""
+
+        SocketChannel.flush_all()
+        return recv_frame(self.sock)
+
+    def poll(self, timeout=0.0):
+        """Return True if data is available to be received within `timeout` seconds."""
+
+        import select
+        (readable, _, _) = select.select([self.sock], [], [], timeout)
+        return bool(readable)
+
+    def close(self):
+        """Flush, signal end of stream, and wait for the peer to finish with the stream.
+
+        Data sent by the peer after this end stopped reading is discarded, so that a peer
+        still running does not get a connection reset.
+        """
+
+        with SocketChannel._channels_lock:
+            if self in SocketChannel._channels:
+                SocketChannel._channels.remove(self)
+        try:
+            self.flush()
+            self.sock.shutdown(socket.SHUT_WR)
+            while self.sock.recv(64*1024):
+                pass
+        except OSError:
+            pass
+        finally:
+            self.sock.close()
+
+    @classmethod
+    def flush_all(cls):
+        """Flush every open channel in this process.
+
+        A channel another thread is writing is left to that thread, which writes all
+        its pending messages; waiting for it could deadlock a writer blocked until
+        this thread receives.
+        """
+
+        with cls._channels_lock:
+            channels = list(cls._channels)
+        for channel in channels:
+            channel.__drain(wait=False)
+
+def connect_ports(ports_table, listen_sock, address_book, batch_size=1):
+    """Open the TCP streams of a module's ports.
+
+    Parameters
+    ----------
+    ports_table: dict(str:tuple)
+        Port name mapped to `(pair_id, peer_module_id, role)` where role is 'listen'
+        or 'connect'.
+    listen_sock: socket.socket
+        The module process listening socket; already bound and listening.
+    address_book: dict(int:tuple)
+        Module id mapped to the `(host, port)` of its listening socket.
+    batch_size: int
+        See `SocketChannel`.
+
+    Returns
+    -------
+    channels: dict(str:SocketChannel)
+        Port name mapped to its channel.
+    """
+
+    channels = dict()
+    by_pair = dict()
+
+    # Connecting first never blocks: the peer's listen backlog holds the connection
+    for (name, (pair_id, peer_id, role)) in ports_table.items():
+        if role == 'connect':
+            sock = socket.create_connection(address_book[peer_id])
+            send_frame(sock, pair_id)
+            channels[name] = SocketChannel(sock, batch_size=batch_size)
+        else:
+            by_pair[pair_id] = name
+
+    while by_pair:
+        (sock, _) = listen_sock.accept()
+        pair_id = recv_frame(sock)
+        name = by_pair.pop(pair_id)
+        channels[name] = SocketChannel(sock, batch_size=batch_size)
+
+    return channels
+
+def port_tables(modules):
+    """Compute, for every module, the socket role of each of its connected ports.
+
+    Parameters
+    ----------
+    modules: list(Module)
+
+    Returns
+    -------
+    tables: dict(int:dict)
+        Module index mapped to a `connect_ports` ports table.
+    """
+
+    owner = dict()
+    for (idx, mod) in enumerate(modules):
+        for port in mod.ports:
+            owner[id(port)] = (idx, port.name)
+
+    tables = {idx: dict() for idx in range(len(modules))}
+    pair_ids = dict()
+
+    for (idx, mod) in enumerate(modules):
+        for port in mod.ports:
+            if not port.connected_port:
+                continue
+            assert id(port.connected_port) in owner, \
+                'port %r of module %r is connected to a port outside the network'%(port.name,
+                                                                                   mod.name)
+            this_end = (idx, port.name)
+            peer_end = owner[id(port.connected_port)]
+            key = (min(this_end, peer_end), max(this_end, peer_end))
+            if key not in pair_ids:
+                pair_ids[key] = len(pair_ids)
+            role = 'listen' if this_end < peer_end else 'connect'
+            tables[idx][port.name] = (pair_ids[key], peer_end[0], role)
+
+    return tables
+
+class WorkerPool:
+    """Root side of the socket transport: accepts workers and runs modules on them."""
+
+    def __init__(self, address, num_workers, log, spawn_local_workers=False, timeout=60.0):
+        """Constructs a WorkerPool object and waits for the workers to connect.
+
+        Parameters
+        ----------
+        address: str
+            'host:port' the root listens on. Port 0 selects a free port.
+        num_workers: int
+            Number of workers expected to connect.
+        log: logging.Logger
+            Root logger; worker and module records are forwarded into it.
+        spawn_local_workers: bool
+            Start `num_workers` worker processes on this host.
+        timeout: float
+            Seconds to wait for all workers to connect.
+        """
+
+        assert num_workers >= 1
+
+        self.log = log
+        self.num_workers = num_workers
+        self.workers = list()
+        self.hosts = list() # host name of each worker
+        self.processes = list()
+        self.__inbox = queue.Queue()
+        self.__done = set()
+
+        self.server = socket.create_server(parse_address(address))
+        self.address = '{}:{}'.format(*self.server.getsockname()[:2])
+        self.log.info('WorkerPool listening on {} for {} worker(s)'.format(self.address,
+                                                                             num_workers))
+
+        if spawn_local_workers:
+            env = dict(os.environ)
+            env['PYTHONPATH'] = os.pathsep.join([p for p in sys.path if p])
+            for _ in range(num_workers):
+                self.processes.append(subprocess.Popen(
+                    [sys.executable, '-m', 'cortix.src.worker', '--connect', self.address],
+                    env=env))
+
+        self.server.settimeout(timeout)
+        while len(self.workers) < num_workers:
+            (sock, _) = self.server.accept()
+            sock.settimeout(None)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            hello = recv_frame(sock)
+            assert hello[0] == 'hello'
+            idx = len(self.workers)
+            self.workers.append(sock)
+            self.hosts.append(hello[1]['host'])
+            self.log.info('Worker {} connected from {} (pid {})'.format(idx, hello[1]['host'],
+                                                                         hello[1]['pid']))
+            threading.Thread(target=self.__listen, args=(idx, sock), daemon=True).start()
+
+    def __listen(self, idx, sock):
+        """Receive frames from a worker; handle log records here, queue the rest."""
+
+        while True:
+            try:
+                msg = recv_frame(sock)
+            except (EOFError, OSError):
+                self.__inbox.put((idx, ('closed',)))
+                return
+            if msg[0] == 'log':
+                record = logging.makeLogRecord(msg[1])
+                if self.log.isEnabledFor(record.levelno):
+                    self.log.handle(record)
+            else:
+                self.__inbox.put((idx, msg))
+
+    def __next(self, *kinds):
+        (idx, msg) = self.__inbox.get()
+        if msg[0] in ('finished', 'closed'):
+            self.__done.add(idx)
+        if msg[0] == 'closed':
+            raise RuntimeError('worker {} disconnected during the run'.format(idx))
+        if msg[0] == 'error':
+            raise RuntimeError('worker {} failed:\n{}'.format(idx, msg[1]))
+        assert msg[0] in kinds, 'expected %r from worker %r; got %r'%(kinds, idx, msg[0])
+        return (idx, msg)
+
+    def run(self, modules, placement, save_dir_name, logger_name, log_level, batch_size=1,
+            affinity=None):
+        """Run the modules on the workers.
+
+        Parameters
+        ----------
+        modules: list(Module)
+        placement: dict(int:int)
+            Module index mapped to worker index.
+        save_dir_name: str
+            Pickled modules returned by the workers are written here.
+        logger_name: str
+        log_level: int
+        batch_size: int
+            See `SocketChannel`.
+        affinity: tuple or None
+            `(policy, connected)` for pinning module processes on the workers; see
+            `cortix.src.affinity.affinity_map`. Module indices are network indices.
+        """
+
+        tables = port_tables(modules)
+
+        # Pipes only work on a single host and cannot be shipped; drop them
+        for mod in modules:
+            for port in mod.ports:
+                port.pipe = None
+                if port.connected_port:
+                    port.connected_port.pipe = None
+
+        per_worker = {w: list() for w in range(self.num_workers)}
+        for (idx, mod) in enumerate(modules):
+            per_worker[placement[idx]].append(idx)
+
+        for (w, idxs) in per_worker.items():
+            job = {'modules': [(idx, modules[idx]) for idx in idxs],
+                   'ports': {idx: tables[idx] for idx in idxs},
+                   'save_dir_name': save_dir_name,
+                   'logger_name': logger_name, 'log_level': log_level,
+                   'batch_size': batch_size, 'affinity': affinity}
+            send_frame(self.workers[w], ('run', job))
+            self.log.info('Placed modules {} on worker {}'.format(
+                [modules[idx].name for idx in idxs], w))
+
+        self.__done = set() # workers that ended the job
+        address_book = dict()
+        waiting = set() # workers waiting for the address book
+        try:
+            for _ in range(self.num_workers):
+                (w, msg) = self.__next('endpoints')
+                waiting.add(w)
+                address_book.update(msg[1])
+        except RuntimeError:
+            self.__drain(waiting)
+            raise
+
+        for sock in self.workers:
+            send_frame(sock, ('address-book', address_book))
+
+        num_results = 0
+        try:
+            while num_results < len(modules) or len(self.__done) < self.num_workers:
+                (_, msg) = self.__next('result', 'finished')
+                if msg[0] == 'finished':
+                    continue
+                num_results += 1
+                (idx, data) = msg[1:]
+                if data is not None:
+                    file_name = os.path.join(save_dir_name, '{}_{}.pkl'.format(
+                        modules[idx].__class__.__name__, idx))
+                    with open(file_name, 'wb') as fout:
+                        fout.write(data)
+        except RuntimeError:
+            self.__drain(set())
+            raise
+
+    def __drain(self, waiting):
+        """After a failure, wait until every worker ended the job.
+
+        No message of the failed run is then left for the next run on the pool.
+        Workers waiting for the address book (`waiting`, or those sending their
+        endpoints later) are told to abort the job.
+        """
+
+        for w in waiting:
+            send_frame(self.workers[w], ('abort',))
+
+        while len(self.__done) < self.num_workers:
+            (w, msg) = self.__inbox.get()
+            if msg[0] in ('finished', 'closed'):
+                self.__done.add(w)
+            elif msg[0] == 'endpoints':
+                send_frame(self.workers[w], ('abort',))
+
+    def close(self):
+        """Release the workers and stop listening."""
+
+        for sock in self.workers:
+            try:
+                send_frame(sock, ('exit',))
+                sock.close()
+            except OSError:
+                pass
+        self.workers = list()
+        self.hosts = list()
+        self.server.close()
+
+        for proc in self.processes:
+            proc.wait()
+        self.processes = list()
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of the Cortix toolkit environment
+# https://cortix.org
+"""Cortix worker for the TCP socket transport.
+
+Start one worker per host (or more) and point it to the root process:
+
+    cortix-worker --connect host:port
+
+or, equivalently, `python -m cortix.src.worker --connect host:port`. The worker serves
+runs until the root releases it. Every module placed on the worker runs in its own
+process; module classes must be importable on the worker host.
+"""
+
+import os
+import sys
+import time
+import socket
+import logging
+import logging.handlers
+import argparse
+import threading
+import traceback
+import pickle
+import multiprocessing as multiproc
+from multiprocessing.connection import wait
+
+from cortix.src.socket_transport import send_frame, recv_frame, parse_address, connect_ports
+from cortix.src.affinity import host_affinity_map, pinned
+
+class _ForwardHandler(logging.Handler):
+    """Logging handler sending records to the root process over the control connection."""
+
+    def __init__(self, worker):
+        super().__init__()
+        self.worker = worker
+
+    def emit(self, record):
+        try:
+            rec = dict(record.__dict__)
+            rec['msg'] = record.getMessage()
+            rec['args'] = None
+            rec['exc_info'] = None
+            self.worker.send(('log', rec))
+        except Exception:
+            self.handleError(record)
+
+def run_module(module, idx, ports_table, host, conn, job):
+    """Module process entry point on a worker host.
+
+    Parameters
+    ----------
+    module: Module
+    idx: int
+        Module index in the network.
+    ports_table: dict
+        See `cortix.src.socket_transport.connect_ports`.
+    host: str
+        Address of this host as seen by the root process.
+    conn: multiprocessing.connection.Connection
+        Pipe to the worker process.
+    job: dict
+        Run settings sent by the root process.
+    """
+
+    channels = dict()
+    try:
+        listen_sock = socket.create_server((host, 0), backlog=max(128, len(ports_table)))
+        conn.send(('endpoint', (host, listen_sock.getsockname()[1])))
+
+        address_book = conn.recv()
+        channels = connect_ports(ports_table, listen_sock, address_book, job['batch_size'])
+        listen_sock.close()
+
+        for port in module.ports:
+            if port.name in channels:
+                port.channel = channels[port.name]
+
+        module.rebuild_logger(job['logger_name'])
+        if job.get('affinity') is not None and hasattr(os, 'sched_getaffinity'):
+            module.log.info('Module {} pinned to CPU(s) {} on {}'.format(
+                module.name, sorted(os.sched_getaffinity(0)), socket.gethostname()))
+        if module.recorder is not None:
+            module.recorder.start(module)
+        module.run((logging.getLogger(job['logger_name']), job['save_dir_name']))
+        if module.recorder is not None:
+            module.recorder.close()
+            module.recorder = None
+        module.flush_streams()
+        for port in module.ports:
+            port.close()
+
+        for channel in channels.values():
+            channel.close()
+
+        data = None
+        if module.save:
+            module.port_traffic = {port.name: port.num_sent for port in module.ports}
+            module.ports = list() # reset ports since they can't be pickled
+            module.log = None
+            module.log_queue = None
+            data = pickle.dumps(module)
+
+        conn.send(('result', data))
+    except Exception:
+        conn.send(('error', traceback.format_exc()))
+
+class Worker:
+    """Worker process serving Cortix runs for a root process."""
+
+    def __init__(self, address, timeout=60.0):
+        """Connect to the root process.
+
+        Parameters
+        ----------
+        address: str
+            'host:port' of the root process.
+        timeout: float
+            Seconds to keep retrying the connection.
+        """
+
+        start = time.time()
+        while True:
+            try:
+                self.sock = socket.create_connection(parse_address(address))
+                break
+            except OSError:
+                if time.time() - start > timeout:
+                    raise
+                time.sleep(0.2)
+
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.host = self.sock.getsockname()[0]
+        self.__send_lock = threading.Lock()
+
+        self.send(('hello', {'host': socket.gethostname(), 'pid': multiproc.current_process().pid}))
+
+    def send(self, msg):
+        """Send a message to the root process (thread safe)."""
+
+        with self.__send_lock:
+            send_frame(self.sock, msg)
+
+    def serve(self):
+        """Serve runs until the root process releases the worker."""
+
+        while True:
+            try:
+                msg = recv_frame(self.sock)
+            except (EOFError, OSError):
+                return
+
+            if msg[0] == 'exit':
+                return
+
+            assert msg[0] == 'run', 'unexpected message %r'%msg[0]
+            try:
+                self.__run(msg[1])
+            except Exception:
+                self.send(('error', traceback.format_exc()))
+            self.send(('finished',)) # ends every job, also a failed one
+
+    def __run(self, job):
+        """Run the modules of a job, one process each."""
+
+        ctx = multiproc.get_context('spawn')
+
+        # Module records go through a local queue and are forwarded to the root
+        log_queue = ctx.Queue(-1)
+        listener = logging.handlers.QueueListener(log_queue, _ForwardHandler(self))
+        listener.start()
+
+        processes = list()
+        conns = dict()
+        finished = False
+        try:
+            cpus_of = dict()
+            if job.get('affinity') is not None:
+                idxs = [idx for (idx, _) in job['modules']]
+                cpus_of = host_affinity_map(idxs, *job['affinity'])
+
+            for (idx, mod) in job['modules']:
+                mod.log_queue = log_queue
+                mod.log_level = job['log_level']
+                (parent_conn, child_conn) = ctx.Pipe()
+                proc = ctx.Process(target=run_module,
+                                   args=(mod, idx, job['ports'][idx], self.host,
+                                         child_conn, job))
+                with pinned(cpus_of.get(idx)): # the process inherits the CPU affinity
+                    proc.start()
+                processes.append(proc)
+                conns[idx] = parent_conn
+
+            endpoints = dict()
+            for (idx, conn) in conns.items():
+                reply = conn.recv()
+                if reply[0] == 'error':
+                    raise RuntimeError(reply[1])
+                endpoints[idx] = reply[1]
+            self.send(('endpoints', endpoints))
+
+            msg = recv_frame(self.sock)
+            if msg[0] == 'abort': # another worker failed to start its modules
+                return
+            assert msg[0] == 'address-book', 'unexpected message %r'%msg[0]
+            for conn in conns.values():
+                conn.send(msg[1])
+
+            # Results return in completion order
+            idx_of = {conn: idx for (idx, conn) in conns.items()}
+            while idx_of:
+                for conn in wait(list(idx_of)):
+                    idx = idx_of.pop(conn)
+                    result = conn.recv()
+                    if result[0] == 'error':
+                        self.send(('error', result[1]))
+                    else:
+                        self.send(('result', idx, result[1]))
+
+            finished = True
+        finally:
+            if not finished: # a module failed; do not leave processes behind
+                for proc in processes:
+                    if proc.is_alive():
+                        proc.terminate()
+            for proc in processes:
+                proc.join()
+            listener.stop()
+            log_queue.close() # the stop sentinel started a feeder thread
+            log_queue.join_thread()
+
+def main(argv=None):
+    """Command line entry point: `cortix-worker --connect host:port`."""
+
+    parser = argparse.ArgumentParser(prog='cortix-worker',
+                                     description='Serve Cortix modules over TCP sockets.')
+    parser.add_argument('--connect', required=True, metavar='host:port',
+                        help='address of the Cortix root process')
+    parser.add_argument('--timeout', type=float, default=60.0,
+                        help='seconds to keep retrying the connection (default: 60)')
+    args = parser.parse_args(argv)
+
+    worker = Worker(args.connect, timeout=args.timeout)
+    worker.serve()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of the Cortix toolkit environment
+# https://cortix.org
+"""Chunked columnar file of a phase history.
+
+The rows of a history are written in chunks of a fixed number of rows; in a chunk,
+each column (the time stamps first) is a separately compressed block. A table of
+contents at the end of the file gives the position of every block and the first and
+last time stamps of every chunk. Reading some columns over a time window thus reads
+and decompresses only the blocks of these columns in the chunks overlapping the
+window, whatever the size of the file.
+
+Layout
+------
+    b'CORTIXPH' and the format version (uint32 little endian)
+    blocks      zlib streams: the bytes of float and typed columns, byte-shuffled
+                (the first bytes of all values, then the second bytes, ...), which
+                compresses time series well; a pickled list for object columns
+    contents    pickled dict: metadata, columns, chunks and block positions
+    size        of the contents (uint64 little endian)
+"""
+
+import zlib
+import pickle
+import numpy as np
+
+_magic = b'CORTIXPH'
+_version = 1
+
+def write_phase_file(file_name, times, names, columns, shapes=None, metadata=None,
+                     chunk_rows=65536, level=1):
+    """Write a history to `file_name`.
+
+    Parameters
+    ----------
+    file_name: str
+    times: numpy.ndarray
+        Time stamps of the rows.
+    names: list(str)
+        Column names.
+    columns: list(numpy.ndarray)
+        Values of each column: float64, object, or `(rows, *shape)` arrays of typed
+        columns.
+    shapes: dict(int:tuple) or None
+        Value shapes of the typed columns, by column index.
+    metadata: any
+        Picklable data saved with the history, e.g. species and quantities.
+    chunk_rows: int
+        Rows per chunk; the smallest unit read back.
+    level: int
+        zlib compression level, 0 to 9.
+    """
+
+    times = np.asarray(times, dtype=np.float64)
+    if shapes is None:
+        shapes = dict()
+    assert len(names) == len(columns), '%r names for %r columns'%(len(names), len(columns))
+    assert chunk_rows >= 1, 'chunk_rows must be positive; got %r'%chunk_rows
+
+    column_info = list()
+    for (j, (name, values)) in enumerate(zip(names, columns)):
+        assert len(values) == len(times), \
+            'column %r has %r value(s) for %r time stamp(s)'%(name, len(values), len(times))
+        if values.dtype == object:
+            kind = 'object'
+        elif j in shapes:
+            kind = 'typed'
+        else:
+            kind = 'float'
+        column_info.append({'name': name, 'kind': kind, 'dtype': values.dtype.str,
+                            'shape': tuple(values.shape[1:])})
+
+    chunks = list()
+    with open(file_name, 'wb') as phase_file:
+        phase_file.write(_magic + _version.to_bytes(4, 'little'))
+        position = phase_file.tell()
+
+        for start in range(0, len(times), chunk_rows):
+            stop = min(start + chunk_rows, len(times))
+            chunk_times = times[start:stop]
+            blocks = list()
+            for values in [times] + list(columns):
+                data = zlib.compress(_encode(values[start:stop]), level)
+                phase_file.write(data)
+                blocks.append((position, len(data)))
+                position += len(data)
+            chunks.append({'rows': stop - start, 'blocks': blocks,
+                           'min': float(chunk_times.min()), 'max': float(chunk_times.max())})
+
+        contents = pickle.dumps({'metadata': metadata, 'columns': column_info,
+                                 'chunks': chunks}, protocol=pickle.HIGHEST_PROTOCOL)
+        phase_file.write(contents)
+        phase_file.write(len(contents).to_bytes(8, 'little'))
+
+def read_phase_file(file_name, columns=None, time_range=None):
+    """Read some columns of a history over a time window.
+
+    Parameters
+    ----------
+    file_name: str
+    columns: list(str) or None
+        Columns read. Default: all.
+    time_range: tuple(float, float) or None
+        Rows with time stamps from the first to the second value, both included;
+        either may be None. Default: all rows.
+
+    Returns
+    -------
+    times: numpy.ndarray
+    names: list(str)
+    values: list(numpy.ndarray)
+        Values of each column read, as in `write_phase_file()`.
+    shapes: dict(int:tuple)
+        Value shapes of the typed columns read, by index in `names`.
+    metadata: any
+    """
+
+    with open(file_name, 'rb') as phase_file:
+        header = phase_file.read(len(_magic) + 4)
+        assert header[:len(_magic)] == _magic, 'not a phase file: %r'%file_name
+        version = int.from_bytes(header[len(_magic):], 'little')
+        assert version == _version, 'unsupported phase file version %r'%version
+
+        phase_file.seek(-8, 2)
+        size = int.from_bytes(phase_file.read(8), 'little')
+        phase_file.seek(-8 - size, 2)
+        contents = pickle.loads(phase_file.read(size))
+
+        all_names = [info['name'] for info in contents['columns']]
+        if columns is None:
+            columns = all_names
+        for name in columns:
+            assert name in all_names, 'column %r not in %r'%(name, all_names)
+        selected = [j for (j, name) in enumerate(all_names) if name in columns]
+
+        (t_min, t_max) = time_range if time_range is not None else (None, None)
+        t_min = -np.inf if t_min is None else t_min
+        t_max = np.inf if t_max is None else t_max
+
+        times = list()
+        values = [list() for j in selected]
+        for chunk in contents['chunks']:
+            if chunk['max'] < t_min or chunk['min'] > t_max:
+                continue # the time index skips the chunk
+            blocks = chunk['blocks']
+            chunk_times = _decode(_read_block(phase_file, blocks[0]), chunk['rows'],
+                                  {'kind': 'float', 'dtype': '<f8', 'shape': ()})
+            rows = (chunk_times >= t_min) & (chunk_times <= t_max)
+            times.append(chunk_times[rows])
+            for (k, j) in enumerate(selected):
+                column = _decode(_read_block(phase_file, blocks[j+1]), chunk['rows'],
+                                 contents['columns'][j])
+                values[k].append(column[rows])
+
+    names = [all_names[j] for j in selected]
+    shapes = dict()
+    arrays = list()
+    for (k, j) in enumerate(selected):
+        info = contents['columns'][j]
+        if info['kind'] == 'typed':
+            shapes[k] = info['shape']
+        if values[k]:
+            arrays.append(np.concatenate(values[k]))
+        else:
+            arrays.append(np.empty((0,) + info['shape'], dtype=np.dtype(info['dtype'])))
+    times = np.concatenate(times) if times else np.empty(0, dtype=np.float64)
+
+    return (times, names, arrays, shapes, contents['metadata'])
+
+def _encode(values):
+    if values.dtype == object:
+        return pickle.dumps(list(values), protocol=pickle.HIGHEST_PROTOCOL)
+
+    # Byte shuffle: the slowly varying bytes of consecutive values end up together
+    data = np.ascontiguousarray(values).view(np.uint8).reshape(len(values), -1)
+    return np.ascontiguousarray(data.T).tobytes()
+
+def _decode(data, num_rows, info):
+    if info['kind'] == 'object':
+        values = np.empty(num_rows, dtype=object)
+        for (i, value) in enumerate(pickle.loads(data)):
+            values[i] = value
+        return values
+
+    dtype = np.dtype(info['dtype'])
+    data = np.frombuffer(data, dtype=np.uint8).reshape(-1, num_rows)
+    values = np.ascontiguousarray(data.T).view(dtype)
+
+    return values.reshape((num_rows,) + tuple(info['shape']))
+
+def _read_block(phase_file, block):
+    (position, size) = block
+    phase_file.seek(position)
+    return zlib.decompress(phase_file.read(size))
@@ -0,0 +1,968 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of the Cortix toolkit environment
+# https://cortix.org
+"""Columnar history store of a phase.
+
+The history is kept in preallocated NumPy buffers: one for the time stamps and one
+per column (actor). Appending a row writes one element per buffer; when the buffers
+are full their capacity doubles, so `n` appends cost O(n) time overall instead of the
+O(n^2) of concatenating a data frame at each time step.
+
+A column holds float64 values while only floats are stored in it; the first value of
+another type (an array, an int, None, ...) turns the column into an object column,
+which holds any Python object. A column declared with `set_shape()` is typed: its
+values are arrays of a fixed shape and data type stored in one contiguous
+`(capacity, *shape)` buffer, e.g. a position vector of each time step in an (n, 3)
+float array. `frame()` builds a `pandas.DataFrame` of the history on demand.
+
+Time stamps are looked up with a binary search (`nearest()`); rows are usually
+appended in time order, otherwise a sorted order of the rows is kept for the search.
+
+Retention
+---------
+`retain()` bounds the rows kept as the history grows:
+
+    last=N        keep the last N rows; older rows are dropped, or written to a spill
+                  file (`read_spill()`) when one is given.
+    every=k       keep every k-th row appended.
+    interval=dt   keep one row per time interval of length dt, with the 'mean', 'min'
+                  or 'max' of the float and vector values in the interval (other
+                  values are those of the last row in the interval) at the time
+                  stamp of the first row in the interval.
+
+The last row is always the one appended last, so a module can go on reading and
+setting the values of its current time step: with `every` and `interval`, that row
+is replaced or combined only when the next row is appended. The buffers of a history
+keeping the last N rows do not grow past about 2N rows, however long the run.
+
+Memory-mapped storage
+---------------------
+After `map_to(directory)`, the time stamps and the float and typed columns are
+`numpy.memmap` buffers, one file per buffer in `directory`, so a history can outgrow
+the memory: the operating system writes the rows to the files as the run goes on
+and reads back only the pages used, e.g. by `column()` or `frame(start, stop)`.
+Growing a mapped buffer extends its file in place. Object columns stay in memory.
+
+A mapped history pickles as references to its files, not as its rows: a module
+returning its phases to the parent process at the end of a run hands over file
+names, and the unpickled history maps the same files. The files are left in
+`directory` for the user to keep or remove.
+"""
+
+import os
+import pickle
+import numpy as np
+import pandas
+
+def _is_float(value):
+    return isinstance(value, (float, np.floating))
+
+def _unwrap(value):
+    """Single element float arrays are stored as the element, as in a data frame cell."""
+
+    if isinstance(value, np.ndarray) and value.size == 1 and value.dtype.kind == 'f':
+        return value.reshape(-1)[0]
+    return value
+
+def _resize(buffer, capacity, first, size):
+    """Buffer of `capacity` rows with rows `first` up to `first+size` at the start.
+
+    A memory-mapped buffer is moved and extended in place, in its file.
+    """
+
+    if not isinstance(buffer, np.memmap):
+        new_buffer = np.empty((capacity,) + buffer.shape[1:], dtype=buffer.dtype)
+        new_buffer[:size] = buffer[first:first+size]
+        return new_buffer
+
+    if first > 0:
+        buffer[:size] = buffer[first:first+size]
+    if capacity == len(buffer):
+        return buffer
+
+    buffer.flush()
+    shape = (capacity,) + buffer.shape[1:]
+    with open(buffer.filename, 'r+b') as buffer_file:
+        buffer_file.truncate(int(np.prod(shape)) * buffer.itemsize)
+
+    return np.memmap(buffer.filename, dtype=buffer.dtype, mode='r+', shape=shape)
+
+class _MappedFile:
+    """Pickled reference to the file of a memory-mapped buffer."""
+
+    def __init__(self, buffer):
+        buffer.flush()
+        self.file_name = buffer.filename
+        self.dtype = buffer.dtype.str
+        self.shape = buffer.shape
+
+    def open(self):
+        return np.memmap(self.file_name, dtype=np.dtype(self.dtype), mode='r+',
+                         shape=self.shape)
+
+def _frame(times, names, columns, typed):
+    """Data frame of rows given by column; typed columns give a cell per value array."""
+
+    data = dict()
+    for (j, name) in enumerate(names):
+        values = columns[j]
+        if j in typed:
+            cells = np.empty(len(values), dtype=object)
+            for (i, value) in enumerate(values):
+                cells[i] = value
+            values = cells
+        data[name] = values
+
+    return pandas.DataFrame(data, index=times, columns=names)
+
+class PhaseHistory:
+    """Time stamped rows of values of named columns, stored by column."""
+
+    def __init__(self, names=None, capacity=16):
+        """Constructs a PhaseHistory object.
+
+        Parameters
+        ----------
+        names: list(str) or None
+            Column names, in order.
+        capacity: int
+            Rows allocated at first.
+        """
+
+        if names is None:
+            names = list()
+        assert len(set(names)) == len(names), 'duplicate column names: %r'%names
+
+        capacity = max(int(capacity), 1)
+
+        self.__names = list(names)
+        self.__index = {name: j for (j, name) in enumerate(self.__names)}
+        self.__first = 0 # buffer position of the first row; rows before it are dropped
+        self.__size = 0
+        self.__times = np.empty(capacity, dtype=np.float64)
+        self.__in_order = True # time stamps appended in increasing order
+        self.__order = None    # rows sorted by time stamp when not in order
+        self.__columns = [np.empty(capacity, dtype=np.float64) for name in self.__names]
+        self.__shapes = dict() # column index: value shape of typed columns
+        self.__directory = None # of the memory-mapped buffers
+        self.__num_files = 0
+        self.__num_stored = 0   # rows stored since creation; dropped rows included
+        self.__num_added = 0    # rows appended since creation; replaced rows included
+        self.__first_added = 0.0 # time stamps of the first and last rows appended
+        self.__last_added = 0.0
+
+        self.__last = None     # retention policy
+        self.__every = None
+        self.__interval = None
+        self.__aggregate = None
+        self.__spill = None
+        self.__spilled = 0     # buffer position up to which dropped rows were spilled
+        self.__count = 0       # rows appended since the policy was set
+        self.__bin = None      # interval of the last row
+        self.__bin_time = None # time stamp of the first row in the interval
+        self.__bin_rows = 0    # rows combined in the interval
+        self.__bin_values = None
+
+    def __len__(self):
+        return self.__size
+
+    def __contains__(self, name):
+        return name in self.__index
+
+    def __get_names(self):
+        '''
+        Column names in order.
+
+        Returns
+        -------
+        names: list(str)
+        '''
+
+        return list(self.__names)
+    names = property(__get_names, None, None, None)
+
+    def __get_times(self):
+        '''
+        Time stamps of the rows; a read-only view of the buffer.
+
+        Returns
+        -------
+        times: numpy.ndarray
+        '''
+
+        times = self.__times[self.__first:self.__first+self.__size]
+        times.flags.writeable = False
+        return times
+    times = property(__get_times, None, None, None)
+
+    def __get_capacity(self):
+        '''
+        Rows allocated.
+
+        Returns
+        -------
+        capacity: int
+        '''
+
+        return len(self.__times)
+    capacity = property(__get_capacity, None, None, None)
+
+    def __get_mean_spacing(self):
+        '''
+        Mean spacing of consecutive time stamps, in row order; 0.0 with less than
+        two rows. O(1): the spacings add up to the last minus the first time stamp.
+
+        Returns
+        -------
+        mean_spacing: float
+        '''
+
+        if self.__size < 2:
+            return 0.0
+        first = self.__first
+        last = first + self.__size - 1
+        return float(self.__times[last] - self.__times[first]) / (self.__size - 1)
+    mean_spacing = property(__get_mean_spacing, None, None, None)
+
+    def __get_mean_step(self):
+        '''
+        Mean spacing of the time stamps of all rows appended, in the order appended,
+        whatever the retention policy kept; 0.0 with less than two rows appended.
+
+        Returns
+        -------
+        mean_step: float
+        '''
+
+        if self.__num_added < 2:
+            return 0.0
+        return (self.__last_added - self.__first_added) / (self.__num_added - 1)
+    mean_step = property(__get_mean_step, None, None, None)
+
+    def __get_num_stored(self):
+        '''
+        Rows stored since the history was created: the rows dropped by `last` are
+        counted, a row replacing the last row under `every` or `interval` is not. The
+        row at position `i` is thus row `num_stored - len(self) + i` of all rows
+        stored, a number that does not change as the history is retained.
+
+        Returns
+        -------
+        num_stored: int
+        '''
+
+        return self.__num_stored
+    num_stored = property(__get_num_stored, None, None, None)
+
+    def __get_last_is_final(self):
+        '''
+        False when `every` or `interval` may still replace or combine the last row as
+        the next row is appended.
+
+        Returns
+        -------
+        last_is_final: bool
+        '''
+
+        if self.__size > 0 and self.__interval is not None:
+            return False
+        if self.__size > 0 and self.__every is not None:
+            return self.__count % self.__every == 0 # see __replaces_last()
+        return True
+    last_is_final = property(__get_last_is_final, None, None, None)
+
+    def __get_directory(self):
+        '''
+        Directory of the memory-mapped buffers; None if the history is in memory.
+
+        Returns
+        -------
+        directory: str or None
+        '''
+
+        return self.__directory
+    directory = property(__get_directory, None, None, None)
+
+    def map_to(self, directory):
+        """Move the time stamps and the float and typed columns to memory-mapped files.
+
+        Parameters
+        ----------
+        directory: str
+            Created if missing; one file per buffer is written in it.
+        """
+
+        assert self.__directory is None, 'history mapped to %r'%self.__directory
+
+        os.makedirs(directory, exist_ok=True)
+        self.__reserve(len(self.__times)) # rows from the start of the buffers
+        self.__directory = os.path.abspath(directory)
+
+        self.__times = self.__mapped_copy(self.__times)
+        for (j, column) in enumerate(self.__columns):
+            if column.dtype != object:
+                self.__columns[j] = self.__mapped_copy(column)
+
+    def flush(self):
+        """Write the rows of memory-mapped buffers to their files."""
+
+        for buffer in [self.__times] + self.__columns:
+            if isinstance(buffer, np.memmap):
+                buffer.flush()
+
+    def retain(self, last=None, every=None, interval=None, aggregate='mean', spill=None):
+        """Set the retention policy; see the module documentation.
+
+        Rows appended from now on are subjected to the policy; the rows beyond the
+        last `last` are dropped now.
+
+        Parameters
+        ----------
+        last: int or None
+            Rows kept. Default: all.
+        every: int or None
+            Keep every `every`-th row appended.
+        interval: float or None
+            Keep one row per time interval of this length.
+        aggregate: str
+            'mean', 'min' or 'max': how the rows of an interval are combined.
+        spill: str or None
+            File the rows dropped by `last` are appended to; replaced if it exists.
+        """
+
+        assert last is None or last >= 1, 'last must be positive; got %r'%last
+        assert every is None or every >= 1, 'every must be positive; got %r'%every
+        assert interval is None or interval > 0.0, \
+            'interval must be positive; got %r'%interval
+        assert every is None or interval is None, 'give every or interval, not both'
+        assert aggregate in ('mean', 'min', 'max'), \
+            "aggregate must be 'mean', 'min' or 'max'; got %r"%aggregate
+        assert spill is None or last is not None, 'spill needs last'
+
+        self.__spill_dropped()
+        self.__last = last
+        self.__every = every
+        self.__interval = interval
+        self.__aggregate = aggregate
+        self.__spill = spill
+        if spill is not None and os.path.exists(spill):
+            os.remove(spill)
+
+        self.__restart_retention()
+        self.__drop_oldest()
+
+    def append(self, time_stamp, values):
+        """Add a row at the end.
+
+        Parameters
+        ----------
+        time_stamp: float
+        values: list
+            One value per column, in column order.
+        """
+
+        assert len(values) == len(self.__names), \
+            'row of %r value(s) for %r column(s)'%(len(values), len(self.__names))
+
+        if self.__size > 0 and self.__replaces_last(time_stamp):
+            row = self.__first + self.__size - 1
+        else:
+            self.__make_room(1)
+            row = self.__first + self.__size
+            self.__size += 1
+            self.__num_stored += 1
+        self.__count_added(time_stamp, time_stamp, 1)
+
+        if row > self.__first and time_stamp < self.__times[row-1]:
+            self.__in_order = False
+        self.__order = None
+        self.__times[row] = time_stamp
+        for (j, value) in enumerate(values):
+            self.__store(j, row, value)
+
+        self.__drop_oldest()
+
+    def extend(self, time_stamps, columns):
+        """Add rows at the end; one slice assignment per column where possible.
+
+        Parameters
+        ----------
+        time_stamps: numpy.ndarray
+            Time stamps of the new rows.
+        columns: list
+            One sequence of values per column, in column order, as long as
+            `time_stamps`; `(rows, *shape)` arrays for typed columns.
+        """
+
+        time_stamps = np.asarray(time_stamps, dtype=np.float64).reshape(-1)
+        num_rows = len(time_stamps)
+        assert len(columns) == len(self.__names), \
+            '%r column(s) of values for %r column(s)'%(len(columns), len(self.__names))
+        for (name, values) in zip(self.__names, columns):
+            assert len(values) == num_rows, \
+                'column %r has %r value(s) for %r time stamp(s)'%(name, len(values), num_rows)
+
+        if num_rows == 0:
+            return
+
+        if self.__every is not None or self.__interval is not None:
+            for i in range(num_rows): # rows are combined one by one
+                self.append(time_stamps[i], [values[i] for values in columns])
+            return
+
+        self.__make_room(num_rows)
+        start = self.__first + self.__size
+        stop = start + num_rows
+
+        if (self.__size > 0 and time_stamps[0] < self.__times[start-1]) or \
+           np.any(np.diff(time_stamps) < 0.0):
+            self.__in_order = False
+        self.__order = None
+
+        self.__times[start:stop] = time_stamps
+        for (j, values) in enumerate(columns):
+            column = self.__columns[j]
+            if j in self.__shapes:
+                column[start:stop] = np.asarray(values, dtype=column.dtype).reshape(
+                    (num_rows,) + self.__shapes[j])
+            elif column.dtype != object and isinstance(values, np.ndarray) and \
+                 values.ndim == 1 and values.dtype.kind == 'f':
+                column[start:stop] = values
+            else:
+                for (i, value) in enumerate(values):
+                    self.__store(j, start + i, value)
+        self.__size += num_rows
+        self.__num_stored += num_rows
+        self.__count_added(time_stamps[0], time_stamps[-1], num_rows)
+
+        self.__drop_oldest()
+
+    def nearest(self, time_stamp, tolerance):
+        """Row of the time stamp closest to `time_stamp`.
+
+        O(1) for the last time stamp, O(log n) otherwise.
+
+        Parameters
+        ----------
+        time_stamp: float
+        tolerance: float
+            Largest distance accepted.
+
+        Returns
+        -------
+        row: int or None
+            None if no time stamp is within `tolerance`.
+        """
+
+        size = self.__size
+        if size == 0:
+            return None
+
+        times = self.__times[self.__first:self.__first+size]
+
+        last = size - 1
+        if abs(times[last] - time_stamp) <= tolerance: # the usual query
+            return last
+
+        if not self.__in_order:
+            if self.__order is None:
+                self.__order = np.argsort(times, kind='stable')
+            times = times[self.__order]
+
+        right = int(np.searchsorted(times, time_stamp))
+        if right == size or \
+           (right > 0 and time_stamp - times[right-1] <= times[right] - time_stamp):
+            loc = right - 1
+        else:
+            loc = right
+
+        if abs(times[loc] - time_stamp) > tolerance:
+            return None
+        if self.__in_order:
+            return loc
+        return int(self.__order[loc])
+
+    def window(self, start=None, end=None):
+        """Rows with time stamps from `start` to `end`, both included.
+
+        Found by binary search, in O(log n).
+
+        Parameters
+        ----------
+        start: float or None
+            Default: from the first row.
+        end: float or None
+            Default: up to the last row.
+
+        Returns
+        -------
+        rows: slice or numpy.ndarray
+            Positions of the rows in time order: a slice when the rows were appended
+            in time order, so that `column(name)[rows]` is a view of the buffer;
+            otherwise an array of positions.
+        """
+
+        stamps = self.times
+        if not self.__in_order:
+            if self.__order is None:
+                self.__order = np.argsort(stamps, kind='stable')
+            stamps = stamps[self.__order]
+
+        first = 0 if start is None else int(np.searchsorted(stamps, start, side='left'))
+        stop = self.__size if end is None else \
+            int(np.searchsorted(stamps, end, side='right'))
+        stop = max(first, stop)
+
+        if self.__in_order:
+            return slice(first, stop)
+        return self.__order[first:stop]
+
+    def interpolate(self, name, times, kind='linear'):
+        """Values of column `name` at `times`, between the time stamps of the rows.
+
+        One vectorized call for all `times`; before the first and after the last
+        time stamp, the first and last values are held.
+
+        Parameters
+        ----------
+        name: str
+        times: numpy.ndarray
+            Query times, in any order.
+        kind: str
+            'linear', 'previous' (the value at the last time stamp not after the
+            query time, i.e. held between rows) or 'cubic' (a cubic spline; needs
+            SciPy). Object columns allow 'previous' only.
+
+        Returns
+        -------
+        values: numpy.ndarray
+            One value per query time; `(len(times), *shape)` for a typed column.
+        """
+
+        assert kind in ('linear', 'previous', 'cubic'), \
+            "kind must be 'linear', 'previous' or 'cubic'; got %r"%kind
+        assert self.__size > 0, 'no rows to interpolate'
+
+        times = np.asarray(times, dtype=np.float64).reshape(-1)
+        (stamps, values) = (self.times, self.column(name))
+        if not self.__in_order:
+            if self.__order is None:
+                self.__order = np.argsort(stamps, kind='stable')
+            (stamps, values) = (stamps[self.__order], values[self.__order])
+
+        size = self.__size
+        if kind == 'previous' or size == 1:
+            rows = np.clip(np.searchsorted(stamps, times, side='right') - 1, 0, size - 1)
+            return values[rows]
+
+        assert values.dtype != object, \
+            'column %r holds objects; only kind=\'previous\' applies'%name
+
+        if kind == 'cubic':
+            # Import here to avoid broken dependency
+            from scipy.interpolate import CubicSpline
+            spline = CubicSpline(stamps, values, axis=0)
+            return spline(np.clip(times, stamps[0], stamps[-1]))
+
+        rows = np.clip(np.searchsorted(stamps, times, side='right') - 1, 0, size - 2)
+        weights = np.clip((times - stamps[rows]) / (stamps[rows+1] - stamps[rows]), 0.0, 1.0)
+        weights = weights.reshape((-1,) + (1,) * (values.ndim - 1))
+
+        return values[rows] + weights * (values[rows+1] - values[rows])
+
+    def get(self, row, name):
+        """Value of column `name` at position `row`."""
+
+        j = self.__index[name]
+        column = self.__columns[j]
+        value = column[self.__check_row(row)]
+        if j in self.__shapes:
+            return value.copy()
+        if column.dtype != object:
+            return float(value)
+        return value
+
+    def set(self, row, name, value):
+        """Set the value of column `name` at position `row`."""
+
+        self.__store(self.__index[name], self.__check_row(row), value)
+
+    def row(self, row):
+        """Values of all columns at position `row`.
+
+        Returns
+        -------
+        values: list
+        """
+
+        return [self.get(row, name) for name in self.__names]
+
+    def column(self, name):
+        """Values of column `name` in all rows; a view of the buffer.
+
+        Returns
+        -------
+        values: numpy.ndarray
+            float64 or object array; an `(n, *shape)` array for a typed column.
+        """
+
+        return self.__columns[self.__index[name]][self.__first:self.__first+self.__size]
+
+    def shape(self, name):
+        """Shape of the values of a typed column; None for other columns."""
+
+        return self.__shapes.get(self.__index[name])
+
+    def set_shape(self, name, shape, dtype=np.float64):
+        """Make column `name` typed; its values must be arrays of `shape`.
+
+        The values already stored are converted.
+
+        Parameters
+        ----------
+        name: str
+        shape: tuple(int)
+        dtype: numpy.dtype
+        """
+
+        self.__reserve(len(self.__times)) # rows from the start of the buffers
+
+        j = self.__index[name]
+        shape = tuple(shape)
+        old_column = self.__columns[j]
+
+        column = self.__new_buffer(shape, dtype)
+        for row in range(self.__size):
+            column[row] = np.asarray(old_column[row], dtype=dtype).reshape(shape)
+
+        self.__replace_column(j, column)
+        self.__shapes[j] = shape
+        self.__restart_retention()
+
+    def add_column(self, name, fill_value):
+        """Add a column at the end with `fill_value` in every row."""
+
+        assert name not in self.__index, 'column %r exists'%name
+
+        self.__reserve(len(self.__times)) # rows from the start of the buffers
+
+        if _is_float(fill_value):
+            column = self.__new_buffer()
+            column[:self.__size] = fill_value
+        else:
+            column = np.empty(len(self.__times), dtype=object)
+            for row in range(self.__size):
+                column[row] = fill_value
+
+        self.__index[name] = len(self.__names)
+        self.__names.append(name)
+        self.__columns.append(column)
+        self.__restart_retention()
+
+    def scale_row(self, row, factor):
+        """Multiply the values of all columns at position `row` by `factor`."""
+
+        row = self.__check_row(row)
+        for (j, column) in enumerate(self.__columns):
+            self.__store(j, row, column[row] * factor)
+
+    def fill(self, value):
+        """Set every value of every column to `value`; the time stamps are kept."""
+
+        self.__reserve(len(self.__times)) # rows from the start of the buffers
+
+        for j in range(len(self.__columns)):
+            if j in self.__shapes:
+                self.__columns[j][:self.__size] = value
+                continue
+            if _is_float(value):
+                column = self.__new_buffer()
+            else:
+                column = np.empty(len(self.__times), dtype=object)
+            column[:self.__size] = value
+            self.__replace_column(j, column)
+        self.__restart_retention()
+
+    def keep_row(self, row):
+        """Drop all rows but the one at position `row`."""
+
+        row = self.__check_row(row) - self.__first
+        self.__reserve(len(self.__times)) # rows from the start of the buffers
+
+        self.__times[0] = self.__times[row]
+        for column in self.__columns:
+            column[0] = column[row]
+        self.__size = 1
+        self.__in_order = True
+        self.__order = None
+        self.__restart_retention()
+
+    def frame(self, start=0, stop=None):
+        """Data frame of the rows from position `start` up to `stop`.
+
+        Returns
+        -------
+        df: pandas.DataFrame
+            Indexed by time stamp; the values are copies.
+        """
+
+        (start, stop, _) = slice(start, stop).indices(self.__size)
+        (start, stop) = (self.__first + start, self.__first + stop)
+
+        return _frame(self.__times[start:stop].copy(), self.__names,
+                      [column[start:stop].copy() for column in self.__columns],
+                      self.__shapes)
+
+    def __check_row(self, row):
+        """Buffer position of row `row`."""
+
+        assert -self.__size <= row < self.__size, \
+            'row %r out of a history of %r row(s)'%(row, self.__size)
+        return self.__first + row % self.__size
+
+    def __store(self, j, row, value):
+        if j in self.__shapes:
+            column = self.__columns[j]
+            column[row] = np.asarray(value, dtype=column.dtype).reshape(self.__shapes[j])
+            return
+
+        value = _unwrap(value)
+        column = self.__columns[j]
+        if column.dtype != object and not _is_float(value):
+            column = np.array(column, dtype=object) # promote; float elements stay floats
+            self.__replace_column(j, column)
+        column[row] = value
+
+    def __make_room(self, num_rows):
+        """Make room for `num_rows` more rows at the end of the buffers."""
+
+        capacity = len(self.__times)
+        if self.__first + self.__size + num_rows <= capacity:
+            return
+
+        # Moving the rows to the start frees at least half of the buffers
+        if self.__first > 0 and self.__size + num_rows <= capacity // 2:
+            self.__reserve(capacity)
+        else:
+            self.__reserve(max(2 * capacity, self.__size + num_rows))
+
+    def __reserve(self, capacity):
+        """Reallocate the buffers with room for `capacity` rows, rows at the start."""
+
+        self.__spill_dropped()
+
+        (first, size) = (self.__first, self.__size)
+
+        self.__times = _resize(self.__times, capacity, first, size)
+        for (j, column) in enumerate(self.__columns):
+            self.__columns[j] = _resize(column, capacity, first, size)
+
+        self.__first = 0
+        self.__spilled = 0
+
+    def __new_buffer(self, shape=(), dtype=np.float64):
+        """Empty column buffer; memory-mapped if the history is."""
+
+        shape = (len(self.__times),) + tuple(shape)
+        if self.__directory is None:
+            return np.empty(shape, dtype=dtype)
+
+        assert int(np.prod(shape)) > 0, 'empty value shape %r'%(shape[1:],)
+        file_name = os.path.join(self.__directory, 'buffer-%i.bin'%self.__num_files)
+        self.__num_files += 1
+
+        return np.memmap(file_name, dtype=dtype, mode='w+', shape=shape)
+
+    def __mapped_copy(self, buffer):
+        """Memory-mapped copy of the rows in use of an in-memory buffer."""
+
+        mapped = self.__new_buffer(buffer.shape[1:], buffer.dtype)
+        mapped[:self.__size] = buffer[:self.__size]
+        return mapped
+
+    def __replace_column(self, j, column):
+        """Replace the buffer of column `j`, removing the file of a mapped one."""
+
+        old_column = self.__columns[j]
+        self.__columns[j] = column
+        if isinstance(old_column, np.memmap) and old_column.filename is not None:
+            os.remove(old_column.filename)
+
+    def __count_added(self, first, last, num_rows):
+        """Count rows appended with time stamps from `first` to `last`."""
+
+        if self.__num_added == 0:
+            self.__first_added = float(first)
+        self.__last_added = float(last)
+        self.__num_added += num_rows
+
+    def __drop_oldest(self):
+        """Drop the rows beyond the last `last` rows."""
+
+        if self.__last is None or self.__size <= self.__last:
+            return
+
+        excess = self.__size - self.__last
+        self.__first += excess
+        self.__size -= excess
+        self.__order = None
+
+    def __spill_dropped(self):
+        """Append the dropped rows not yet spilled to the spill file."""
+
+        (start, stop) = (self.__spilled, self.__first)
+        if self.__spill is None or stop <= start:
+            return
+
+        chunk = (self.__times[start:stop].copy(),
+                 [column[start:stop].copy() for column in self.__columns],
+                 list(self.__names), dict(self.__shapes))
+        with open(self.__spill, 'ab') as spill_file:
+            pickle.dump(chunk, spill_file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.__spilled = stop
+
+    def __restart_retention(self):
+        """The last row starts the rows subjected to `every` and `interval`."""
+
+        self.__count = 0
+        self.__bin = None
+        if self.__interval is not None and self.__size > 0:
+            time_stamp = self.__times[self.__first + self.__size - 1]
+            self.__bin = np.floor(time_stamp / self.__interval)
+            self.__bin_time = time_stamp
+        self.__bin_rows = 0
+        self.__bin_values = [None] * len(self.__columns)
+
+    def __replaces_last(self, time_stamp):
+        """Apply `every` or `interval` to the last row before a row is appended.
+
+        Returns
+        -------
+        replace: bool
+            The new row takes the place of the last row.
+        """
+
+        if self.__every is not None:
+            replace = self.__count % self.__every != 0 # the last row is not kept
+            self.__count += 1
+            return replace
+
+        if self.__interval is None:
+            return False
+
+        last = self.__first + self.__size - 1
+        if self.__bin is None: # the first row since the policy was set
+            self.__bin = np.floor(self.__times[last] / self.__interval)
+            self.__bin_time = self.__times[last]
+        self.__combine(last)
+
+        time_bin = np.floor(time_stamp / self.__interval)
+        if time_bin == self.__bin:
+            return True
+
+        # Close the interval of the last row
+        self.__times[last] = self.__bin_time
+        for (j, value) in enumerate(self.__bin_values):
+            if value is None or (self.__columns[j].dtype == object and j not in self.__shapes):
+                continue
+            if self.__aggregate == 'mean':
+                value = value / self.__bin_rows
+            self.__columns[j][last] = value
+
+        self.__bin = time_bin
+        self.__bin_time = time_stamp
+        self.__bin_rows = 0
+        self.__bin_values = [None] * len(self.__columns)
+
+        return False
+
+    def __combine(self, row):
+        """Combine the values of buffer position `row` into those of its interval."""
+
+        self.__bin_rows += 1
+        for (j, column) in enumerate(self.__columns):
+            if column.dtype == object and j not in self.__shapes:
+                continue # the last value is kept
+            value = column[row]
+            combined = self.__bin_values[j]
+            if combined is None:
+                combined = np.array(value, dtype=np.float64)
+            elif self.__aggregate == 'mean':
+                combined = combined + value
+            elif self.__aggregate == 'min':
+                combined = np.minimum(combined, value)
+            else:
+                combined = np.maximum(combined, value)
+            self.__bin_values[j] = combined
+
+    def __getstate__(self):
+        """Pickle only the rows in use; dropped rows are spilled first.
+
+        Memory-mapped buffers are pickled as references to their files.
+        """
+
+        self.__spill_dropped()
+        if self.__directory is not None:
+            self.__reserve(len(self.__times)) # rows from the start of the files
+
+        state = self.__dict__.copy()
+        if self.__directory is not None:
+            state['_PhaseHistory__times'] = _MappedFile(self.__times)
+            state['_PhaseHistory__columns'] = [
+                _MappedFile(column) if isinstance(column, np.memmap)
+                else column[:self.__size].copy() for column in self.__columns]
+            state['_PhaseHistory__first'] = 0
+            state['_PhaseHistory__spilled'] = 0
+            state['_PhaseHistory__order'] = None
+            return state
+
+        (first, size) = (self.__first, self.__size)
+        state['_PhaseHistory__times'] = self.__times[first:first+size].copy()
+        state['_PhaseHistory__columns'] = [column[first:first+size].copy()
+                                           for column in self.__columns]
+        state['_PhaseHistory__first'] = 0
+        state['_PhaseHistory__spilled'] = 0
+        state['_PhaseHistory__order'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+        if isinstance(self.__times, _MappedFile):
+            self.__times = self.__times.open()
+            for (j, column) in enumerate(self.__columns):
+                if isinstance(column, _MappedFile):
+                    self.__columns[j] = column.open()
+                else: # in memory, trimmed to the rows in use
+                    self.__columns[j] = _resize(column, len(self.__times), 0, self.__size)
+            return
+
+        if len(self.__times) == 0:
+            self.__reserve(1)
+
+def read_spill(file_name):
+    """Rows dropped from a history and spilled to `file_name` (see `retain()`).
+
+    Parameters
+    ----------
+    file_name: str
+
+    Returns
+    -------
+    df: pandas.DataFrame
+        Indexed by time stamp, in the order the rows were dropped.
+    """
+
+    frames = list()
+    with open(file_name, 'rb') as spill_file:
+        while True:
+            try:
+                (times, columns, names, shapes) = pickle.load(spill_file)
+            except EOFError:
+                break
+            frames.append(_frame(times, names, columns, shapes))
+
+    assert frames, 'no rows spilled to %r'%file_name
+
+    return pandas.concat(frames)
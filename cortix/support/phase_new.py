@@ -35,6 +35,7 @@ Cortix: a program for system-level modules coupling, execution, and analysis.
 """
 import os, io
 from copy import deepcopy
+from copy import copy as shallowcopy
 import time
 import datetime
 
@@ -50,6 +51,8 @@ from matplotlib.ticker import ScalarFormatter
 
 from cortix.support.species   import Species
 from cortix.support.quantity import Quantity
+from cortix.support.phase_history import PhaseHistory
+from cortix.support.phase_file import write_phase_file, read_phase_file
 
 class PhaseNew:
     """ Phase `history` container.
@@ -61,12 +64,18 @@ class PhaseNew:
                  time_stamp = None,
                  time_unit  = None,
                  species    = None,
-                 quantities = None
+                 quantities = None,
+                 copy       = 'deep'
                 ):
         #TODO
         """
         Sometimes an empty Phase object is created by user code. This case needs
         adequate logic for None types.
+        The `copy` policy says how values given to the phase are held; see
+        `copy_policy`. With 'deep' (default) the phase holds deep copies of the
+        species, quantities and values given; with 'shallow', shallow copies; with
+        'none', the objects given (arrays taken over and made read-only), for hot
+        loops that hand over newly computed values.
         Note on usage: when passing quantities, do set the value argument explicitly
         to help define the type and avoid set_value() errors with Pandas. This is
         to be investigated later. Also, the usage of a DataFrame needs to be re-evaluated.
@@ -95,6 +104,10 @@ class PhaseNew:
             assert isinstance(time_unit, str)
             self.__time_unit = time_unit
 
+        assert copy in ('deep', 'shallow', 'none'), \
+            "copy must be 'deep', 'shallow' or 'none'; got %r"%copy
+        self.__copy = copy
+
         if species is not None:
             assert isinstance(species, list)
             for each_species in species:
@@ -107,15 +120,15 @@ class PhaseNew:
 
         # List of species and quantities objects; columns of data frame are named
         # by objects.
-        # A new object held by a Phase() object
+        # A new object held by a Phase() object (the objects given with copy='none')
         if species is not None:
-            self.__species = deepcopy(species)
+            self.__species = [self.__copy_value(spc) for spc in species]
         else:
             self.__species = None
 
-        # A new object held by a Phase() object
+        # A new object held by a Phase() object (the objects given with copy='none')
         if quantities is not None:
-            self.__quantities = deepcopy(quantities)
+            self.__quantities = [self.__copy_value(quant) for quant in quantities]
         else:
             self.__quantities = None
 
@@ -133,20 +146,24 @@ class PhaseNew:
                 #quant.value = 0.0    # clear these values
                                      # todo: eliminate them from Quantity in the future
 
-        # Table data phase without data type assigned; this is left to the user
-        # Time stamps will always be float
-        self.__df = pandas.DataFrame(index=[float(time_stamp)], columns=names)
+        # History stored by column; data types are defined by the values the user
+        # stores. Time stamps will always be float.
+        self.__history = PhaseHistory(names)
+        self.__df = None # data frame of the history; built when accessed
+
+        values = list()
 
         # This is meant to be the value of species concentration; a float type
         if species is not None:
             for spc in species:
-                self.__df.loc[time_stamp, spc.name] = 0.0
+                values.append(0.0)
 
         # The value of the quantity could be any type
         if quantities is not None:
-            for quant in quantities:
-                self.__df.loc[time_stamp, quant.name] = quant.value
-                #self.__df.fillna(0.0, inplace=True)  # dtype defaults to float
+            for quant in self.__quantities:
+                values.append(quant.value)
+
+        self.__history.append(float(time_stamp), values)
 
         return
 
@@ -178,6 +195,39 @@ class PhaseNew:
         return self.__time_unit
     time_unit = property(__get_time_unit,None,None,None)
 
+    def __get_copy_policy(self):
+        '''
+        How values given to `set_value()` are held: 'deep' (a deep copy), 'shallow'
+        (a shallow copy) or 'none'. With 'none' the value itself is stored: the caller
+        hands the value over. A NumPy array owning its memory is taken over and made
+        read-only, so that neither the caller nor readers of the phase can change the
+        history in place; an array viewing the memory of another one is copied first.
+        Other objects cannot be protected: the caller must not change them afterwards.
+        To change a value read from the phase, copy it first (copy on write). Values
+        of vectors declared with `declare_vector()` are always copied into the history
+        array.
+
+        Returns
+        -------
+        copy_policy: str
+        '''
+
+        return self.__copy
+
+    def __set_copy_policy(self, copy):
+        '''
+        Sets the copy policy.
+
+        Parameters
+        ----------
+        copy: str
+        '''
+
+        assert copy in ('deep', 'shallow', 'none'), \
+            "copy must be 'deep', 'shallow' or 'none'; got %r"%copy
+        self.__copy = copy
+    copy_policy = property(__get_copy_policy, __set_copy_policy, None, None)
+
     def __get_time_stamps(self):
         '''
         Get all time stamps in the index of the data frame.
@@ -187,7 +237,7 @@ class PhaseNew:
         time_stamps: list
         '''
 
-        return list(self.__df.index)  # return all time stamps
+        return self.__history.times.tolist()  # return all time stamps
     time_stamps = property(__get_time_stamps, None, None, None)
 
     def __get_species_list(self):
@@ -223,20 +273,126 @@ class PhaseNew:
 
         Returns
         -------
-        list(self.__df.colums): list
+        actors: list
 
         """
 
-        return list(self.__df.columns)  # return all names in order
+        return self.__history.names  # return all names in order
     actors = property(__get_actors, None, None, None)
 
     def __get_df(self):
         '''
-        Die hard access.
+        Die hard access. The data frame is built from the history when first accessed
+        after a change; changing the data frame does not change the history.
         '''
+        if self.__df is None:
+            self.__df = self.__history.frame()
         return self.__df
     df = property(__get_df,None,None,None)
 
+    def __get_num_time_stamps(self):
+        '''
+        Number of time stamps (rows) in the phase history.
+
+        Returns
+        -------
+        num_time_stamps: int
+        '''
+
+        return len(self.__history)
+    num_time_stamps = property(__get_num_time_stamps, None, None, None)
+
+    def __get_num_rows_stored(self):
+        '''
+        Number of rows stored in the phase history since it was created, counting
+        the rows dropped by `retain()`; it never decreases, so readers following the
+        history (e.g. `Module.stream_phase()`) can number its rows. The row at
+        position `i` is row `num_rows_stored - num_time_stamps + i`.
+
+        Returns
+        -------
+        num_rows_stored: int
+        '''
+
+        return self.__history.num_stored
+    num_rows_stored = property(__get_num_rows_stored, None, None, None)
+
+    def __get_last_row_final(self):
+        '''
+        False when the retention policy (`retain(every=...)` or
+        `retain(interval=...)`) may still replace or combine the last row.
+
+        Returns
+        -------
+        last_row_final: bool
+        '''
+
+        return self.__history.last_is_final
+    last_row_final = property(__get_last_row_final, None, None, None)
+
+    def history_frame(self, start=0, stop=None):
+        '''
+        Data frame of the history rows from position `start` up to `stop`; only
+        these rows are copied.
+
+        Parameters
+        ----------
+        start: int
+        stop: int or None
+
+        Returns
+        -------
+        df: pandas.DataFrame
+        '''
+
+        return self.__history.frame(start, stop)
+
+    def retain(self, last=None, every=None, interval=None, aggregate='mean', spill=None):
+        '''
+        Bounds the history kept in memory during long runs. The policy applies to
+        the rows added after the call; rows beyond the last `last` are dropped now.
+        The last row is always the latest one added, so the current values can be
+        read and set as usual.
+
+        Parameters
+        ----------
+        last: int or None
+            Keep the last `last` rows (a ring buffer). Default: all rows.
+        every: int or None
+            Keep every `every`-th row added (decimation).
+        interval: float or None
+            Keep one row per time interval of this length (downsampling), at the
+            first time stamp in the interval. Exclusive with `every`.
+        aggregate: str
+            How the float and vector values in an interval are combined: 'mean',
+            'min' or 'max'. Other values are those of the last row in the interval.
+        spill: str or None
+            File the rows dropped by `last` are written to, instead of being
+            discarded; read it with `cortix.support.phase_history.read_spill()`.
+        '''
+
+        self.__history.retain(last=last, every=every, interval=interval,
+                              aggregate=aggregate, spill=spill)
+        self.__df = None
+
+    def map_history(self, directory):
+        '''
+        Keeps the history in memory-mapped files in `directory`, for histories
+        larger than the memory. The time stamps and the float and vector columns
+        are written to the files as the run goes on; reads load only the rows
+        used. Other values stay in memory. A pickled phase refers to the files
+        instead of holding the history, e.g. when a module returns its phases to
+        the parent process at the end of a run; the files are not removed.
+
+        Parameters
+        ----------
+        directory: str
+            Created if missing. Use one directory per phase.
+        '''
+
+        self.__history.map_to(directory)
+        self.__df = None
+
     def get_species(self, name):
         '''
         Returns the species specified by name if it exists,
@@ -252,8 +408,8 @@ class PhaseNew:
 
         '''
 
-        assert name in self.__df.columns, 'name %r not in %r'%\
-                (name,self.__df.columns)
+        assert name in self.__history, 'name %r not in %r'%\
+                (name,self.actors)
 
         if self.__species:
             for species in self.__species:
@@ -289,7 +445,7 @@ class PhaseNew:
 
         '''
 
-        assert name in self.__df.columns, 'name %r not in %r'%(name,self.__df.columns)
+        assert name in self.__history, 'name %r not in %r'%(name,self.actors)
 
         for species in self.__species:
             if species.name == name:
@@ -308,7 +464,7 @@ class PhaseNew:
         Quantity or None
         """
 
-        assert name in self.__df.columns, 'name %r not in %r'%(name,self.__df.columns)
+        assert name in self.__history, 'name %r not in %r'%(name,self.actors)
 
         if self.__quantities:
             for quant in self.__quantities:
@@ -334,15 +490,15 @@ class PhaseNew:
         quant.value: type of Quantity.value
         """
 
-        assert name in self.__df.columns, 'name %r not in %r'%(name,self.__df.columns)
+        assert name in self.__history, 'name %r not in %r'%(name,self.actors)
 
-        time_stamp = self.__get_time_stamp(try_time_stamp)
+        row = self.__get_row_index(try_time_stamp)
 
         if self.__quantities:
             for quant in self.__quantities:
                 if quant.name == name:
                     # Update value in quantity with history value
-                    quant.value = self.__df.loc[time_stamp, name] # labels' access mode
+                    quant.value = self.__history.get(row, name)
                     return quant.value  # return quantity value syncronized with the phase
 
     def get_quantity_history(self, name):
@@ -363,19 +519,66 @@ class PhaseNew:
         quant_history: tuple(Quantity,str) or None
         '''
 
-        assert name in self.__df.columns, 'name %r not in %r'%(name,self.__df.columns)
+        assert name in self.__history, 'name %r not in %r'%(name,self.actors)
 
         if self.__quantities is not None:
             for quant in self.__quantities:
                 if quant.name == name:
                     quant_history = deepcopy(quant)
-                    quant_history.value = deepcopy(self.__df[name]) # whole data frame index series
+                    # whole history as a time series
+                    if self.__history.shape(name) is None:
+                        values = deepcopy(self.__history.column(name))
+                    else: # rows of one copy of the typed column
+                        values = list(self.__history.column(name).copy())
+                    quant_history.value = pandas.Series(
+                        values, index=self.__history.times.copy(), name=name)
                     return (quant_history, self.__time_unit) # return tuple
         else:
             return (None, self.__time_unit)
 
         return None
 
+    def declare_vector(self, name, shape=None, dtype=np.float64):
+        '''
+        Store the history of a vector-valued quantity as one contiguous array of
+        `(time stamps, *shape)` values of type `dtype`, instead of an array object per
+        time stamp. Values set later must have this shape; `get_value()` returns a
+        copy of the stored vector.
+
+        Parameters
+        ----------
+        name: str
+        shape: tuple(int) or None
+            Default: the shape of the value at the last time stamp.
+        dtype: numpy.dtype
+        '''
+
+        assert name in self.__history, 'name %r not in %r'%(name,self.actors)
+
+        if shape is None:
+            shape = np.shape(self.get_value(name))
+        assert len(shape) >= 1, 'a vector needs a shape; got %r'%(shape,)
+
+        self.__history.set_shape(name, shape, dtype)
+        self.__df = None
+
+    def get_column_array(self, actor):
+        '''
+        Returns the history of an actor as an array: `(time stamps, *shape)` values
+        for a vector declared with `declare_vector()`.
+
+        Parameters
+        ----------
+        actor: str
+
+        Returns
+        -------
+        values: numpy.ndarray
+            A copy.
+        '''
+        assert actor in self.__history, 'actor %r not in %r'%(actor, self.actors)
+        return self.__history.column(actor).copy()
+
     def add_single_species(self, new_species, discard_new_duplicate=False):
         """
         Adds a new specie object to the phase history. See species.py for
@@ -392,8 +595,8 @@ class PhaseNew:
         assert isinstance(new_species, Species)
 
         if not discard_new_duplicate:
-            assert new_species.name not in list(self.__df.columns), \
-                   'new_species: %r exists. Current names: %r'%(new_species, self.__df.columns)
+            assert new_species.name not in self.__history, \
+                   'new_species: %r exists. Current names: %r'%(new_species, self.actors)
 
         if self.__species is not None: # self.__species could be empty
             species_formulae = [specie.formula_name for specie in self.__species]
@@ -411,17 +614,15 @@ class PhaseNew:
                 return
 
         if self.__species is not None:
-            self.__species.append(deepcopy(new_species))
+            self.__species.append(self.__copy_value(new_species))
         else:
-            self.__species = [deepcopy(new_species)] # create a list here
+            self.__species = [self.__copy_value(new_species)] # create a list here
 
         new_name = new_species.name
 
-        new_column = pandas.DataFrame(index=list(self.__df.index), columns=[new_name])
-        tmp = self.__df
-        df = tmp.join(new_column, how='outer')
-
-        self.__df = df.infer_objects().fillna(0).astype(float) # for species fill concentration with float as default
+        # for species fill concentration with float as default
+        self.__history.add_column(new_name, 0.0)
+        self.__df = None
 
     def add_quantity(self, new_quant):
         '''
@@ -434,20 +635,17 @@ class PhaseNew:
         '''
 
         assert isinstance(new_quant, Quantity)
-        assert new_quant.name not in list(self.__df.columns), \
+        assert new_quant.name not in self.__history, \
                'quantity: %r exists. Current names: %r' % \
-               (new_quant, self.__df.columns)
+               (new_quant, self.actors)
         quant_formal_names = [quant.formal_name for quant in self.__quantities]
         assert new_quant.formal_name not in quant_formal_names
         self.__quantities.append(new_quant)
         new_name = new_quant.name
 
         # create a col with object data type; user must fill out column
-        col = pandas.DataFrame( index=list( self.__df.index), columns=[new_name],
-                                dtype=object )
-        tmp = self.__df
-        df  = tmp.join(col, how='outer')
-        #self.__df = df.fillna(new_quant.value)
+        self.__history.add_column(new_name, None)
+        self.__df = None
 
     def add_row(self, try_time_stamp, row_values):
         '''
@@ -461,26 +659,89 @@ class PhaseNew:
         row_values: list
 
         '''
-        assert try_time_stamp not in self.__df.index, 'already used time_stamp: %r'%\
-                (try_time_stamp)
         assert isinstance(row_values, list)
 
         time_stamp = self.__get_time_stamp( try_time_stamp )
         assert time_stamp is None, 'already used time_stamp: %r'%(try_time_stamp)
-        time_stamp = try_time_stamp
+        time_stamp = float(try_time_stamp)
 
-        assert len(row_values) == self.__df.columns.size
+        assert len(row_values) == len(self.__history.names)
 
-        # create a row with object data type; users row_values data define data type
-        row = pandas.DataFrame( index=[time_stamp],
-                                columns=list( self.__df.columns ), dtype=object )
+        # users row_values data define data type
+        self.__history.append(time_stamp, row_values)
+        self.__df = None
+        return
 
-        for (col,v) in zip(row.columns, row_values):
-            row.loc[time_stamp,col] = v
+    def append_step(self, try_time_stamp, **values):
+        '''
+        Adds a row at `try_time_stamp` with the values of the last row, except for
+        the actors given, e.g. `append_step(t, position=x, velocity=v)`; actor names
+        that are not Python names can be given as `**{'radial-position': r}`. The
+        time stamp is looked up and the actors are checked once. Values given follow
+        the `copy_policy`.
 
-        frames = [self.__df, row]
-        self.__df = pandas.concat(frames)
-        return
+        Parameters
+        ----------
+        try_time_stamp: float
+        values: dict(str:any)
+            New values by actor.
+
+        '''
+        for actor in values:
+            assert actor in self.__history, 'actor %r not in %r'%(actor, self.actors)
+
+        time_stamp = self.__get_time_stamp( try_time_stamp )
+        assert time_stamp is None, 'already used time_stamp: %r'%(try_time_stamp)
+
+        row_values = self.__history.row(-1) # values at previous time
+        for (j, actor) in enumerate(self.__history.names):
+            if actor in values:
+                row_values[j] = values[actor]
+                if self.__history.shape(actor) is None:
+                    row_values[j] = self.__copy_value(row_values[j])
+
+        self.__history.append(float(try_time_stamp), row_values)
+        self.__df = None
+
+    def add_rows(self, try_time_stamps, arrays):
+        '''
+        Adds many rows at once, e.g. a precomputed trajectory. The time stamps must
+        increase and come after the last time stamp of the history. Values are
+        stored as given, as with `add_row()`.
+
+        Parameters
+        ----------
+        try_time_stamps: list or numpy.ndarray
+        arrays: dict(str:sequence) or list(sequence)
+            Values of every actor, one per time stamp: by actor name, or in the
+            order of `actors`. Use a `(time stamps, *shape)` array for a vector
+            declared with `declare_vector()`.
+
+        '''
+        time_stamps = np.asarray(try_time_stamps, dtype=np.float64).reshape(-1)
+
+        actors = self.__history.names
+        if isinstance(arrays, dict):
+            assert set(arrays) == set(actors), \
+                'values of actors %r given for actors %r'%(sorted(arrays), actors)
+            arrays = [arrays[actor] for actor in actors]
+        assert len(arrays) == len(actors), \
+            '%r arrays for %r actors'%(len(arrays), len(actors))
+
+        if time_stamps.size == 0:
+            return
+
+        # Same tolerance as add_row(), checked against the history as it grows
+        num_rows = len(self.__history) + time_stamps.size
+        spacing = abs(time_stamps[-1] - self.__history.times[0]) / max(num_rows - 1, 1)
+        tol = 1.0e-3 * spacing if num_rows >= 2 else 1.0e-3
+        steps = np.diff(np.concatenate((self.__history.times[-1:], time_stamps)))
+        assert np.all(steps > tol), \
+            'time stamps must increase past the last time stamp %r'% \
+            self.__history.times[-1]
+
+        self.__history.extend(time_stamps, arrays)
+        self.__df = None
 
     def get_row(self, try_time_stamp=None):
         '''
@@ -493,12 +754,12 @@ class PhaseNew:
 
         Returns
         -------
-        list(self.__df.loc[time_stamp, :]): list
+        row: list
 
         '''
-        time_stamp = self.__get_time_stamp( try_time_stamp )
-        assert time_stamp is not None, 'missing try_time_stamp: %r'%(try_time_stamp)
-        return list(self.__df.loc[time_stamp, :])
+        row = self.__get_row_index( try_time_stamp )
+        assert row is not None, 'missing try_time_stamp: %r'%(try_time_stamp)
+        return self.__history.row(row)
 
     def get_column(self, actor):
         '''
@@ -511,12 +772,14 @@ class PhaseNew:
 
         Returns
         -------
-        list(self.__df.loc[:, actor]): list
+        column: list
 
         '''
         assert isinstance(actor, str)
-        assert actor in self.__df.columns, 'actor %r not in %r'%(actor, self.__df.columns)
-        return list(self.__df.loc[:, actor])
+        assert actor in self.__history, 'actor %r not in %r'%(actor, self.actors)
+        if self.__history.shape(actor) is not None: # a list of vectors
+            return list(self.__history.column(actor).copy())
+        return self.__history.column(actor).tolist()
 
     def scale_row(self, try_time_stamp, value):
         '''
@@ -530,10 +793,11 @@ class PhaseNew:
 
         '''
         assert isinstance(try_time_stamp, int) or isinstance(try_time_stamp, float)
-        time_stamp = self.__get_time_stamp( try_time_stamp )
-        assert time_stamp is not None, 'missing try_time_stamp: %r'%(try_time_stamp)
+        row = self.__get_row_index( try_time_stamp )
+        assert row is not None, 'missing try_time_stamp: %r'%(try_time_stamp)
         #assert isinstance(value, int) or isinstance(value, float)
-        self.__df.loc[time_stamp, :] *= value
+        self.__history.scale_row(row, value)
+        self.__df = None
         return
 
     def ClearHistory(self, value=0.0):
@@ -547,7 +811,8 @@ class PhaseNew:
 
         '''
         assert isinstance(value, int) or isinstance(value, float)
-        self.__df.loc[:, :] = value
+        self.__history.fill(value)
+        self.__df = None
 
         return
 
@@ -570,23 +835,15 @@ class PhaseNew:
         if try_time_stamp is not None:
            assert isinstance(try_time_stamp, int) or isinstance(try_time_stamp, float)
 
-        time_stamp = self.__get_time_stamp( try_time_stamp )
-        assert time_stamp is not None, 'missing try_time_stamp: %r'%(try_time_stamp)
-
-        values = self.GetRow(time_stamp)  # save values
+        row = self.__get_row_index( try_time_stamp )
+        assert row is not None, 'missing try_time_stamp: %r'%(try_time_stamp)
 
-        columns = list(self.__df.columns)
-        assert len(columns) == len(values), 'FATAL: oops internal error.'
+        self.__history.keep_row(row)  # values of the row are restored
 
-        self.__df = pandas.DataFrame( index=[time_stamp], columns=columns )
-        self.__df.fillna( 0.0, inplace=True )
-
-        if value is None:
-            for v in values:
-                idx = values.index(v)
-                self.__df.loc[time_stamp, columns[idx]] = v  # restore values
-        else:
-            self.__df.loc[time_stamp, :] = value   # set user-given value
+        if value is not None:
+            for name in self.__history.names:
+                self.__history.set(0, name, value)   # set user-given value
+        self.__df = None
 
         return
 
@@ -601,39 +858,82 @@ class PhaseNew:
 
         Returns
         -------
-        self.__df.loc[time_stamp, actor]: any
+        value: any
 
         """
         assert isinstance(actor, str)
-        assert actor in self.__df.columns, 'actor %r not in %r'%(actor,self.__df.columns)
+        assert actor in self.__history, 'actor %r not in %r'%(actor,self.actors)
 
         if try_time_stamp is not None:
            assert isinstance(try_time_stamp, int) or isinstance(try_time_stamp, float)
 
-        time_stamp = self.__get_time_stamp(try_time_stamp)
-        assert time_stamp is not None, 'missing try_time_stamp: %r'%(try_time_stamp)
+        row = self.__get_row_index(try_time_stamp)
+        assert row is not None, 'missing try_time_stamp: %r'%(try_time_stamp)
+
+        return self.__history.get(row, actor)
+
+    def set_values(self, values, try_time_stamp=None, copy=None):
+        """Set the values of several actors at a time stamp.
+
+        The time stamp is looked up once.
 
-        return self.__df.loc[time_stamp, actor]
+        Parameters
+        ----------
+        values: dict(str:any)
+            New values by actor.
+        try_time_stamp: float
+            Default is None which sets the values at the last time stamp.
+        copy: str or None
+            Copy policy of this call; see `set_value()`.
+        """
+        assert isinstance(values, dict)
+        for actor in values:
+            assert actor in self.__history, 'actor = %r not in history'%actor
 
-    def set_value(self, actor, value, try_time_stamp=None):
+        if try_time_stamp is not None:
+            assert isinstance(try_time_stamp, int) or isinstance(try_time_stamp, float)
+
+        row = self.__get_row_index(try_time_stamp)
+        assert row is not None, 'missing try_time_stamp: %r'%(try_time_stamp)
+
+        for (actor, value) in values.items():
+            if self.__history.shape(actor) is None:
+                value = self.__copy_value(value, copy)
+            self.__history.set(row, actor, value)
+        self.__df = None
+
+    def set_value(self, actor, value, try_time_stamp=None, copy=None):
         """Set value of actor in the data frame at a give time stamp.
 
+        Parameters
+        ----------
+        actor: str
+        value: any
+        try_time_stamp: float
+            Default is None which sets the value at the last time stamp.
+        copy: str or None
+            Copy policy of this call: 'deep', 'shallow' or 'none'. Default: the
+            `copy_policy` of the phase.
+
         Note
         ----
         The value in the original species or quantity container is not modified.
         """
         assert isinstance(actor, str)
-        assert actor in self.__df.columns, 'actor = %r not in data frame'%actor
+        assert actor in self.__history, 'actor = %r not in history'%actor
 
         if try_time_stamp is not None:
             assert isinstance(try_time_stamp, int) or isinstance(try_time_stamp, float)
 
-        time_stamp = self.__get_time_stamp(try_time_stamp)
-        assert time_stamp is not None, 'missing try_time_stamp: %r'%(try_time_stamp)
+        row = self.__get_row_index(try_time_stamp)
+        assert row is not None, 'missing try_time_stamp: %r'%(try_time_stamp)
 
         # Note: user value could have a different type than other column values.
         # If there is a type change, this will not be checked; user has been advised.
-        self.__df.loc[time_stamp, actor] = deepcopy(value)
+        if self.__history.shape(actor) is None:
+            value = self.__copy_value(value, copy)
+        self.__history.set(row, actor, value) # a declared vector is copied in place
+        self.__df = None
 
         return
 
@@ -647,7 +947,7 @@ class PhaseNew:
         """
         assert isinstance(filename, str)
 
-        tmp = pandas.DataFrame(self.__df)
+        tmp = self.__history.frame()
         column_names = tmp.columns
 
         if self.__species:
@@ -674,6 +974,265 @@ class PhaseNew:
 
         tmp.to_html(filename)
 
+    def save(self, filename, chunk_rows=65536):
+        """Save the `Phase` container into a chunked columnar file.
+
+        Each column is compressed separately in chunks of rows, with a time index,
+        so that `load()` reads only the columns and time window asked for. See
+        `cortix.support.phase_file`.
+
+        Parameters
+        ----------
+        filename: str
+        chunk_rows: int
+            Rows per chunk.
+
+        """
+        assert isinstance(filename, str)
+
+        names = self.__history.names
+        columns = [self.__history.column(name) for name in names]
+        shapes = {j: self.__history.shape(name) for (j, name) in enumerate(names)
+                  if self.__history.shape(name) is not None}
+        metadata = {'name': self.name, 'time_unit': self.__time_unit,
+                    'copy': self.__copy, 'species': self.__species,
+                    'quantities': self.__quantities}
+
+        write_phase_file(filename, self.__history.times, names, columns, shapes,
+                         metadata, chunk_rows)
+
+    @classmethod
+    def load(cls, filename, columns=None, time_range=None):
+        """Load a `Phase` container saved with `save()`; only the blocks of the
+        columns and time window asked for are read.
+
+        Parameters
+        ----------
+        filename: str
+        columns: list(str) or None
+            Actors loaded; the others are left out of the phase. Default: all.
+        time_range: tuple(float, float) or None
+            First and last time stamps loaded; either may be None. Default: all.
+
+        Returns
+        -------
+        phase: PhaseNew
+
+        """
+        assert isinstance(filename, str)
+
+        (times, names, arrays, shapes, metadata) = \
+            read_phase_file(filename, columns, time_range)
+
+        species = [spc for spc in metadata['species'] or list() if spc.name in names]
+        quantities = [quant for quant in metadata['quantities'] or list()
+                      if quant.name in names]
+
+        return cls.__from_columns(metadata['name'], metadata['time_unit'],
+                                  metadata['copy'], species, quantities,
+                                  times, names, arrays, shapes)
+
+    def interpolate(self, actor, try_time_stamps, kind='linear'):
+        """Values of an actor at any times, e.g. the times of another module's
+        steps, computed for all times in one vectorized call. Unlike `get_value()`,
+        the times need not be time stamps of the history.
+
+        Parameters
+        ----------
+        actor: str
+        try_time_stamps: float or list or numpy.ndarray
+        kind: str
+            'linear'; 'previous': the value held since the last time stamp; or
+            'cubic': a cubic spline. Values before the first and after the last
+            time stamp are those of the first and last time stamp. Actors with
+            values other than floats and declared vectors allow 'previous' only.
+
+        Returns
+        -------
+        values: numpy.ndarray
+            One value per time (a vector for a declared vector); a single value
+            for a single time.
+
+        """
+        assert isinstance(actor, str)
+        assert actor in self.__history, 'actor %r not in %r'%(actor, self.actors)
+
+        values = self.__history.interpolate(actor, try_time_stamps, kind)
+        if np.ndim(try_time_stamps) == 0:
+            value = values[0]
+            return float(value) if isinstance(value, np.floating) else value
+        return values
+
+    def window(self, start=None, end=None, actors=None):
+        """History of actors between two times, located by binary search on the
+        time stamps instead of a scan of the whole history.
+
+        Parameters
+        ----------
+        start: float or None
+            First time included; default: from the first time stamp.
+        end: float or None
+            Last time included; default: up to the last time stamp.
+        actors: list(str) or None
+            Default: all actors.
+
+        Returns
+        -------
+        times: numpy.ndarray
+            Time stamps in the window, in increasing order.
+        values: dict(str:numpy.ndarray)
+            Values of each actor at `times`; `(len(times), *shape)` arrays for
+            declared vectors. Read-only views of the history when the rows were
+            added in time order, copies otherwise; the views are valid until the
+            next row is added.
+
+        """
+        if actors is None:
+            actors = self.__history.names
+        for actor in actors:
+            assert actor in self.__history, 'actor %r not in %r'%(actor, self.actors)
+
+        rows = self.__history.window(start, end)
+
+        times = self.__history.times[rows]
+        values = dict()
+        for actor in actors:
+            values[actor] = self.__history.column(actor)[rows]
+            values[actor].flags.writeable = False # changes go through set_value()
+
+        return (times, values)
+
+    def reduce_window(self, actor, reduction, start=None, end=None):
+        """Reduction of the values of an actor between two times, computed over the
+        arrays of the window (see `window()`).
+
+        Parameters
+        ----------
+        actor: str
+            An actor with float values or a declared vector.
+        reduction: str
+            'min', 'max', 'mean' (of the values at the time stamps) or 'integral'
+            (over time, by the trapezoidal rule).
+        start: float or None
+        end: float or None
+
+        Returns
+        -------
+        value: float or numpy.ndarray
+            An array, per component, for a declared vector.
+
+        """
+        assert reduction in ('min', 'max', 'mean', 'integral'), \
+            "reduction must be 'min', 'max', 'mean' or 'integral'; got %r"%reduction
+
+        (times, values) = self.window(start, end, [actor])
+        values = values[actor]
+        assert values.dtype != object, 'actor %r holds objects'%actor
+        assert len(times) > 0, 'no time stamps from %r to %r'%(start, end)
+
+        if reduction == 'min':
+            value = values.min(axis=0)
+        elif reduction == 'max':
+            value = values.max(axis=0)
+        elif reduction == 'mean':
+            value = values.mean(axis=0)
+        else:
+            steps = np.diff(times).reshape((-1,) + (1,) * (values.ndim - 1))
+            value = (0.5 * steps * (values[1:] + values[:-1])).sum(axis=0)
+
+        if np.ndim(value) == 0:
+            return float(value)
+        return value
+
+    def resample(self, dt, kind='linear', start=None, end=None):
+        """New `Phase` with the history at equally spaced time stamps.
+
+        Parameters
+        ----------
+        dt: float
+            Time step.
+        kind: str
+            How values are interpolated; see `interpolate()`. Actors with other
+            values than floats and declared vectors are resampled with 'previous'.
+        start: float or None
+            First time stamp; default: the first of the history.
+        end: float or None
+            Last time stamp at most; default: the last of the history.
+
+        Returns
+        -------
+        phase: PhaseNew
+
+        """
+        assert dt > 0.0, 'dt must be positive; got %r'%dt
+
+        stamps = self.__history.times
+        if start is None:
+            start = float(stamps.min())
+        if end is None:
+            end = float(stamps.max())
+        assert end >= start, 'end %r before start %r'%(end, start)
+
+        num_steps = int(np.floor((end - start) / dt * (1.0 + 1.0e-12))) + 1
+        times = start + dt * np.arange(num_steps)
+
+        names = self.__history.names
+        arrays = list()
+        shapes = dict()
+        for (j, name) in enumerate(names):
+            if self.__history.shape(name) is not None:
+                shapes[j] = self.__history.shape(name)
+            if self.__history.column(name).dtype == object:
+                arrays.append(self.__history.interpolate(name, times, 'previous'))
+            else:
+                arrays.append(self.__history.interpolate(name, times, kind))
+
+        return self.__from_columns(self.name, self.__time_unit, self.__copy,
+                                   self.__species, self.__quantities,
+                                   times, names, arrays, shapes)
+
+    @classmethod
+    def __from_columns(cls, name, time_unit, copy, species, quantities,
+                       times, names, arrays, shapes):
+        """New phase with the history given by column."""
+
+        phase = cls(name=name, time_unit=time_unit, species=species or None,
+                    quantities=quantities or None, copy=copy)
+
+        phase.__history = PhaseHistory(names, capacity=len(times))
+        for (j, shape) in shapes.items():
+            phase.__history.set_shape(names[j], shape, arrays[j].dtype)
+        phase.__history.extend(times, arrays)
+
+        return phase
+
+    def __copy_value(self, value, copy=None):
+        """Copy of `value` according to a copy policy; default: the phase policy."""
+
+        if copy is None:
+            copy = self.__copy
+
+        if copy == 'deep':
+            return deepcopy(value)
+        elif copy == 'shallow':
+            return shallowcopy(value)
+
+        assert copy == 'none', "copy must be 'deep', 'shallow' or 'none'; got %r"%copy
+        if isinstance(value, np.ndarray) and value.flags.writeable:
+            # The phase takes the array over: nobody can change it in place afterwards.
+            # A view is copied; the memory it shows may be written through its base.
+            if not value.flags.owndata:
+                value = value.copy()
+            value.flags.writeable = False
+        return value
+
+    def __getstate__(self):
+        """Pickle without the data frame built from the history."""
+
+        state = self.__dict__.copy()
+        state['_PhaseNew__df'] = None
+        return state
+
     def __str__(self):
         s = '\n\t **Phase()**: name=%s;' + \
             '\n\t time unit: %s;' + \
@@ -689,9 +1248,9 @@ class PhaseNew:
                 self.__time_unit,
                 self.__quantities,
                 self.__species,
-                len(self.__df.index),
-                self.__df.index[-1],
-                self.__df.loc[self.__df.index[-1], :])
+                len(self.__history),
+                self.__history.times[-1],
+                self.__history.frame(-1).iloc[-1])
 
     def __repr__(self):
         s = '\n\t **Phase()**: name=%s;' + \
@@ -708,17 +1267,14 @@ class PhaseNew:
                 self.__time_unit,
                 self.__quantities,
                 self.__species,
-                len(self.__df.index),
-                self.__df.index[-1],
-                self.__df.loc[self.__df.index[-1], :])
+                len(self.__history),
+                self.__history.times[-1],
+                self.__history.frame(-1).iloc[-1])
 
     def __get_time_stamp(self, try_time_stamp=None):
         """ Helper method for finding the closest time stamp to `try_time_stamp` in the phase history.
 
-        The pandas index container used for storing
-        float data type time stamps will return the nearest time stamp up to a
-        tolerance. Whether the time index has one value, this function will
-        inspect for the proximity to that value.
+        See `__get_row_index()`.
 
         Parameters
         ----------
@@ -727,35 +1283,48 @@ class PhaseNew:
 
         Returns
         -------
-        self.__df.index[loc]: float or None
+        time_stamp: float or None
+            Will return None if no time stamp within tolerance is found.
+
+        """
+
+        row = self.__get_row_index(try_time_stamp)
+        if row is None:
+            return None
+        else:
+            return float(self.__history.times[row])
+
+    def __get_row_index(self, try_time_stamp=None):
+        """ Helper method for finding the row of the closest time stamp to `try_time_stamp`.
+
+        The nearest time stamp is returned up to a tolerance of 1e-3 times the mean
+        time step; it is found by binary search, and the last time stamp is checked
+        first. Whether the history has one time stamp, this function will inspect for
+        the proximity to that value.
+
+        Parameters
+        ----------
+        try_time_stamp: float, int or None
+            Default: None will return the last row.
+
+        Returns
+        -------
+        row: int or None
             Will return None if no time stamp within tolerance is found.
 
         """
-        import numpy as np
 
         tol = 1.0e-3
 
         if try_time_stamp is None:
-            return self.__df.index[-1]
+            return len(self.__history) - 1
         else:
-            time_stamps = np.array(self.__df.index)
-            if time_stamps.size >= 2:
-               tol = 1.0e-3 * np.diff(time_stamps).mean() # 1e-3 * the mean delta t
-
-            # deprecated (no exception thrown)
-            #try: # abs(index_value - try_time_stamp) <= tolerance
-            #    loc = self.__df.index.get_loc(try_time_stamp, method='nearest', tolerance=tol)
-            #except KeyError: # no value found within tol
-            #    return None
-            #else:
-            #    return  self.__df.index[loc]
-
-            # abs(index_value - try_time_stamp) <= tolerance
-            loc = self.__df.index.get_indexer([try_time_stamp], method='nearest', tolerance=tol)[0]
-            if loc == -1:
-                return None
-            else:
-                return  self.__df.index[loc]
+            if self.__history.mean_step != 0.0:
+               # 1e-3 * the mean delta t of the rows added, whatever retain() kept
+               tol = 1.0e-3 * abs(self.__history.mean_step)
+
+            # abs(time_stamp - try_time_stamp) <= tolerance
+            return self.__history.nearest(try_time_stamp, tol)
 
     def plot_species(self, name, scaling=[1.0, 1.0] , title=None, xlabel='Time [s]',
                      ylabel='y', legend=None, filename_tag=None, figsize=[6,5],
@@ -766,7 +1335,7 @@ class PhaseNew:
 
         fig,ax=plt.subplots(1, figsize=figsize)
 
-        x = np.array([t for t in self.__df.index])
+        x = self.__history.times.copy()
         x *= float(scaling[0])
 
         y = np.array(self.get_column(name), dtype=np.float64)
@@ -833,11 +1402,11 @@ class PhaseNew:
             When used in an interactive session, show the plots on display.
         """
 
-        if len(self.__df.columns) == 0:
+        if len(self.__history.names) == 0:
             return
 
         if actors is None:
-            actors = self.__df.columns
+            actors = self.__history.names
         else:
             assert isinstance(actors, list)
 
@@ -934,16 +1503,16 @@ class PhaseNew:
             # Sanity check assumes all species come before all quantities in the data frame.
             if species:
                 if i_var <= len(self.__species):
-                    assert self.__species[i_var].name == self.__df.columns[i_var]
+                    assert self.__species[i_var].name == self.__history.names[i_var]
             if quantity and species:
                 if i_var > len(self.__species):
-                    assert self.__quantities[i_var].name == self.__df.columns[i_var]
+                    assert self.__quantities[i_var].name == self.__history.names[i_var]
             elif quantity: # only quantities exist and species is empty
                 if i_var > len(self.__species):
-                    assert self.__quantities[i_var].name == self.__df.columns[i_var], \
+                    assert self.__quantities[i_var].name == self.__history.names[i_var], \
                        'ivar=%r; __quant[i]=%r; __df.col[i]=%r; __quant=%r; __df.col=%r'%(i_var,
-                       self.__quantities[i_var].name, self.__df.columns[i_var], self.__quantities,
-                       self.__df.columns)
+                       self.__quantities[i_var].name, self.__history.names[i_var], self.__quantities,
+                       self.__history.names)
 
             '''
             if varUnit == 'gram':
@@ -972,7 +1541,7 @@ class PhaseNew:
             if time_unit == 'minute':
                 time_unit = 'min'
 
-            x = np.array([i for i in self.__df.index])
+            x = self.__history.times.copy()
             #x *= x_scaling
 
             if (varScale == 'linear' or varScale == 'linear-linear' or \
@@ -988,7 +1557,7 @@ class PhaseNew:
                     if time_unit == 'second' or time_unit=='s':
                         time_unit = 'min'
 
-            y = np.array(self.__df[col_name]) # convert to numpy ndarray
+            y = np.array(self.__history.column(col_name)) # copy to numpy ndarray
 
             '''
             if (y.max() >= 1e3 or y.min() <= -1e3) and varScale != 'linear-log' and \
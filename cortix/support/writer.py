@@ -0,0 +1,380 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This file is part of the Cortix toolkit environment
+# https://cortix.org
+"""Columnar output writer module.
+
+A `Writer` receives batches of time series rows from any number of producer modules
+through its ports and writes them to chunked columnar files; producers only send
+rows. Messages on a port:
+
+    dict        a batch of rows: column name mapped to a sequence of values (all of
+                the same length), or to a single value for a one-row batch. Values
+                may be arrays; a column of 3-vectors is stored as an (n, 3) array.
+    (str, dict) a batch for the named series; by default the series is the port name.
+    None        the producer is done with the port.
+
+The rows of each series are buffered by column and written every `chunk_rows` rows;
+when all series together buffer more than `max_buffered_rows`, the largest buffer is
+written early, so memory stays bounded however long the run. Formats:
+
+    'npz'      one compressed NumPy archive per chunk: `<series>.<chunk>.npz`.
+    'parquet'  one Parquet file per series, one row group per chunk (needs pyarrow).
+               Integers are stored as int64 and floats as float64. A column of
+               integers that gets floats or missing values (None) in a later chunk
+               is widened to float64: the file written so far is rewritten, once
+               per widened column.
+    'auto'     Parquet if pyarrow is available, else npz.
+
+Series names are file names: they must not be empty or hold path separators, and
+must not start with a dot.
+
+`read_series()` loads a series back from either format.
+
+Example
+-------
+    writer = Writer('output', chunk_rows=1024)
+    network.connect([body, 'output'], [writer, 'earth'])
+    ...
+    body.send({'time': t, 'position': position}, 'output') # each step
+    body.send(None, 'output')                              # when done
+"""
+
+import os
+import glob
+import threading
+import numpy as np
+
+from cortix.src.module import Module
+
+def _check_series(series):
+    """Reject series names that are not plain file names."""
+
+    assert isinstance(series, str) and series and not series.startswith('.') and \
+        os.sep not in series and (os.altsep is None or os.altsep not in series) and \
+        '\0' not in series, 'Writer: series name %r is not a plain file name'%(series,)
+
+def _parquet_type(pa, arrow_type):
+    """Parquet column type of a chunk column: int64 for integers, float64 for floats."""
+
+    if pa.types.is_integer(arrow_type):
+        return pa.int64()
+    if pa.types.is_floating(arrow_type):
+        return pa.float64()
+    if pa.types.is_fixed_size_list(arrow_type):
+        return pa.list_(_parquet_type(pa, arrow_type.value_type), arrow_type.list_size)
+    return arrow_type
+
+def _common_type(pa, type_a, type_b):
+    """Parquet column type holding the values of two column types, or None.
+
+    Integers mixed with floats or with missing values (a column of nulls) are float64.
+    """
+
+    if type_a == type_b:
+        return type_a
+    if pa.types.is_null(type_b):
+        (type_a, type_b) = (type_b, type_a)
+    if pa.types.is_null(type_a):
+        return pa.float64() if pa.types.is_integer(type_b) else type_b
+    numbers = (pa.types.is_integer, pa.types.is_floating)
+    if any(f(type_a) for f in numbers) and any(f(type_b) for f in numbers):
+        return pa.float64()
+    if pa.types.is_fixed_size_list(type_a) and pa.types.is_fixed_size_list(type_b) and \
+       type_a.list_size == type_b.list_size:
+        value_type = _common_type(pa, type_a.value_type, type_b.value_type)
+        if value_type is not None:
+            return pa.list_(value_type, type_a.list_size)
+    return None
+
+class Writer(Module):
+    """Module writing the time series received on its ports to chunked columnar files."""
+
+    def __init__(self, directory='output', chunk_rows=4096, max_buffered_rows=None,
+                 file_format='auto'):
+        """Constructs a Writer module.
+
+        Parameters
+        ----------
+        directory: str
+            Output directory; created if needed.
+        chunk_rows: int
+            Rows of a series written at once.
+        max_buffered_rows: int or None
+            Rows buffered over all series before the largest buffer is written early.
+            Default: 4 * `chunk_rows`.
+        file_format: str
+            'npz', 'parquet' or 'auto'.
+
+        Attributes
+        ----------
+        num_rows: dict(str:int)
+            Rows written by series.
+        files: dict(str:list(str))
+            Files written by series.
+        """
+
+        super().__init__()
+
+        assert chunk_rows >= 1, 'chunk_rows must be positive; got %r'%chunk_rows
+        assert file_format in ('npz', 'parquet', 'auto'), \
+            "file_format must be 'npz', 'parquet' or 'auto'; got %r"%file_format
+
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        if max_buffered_rows is None:
+            max_buffered_rows = 4 * chunk_rows
+        self.max_buffered_rows = max_buffered_rows
+        self.file_format = file_format
+
+        self.num_rows = dict()
+        self.files = dict()
+
+        self.__buffers = dict()       # series: column name: list of batch arrays
+        self.__buffered = dict()      # series: rows buffered
+        self.__num_chunks = dict()    # series: chunks written
+        self.__parquet_writers = dict()
+        self.__lock = threading.Lock()
+
+    def run(self, *args):
+        """Receive on every port in its own thread until each producer sends None."""
+
+        errors = list()
+        def receive(port):
+            try:
+                while True:
+                    message = self.recv(port)
+                    if message is None:
+                        break
+                    self.write(message, port.name)
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=receive, args=(port,)) for port in self.ports]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.close()
+
+        if errors:
+            raise errors[0]
+
+        if self.log is not None:
+            for series in sorted(self.num_rows):
+                self.log.info('Writer: {} row(s) of {} in {} file(s)'.format(
+                    self.num_rows[series], series, len(self.files[series])))
+
+    def write(self, message, series=None):
+        """Buffer a batch of rows and write the chunks that are full.
+
+        Parameters
+        ----------
+        message: dict or tuple(str, dict)
+            See the module documentation.
+        series: str
+            Series of a dict batch.
+        """
+
+        if isinstance(message, tuple):
+            (series, message) = message
+        assert isinstance(message, dict) and message, \
+            'Writer: a batch must be a dict of columns; got %r'%type(message)
+        assert series is not None, 'Writer: batch without a series name'
+        _check_series(series)
+
+        columns = dict()
+        for (name, values) in message.items():
+            values = np.asarray(values)
+            if values.ndim == 0:
+                values = values.reshape(1)
+            columns[name] = values
+        num_rows = {len(values) for values in columns.values()}
+        assert len(num_rows) == 1, \
+            'Writer: columns of a batch of %r differ in length %r'%(series, sorted(num_rows))
+        num_rows = num_rows.pop()
+
+        with self.__lock:
+            buffers = self.__buffers.setdefault(series, {name: list() for name in columns})
+            assert set(buffers) == set(columns), \
+                'Writer: columns of %r changed from %r to %r'%(series, sorted(buffers),
+                                                                sorted(columns))
+            for (name, values) in columns.items():
+                buffers[name].append(values)
+            self.__buffered[series] = self.__buffered.get(series, 0) + num_rows
+
+            while self.__buffered[series] >= self.chunk_rows:
+                self.__write_chunk(series, self.chunk_rows)
+
+            # Bound the memory of all buffers together
+            while sum(self.__buffered.values()) > self.max_buffered_rows:
+                largest = max(self.__buffered, key=self.__buffered.get)
+                self.__write_chunk(largest, self.__buffered[largest])
+
+    def close(self):
+        """Write the rows left in the buffers and close the files."""
+
+        with self.__lock:
+            for series in list(self.__buffered):
+                if self.__buffered[series]:
+                    self.__write_chunk(series, self.__buffered[series])
+            for writer in self.__parquet_writers.values():
+                writer.close()
+            self.__parquet_writers = dict()
+
+    def __write_chunk(self, series, num_rows):
+        """Write the first `num_rows` buffered rows of a series."""
+
+        chunk = dict()
+        buffers = self.__buffers[series]
+        for (name, batches) in buffers.items():
+            values = np.concatenate(batches) if len(batches) > 1 else batches[0]
+            chunk[name] = values[:num_rows]
+            buffers[name] = [values[num_rows:]] if len(values) > num_rows else list()
+        self.__buffered[series] -= num_rows
+
+        k = self.__num_chunks.get(series, 0)
+        self.__num_chunks[series] = k + 1
+        self.num_rows[series] = self.num_rows.get(series, 0) + num_rows
+
+        # Resolved on the host the module runs on
+        if self.file_format == 'auto':
+            try:
+                # Import here to avoid broken dependency
+                import pyarrow.parquet
+                self.file_format = 'parquet'
+            except ImportError:
+                self.file_format = 'npz'
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        if self.file_format == 'npz':
+            file_name = os.path.join(self.directory, '{}.{:05d}.npz'.format(series, k))
+            np.savez_compressed(file_name, **chunk)
+            self.files.setdefault(series, list()).append(file_name)
+            return
+
+        # Import here to avoid broken dependency
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        arrays = list()
+        for values in chunk.values():
+            if values.ndim > 1: # rows of arrays as fixed size lists
+                width = int(np.prod(values.shape[1:]))
+                array = pa.FixedSizeListArray.from_arrays(pa.array(values.reshape(-1)),
+                                                          width)
+            else:
+                array = pa.array(values)
+                if pa.types.is_integer(array.type) and array.null_count:
+                    array = array.cast(pa.float64()) # integers with missing values
+            arrays.append(array)
+        table = pa.Table.from_arrays(arrays, names=list(chunk))
+        schema = pa.schema([pa.field(field.name, _parquet_type(pa, field.type))
+                            for field in table.schema])
+
+        if series not in self.__parquet_writers:
+            file_name = os.path.join(self.directory, '{}.parquet'.format(series))
+            self.__parquet_writers[series] = pq.ParquetWriter(file_name, schema)
+            self.files[series] = [file_name]
+
+        writer = self.__parquet_writers[series]
+        if not schema.equals(writer.schema):
+            fields = list()
+            for (field, chunk_field) in zip(writer.schema, schema):
+                arrow_type = _common_type(pa, field.type, chunk_field.type)
+                if arrow_type is None:
+                    raise ValueError('Writer: column {} of chunk {} of {} is {}; the '
+                                     'earlier chunks are {}'.format(field.name, k, series,
+                                                                    chunk_field.type,
+                                                                    field.type))
+                fields.append(pa.field(field.name, arrow_type))
+            schema = pa.schema(fields)
+            if not schema.equals(writer.schema):
+                writer = self.__widen(series, schema)
+
+        writer.write_table(table.cast(writer.schema))
+
+    def __widen(self, series, schema):
+        """Rewrite the Parquet file of a series with wider column types.
+
+        Returns
+        -------
+        writer: pyarrow.parquet.ParquetWriter
+            Writer of the rewritten file, open for the next chunks.
+        """
+
+        # Import here to avoid broken dependency
+        import pyarrow.parquet as pq
+
+        file_name = self.files[series][0]
+        self.__parquet_writers.pop(series).close()
+        os.replace(file_name, file_name + '.old')
+
+        # The new writer stays open for the next chunks
+        writer = pq.ParquetWriter(file_name, schema)
+        with pq.ParquetFile(file_name + '.old') as written:
+            for i in range(written.num_row_groups): # one row group per chunk, as written
+                writer.write_table(written.read_row_group(i).cast(schema))
+        os.remove(file_name + '.old')
+        self.__parquet_writers[series] = writer
+
+        if self.log is not None:
+            self.log.info('Writer: column types of {} widened to {}'.format(
+                series, schema.types))
+
+        return writer
+
+    def __getstate__(self):
+        """Pickle without the lock and the open files."""
+
+        state = super().__getstate__()
+        state['_Writer__lock'] = None
+        state['_Writer__parquet_writers'] = dict()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__lock = threading.Lock()
+
+def read_series(directory, series):
+    """Load a series written by a `Writer`.
+
+    Parameters
+    ----------
+    directory: str
+    series: str
+
+    Returns
+    -------
+    columns: dict(str:numpy.ndarray)
+        Column name mapped to all its rows.
+    """
+
+    _check_series(series)
+
+    parquet_file = os.path.join(directory, '{}.parquet'.format(series))
+    if os.path.exists(parquet_file):
+        # Import here to avoid broken dependency
+        import pyarrow.parquet as pq
+        table = pq.read_table(parquet_file)
+        columns = dict()
+        for name in table.column_names:
+            column = table.column(name)
+            values = column.to_numpy(zero_copy_only=False)
+            if values.dtype == object: # fixed size lists back to an (n, width) array
+                values = np.stack(values) if len(values) else values
+            columns[name] = values
+        return columns
+
+    file_names = sorted(glob.glob(os.path.join(directory, '{}.[0-9]*.npz'.format(
+        glob.escape(series)))))
+    assert file_names, 'no output of series %r in %r'%(series, directory)
+
+    chunks = list()
+    for file_name in file_names:
+        with np.load(file_name) as chunk:
+            chunks.append({name: chunk[name] for name in chunk.files})
+
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+"""Network construction benchmark.
+
+Builds ring networks of increasing size with both forms of `Network.connect` and
+reports the wall time per module; near-constant time per module means construction
+scales linearly.
+
+    python -m cortix.tests.benchmark_network [num_modules ...]
+"""
+
+import sys
+import time
+
+from cortix import Network
+from cortix.tests.dummy_module import DummyModule
+
+def build(num_modules):
+    """Build a ring of `num_modules` modules; every module also links to its second neighbor.
+
+    Returns
+    -------
+    (network, seconds): tuple(Network, float)
+    """
+
+    start = time.perf_counter()
+
+    net = Network()
+    mods = list()
+    for i in range(num_modules):
+        mod = DummyModule()
+        mod.name = 'mod{}'.format(i)
+        net.module(mod)
+        mods.append(mod)
+
+    for i in range(num_modules):
+        # Inferred ports (named after the peer module)
+        net.connect(mods[i], mods[(i+1) % num_modules])
+        # Explicit ports
+        net.connect([mods[i], 'skip-out'], [mods[(i+2) % num_modules], 'skip-in'])
+
+    return (net, time.perf_counter() - start)
+
+def main(sizes):
+    print('{:>10} {:>10} {:>14}'.format('modules', 'seconds', 'us/module'))
+    for num_modules in sizes:
+        (net, seconds) = build(num_modules)
+        assert len(net.modules) == num_modules
+        print('{:>10} {:>10.3f} {:>14.1f}'.format(num_modules, seconds,
+                                                   1.0e6*seconds/num_modules))
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 5000, 20000]
+    main(sizes)
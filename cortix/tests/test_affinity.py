@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+import os
+
+from cortix import Cortix
+from cortix import Module
+from cortix import Network
+from cortix.src.affinity import affinity_map, parse_cpu_list, socket_of
+
+# 2 sockets with 4 cores each; cpu = 4*socket + core
+TOPOLOGY = [(4*s + c, s, c) for s in range(2) for c in range(4)]
+
+class Pinned(Module):
+    def __init__(self):
+        super().__init__()
+        self.cpus = None
+
+    def run(self, *args):
+        self.cpus = sorted(os.sched_getaffinity(0))
+
+def test_policies():
+    assert parse_cpu_list('0-3,8,10-11\n') == [0, 1, 2, 3, 8, 10, 11]
+
+    assert affinity_map('compact', 3, TOPOLOGY) == {0: [0], 1: [1], 2: [2]}
+    assert affinity_map('scatter', 3, TOPOLOGY) == {0: [0], 1: [4], 2: [1]}
+    # More modules than CPUs wrap around
+    assert affinity_map('compact', 10, TOPOLOGY)[9] == [1]
+    assert affinity_map({1: 5, 0: [2, 3]}, 2, TOPOLOGY) == {1: [5], 0: [2, 3]}
+
+    # Two communicating groups of four stay on one socket each
+    connected = {(0, 2): 5.0, (2, 4): 5.0, (4, 6): 5.0, (1, 3): 5.0, (3, 5): 5.0,
+                 (5, 7): 5.0, (0, 1): 1.0}
+    cpus_of = affinity_map('scatter', 8, TOPOLOGY, connected)
+    even = {s for idx in (0, 2, 4, 6) for s in socket_of(cpus_of[idx], TOPOLOGY)}
+    odd = {s for idx in (1, 3, 5, 7) for s in socket_of(cpus_of[idx], TOPOLOGY)}
+    assert len(even) == 1 and len(odd) == 1 and even != odd
+    assert sorted(cpu for cpus in cpus_of.values() for cpu in cpus) == list(range(8))
+
+def test_pinned_run(tmp_path):
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        cpu = min(os.sched_getaffinity(0))
+        c = Cortix(use_mpi=False, log_filename_stem='ctx-affinity', loglevel_console='error',
+                   affinity={1: cpu})
+        c.network = Network()
+        for i in range(2):
+            mod = Pinned()
+            mod.save = True
+            c.network.module(mod)
+        c.run()
+        c.close()
+
+        assert c.network.modules[1].cpus == [cpu]
+        assert c.network.modules[0].cpus == sorted(os.sched_getaffinity(0))
+        with open('ctx-affinity.log') as fin:
+            assert 'Module Pinned pinned to CPU(s) [{}]'.format(cpu) in fin.read()
+    finally:
+        os.chdir(cwd)
+
+if __name__ == "__main__":
+    import tempfile, pathlib
+    test_policies()
+    with tempfile.TemporaryDirectory() as tmp:
+        test_pinned_run(pathlib.Path(tmp))
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+import os
+import pytest
+
+from cortix import Cortix
+from cortix import Module
+from cortix import Network
+from cortix.src.convergence import relative_change
+
+class Tank(Module):
+    """Relaxes its level toward the level of the connected tank."""
+
+    def __init__(self, level, num_steps=20000, rate=0.2):
+        super().__init__()
+        self.level = level
+        self.num_steps = num_steps
+        self.rate = rate
+        self.history = [level]
+
+    def run(self, *args):
+        for step in range(self.num_steps):
+            self.send(self.level, 'pipe')
+            other = self.recv('pipe')
+            old = self.level
+            self.level += self.rate * (other - self.level)
+            self.history.append(self.level)
+            if self.report_residual(relative_change(self.level, old)):
+                break
+
+def network_run(tolerance=None, num_steps=20000, monitored=None):
+    c = Cortix(use_mpi=False, log_filename_stem='ctx-converge', loglevel_console='error')
+    c.network = Network()
+    tanks = [Tank(1.0, num_steps), Tank(3.0, num_steps, rate=0.1)]
+    for (i, tank) in enumerate(tanks):
+        tank.name = 'tank{}'.format(i)
+        tank.save = True
+        c.network.module(tank)
+    c.network.connect([tanks[0], 'pipe'], [tanks[1], 'pipe'])
+    monitor = None
+    if tolerance is not None:
+        modules = None if monitored is None else [tanks[i] for i in monitored]
+        monitor = c.network.converge(tolerance, num_intervals=5, modules=modules)
+    try:
+        c.run()
+    finally:
+        c.close()
+    return (monitor, c.network.modules)
+
+def test_steady_state(tmp_path):
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        (monitor, tanks) = network_run(1.0e-9)
+        # Both tanks stopped at the same exchange, long before the end
+        assert monitor.stop_interval is not None and monitor.stop_interval < 10000
+        assert [t.steady_state_interval for t in tanks] == [monitor.stop_interval]*2
+        assert [len(t.history) for t in tanks] == [monitor.stop_interval + 1]*2
+        assert monitor.intervals == [monitor.stop_interval]*2
+        assert max(monitor.residuals) <= 1.0e-9
+        assert abs(tanks[0].level - tanks[1].level) < 1.0e-6
+
+        # Without a monitor the tanks run to their end
+        (monitor, tanks) = network_run(None, num_steps=1500)
+        assert [len(t.history) for t in tanks] == [1501]*2
+        assert [t.steady_state_interval for t in tanks] == [None]*2
+
+        # A module connected to a monitored one must be monitored: it would wait for
+        # messages once the monitored module stops
+        with pytest.raises(AssertionError, match='monitor both or neither'):
+            network_run(1.0e-9, monitored=[0])
+    finally:
+        os.chdir(cwd)
+
+if __name__ == "__main__":
+    import tempfile, pathlib
+    with tempfile.TemporaryDirectory() as tmp:
+        test_steady_state(pathlib.Path(tmp))
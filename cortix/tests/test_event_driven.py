@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+import os
+import pytest
+
+from cortix import Cortix
+from cortix import Module
+from cortix import Network
+
+trace = list() # (time, module name) of every handled message
+
+class Source(Module):
+    """Ticks every time unit; sends a request every fifth tick."""
+
+    def __init__(self):
+        super().__init__()
+        self.acks = list()
+        self.on('request', self.ack) # replies
+
+    def on_start(self, time):
+        self.schedule(time + 1.0, self.tick)
+
+    def tick(self, time, data):
+        if time % 5 == 0:
+            self.post('request', 'request', time + 0.25)
+        self.schedule(time + 1.0, self.tick)
+
+    def ack(self, time, data):
+        trace.append((time, self.name))
+        self.acks.append((time, data))
+
+class Server(Module):
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+        self.ended = None
+        self.on('request', self.request)
+
+    def request(self, time, data):
+        trace.append((time, self.name))
+        self.post('done', 'request', time + self.delay)
+        self.send('seen', 'monitor') # at the current time
+
+    def on_end(self, time):
+        self.ended = time
+
+class Monitor(Module):
+    def __init__(self):
+        super().__init__()
+        self.seen = list()
+        self.on('fast', lambda time, data: self.seen.append((time, 'fast')))
+        self.on('slow', lambda time, data: self.seen.append((time, 'slow')))
+
+class Idle(Module):
+    def run(self, *args):
+        raise RuntimeError('event-driven runs do not call run()')
+
+def network_run(end_time):
+    c = Cortix(use_mpi=False, log_filename_stem='ctx-events', loglevel_console='error')
+    c.network = Network()
+    c.network.event_driven = True
+    c.network.event_end_time = end_time
+    (fast_src, slow_src) = (Source(), Source())
+    (fast_src.name, slow_src.name) = ('fast-source', 'slow-source')
+    (fast, slow) = (Server(0.5), Server(3.0))
+    (fast.name, slow.name) = ('fast', 'slow')
+    monitor = Monitor()
+    idle = Idle()
+    for mod in (fast_src, fast, idle, slow_src, slow, monitor):
+        c.network.module(mod)
+    c.network.connect([fast_src, 'request'], [fast, 'request'])
+    c.network.connect([fast_src, 'idle'], [idle, 'idle']) # no message
+    c.network.connect([slow_src, 'request'], [slow, 'request'])
+    c.network.connect([fast, 'monitor'], [monitor, 'fast'])
+    c.network.connect([slow, 'monitor'], [monitor, 'slow'])
+    c.run()
+    c.close()
+    return c.network.modules
+
+def test_event_order(tmp_path):
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        del trace[:]
+        (fast_src, fast, idle, slow_src, slow, monitor) = network_run(22.0)
+    finally:
+        os.chdir(cwd)
+
+    assert [t for (t, _) in trace] == sorted(t for (t, _) in trace)
+    assert [t for (t, _) in monitor.seen] == [5.25, 5.25, 10.25, 10.25, 15.25, 15.25,
+                                              20.25, 20.25]
+    assert idle.num_events == 0
+    assert slow.num_events == 4
+    # Acks of the requests at 20.25 are due after the end time
+    assert [t for (t, _) in slow_src.acks] == [8.25, 13.25, 18.25]
+    assert fast.ended == 22.0 and fast_src.num_events == 22 + 4
+
+def test_unhandled_port(tmp_path):
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        unhandled_run()
+    finally:
+        os.chdir(cwd)
+
+class Receiver(Module):
+    """Calls recv() in a handler, which event-driven runs do not allow."""
+
+    def __init__(self):
+        super().__init__()
+        self.on('request', lambda time, data: self.recv('request'))
+
+def test_recv_in_event_run(tmp_path):
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        event_run(Receiver(), 'recv\\(\\) on port request in an event-driven run')
+    finally:
+        os.chdir(cwd)
+
+def unhandled_run():
+    event_run(Idle(), 'no handler for port request')
+
+def event_run(server, error):
+    c = Cortix(use_mpi=False, log_filename_stem='ctx-events', loglevel_console='error')
+    try:
+        with pytest.raises(RuntimeError, match=error):
+            c.network = Network()
+            c.network.event_driven = True
+            src = Source()
+            c.network.module(src)
+            c.network.module(server)
+            c.network.connect([src, 'request'], [server, 'request'])
+            c.network.event_end_time = 10.0
+            c.run()
+    finally:
+        c.close()
+
+if __name__ == "__main__":
+    import tempfile, pathlib
+    with tempfile.TemporaryDirectory() as tmp:
+        test_event_order(pathlib.Path(tmp))
+        test_unhandled_port(pathlib.Path(tmp))
+        test_recv_in_event_run(pathlib.Path(tmp))
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+import os
+import time
+import threading
+
+from cortix import Cortix
+from cortix import Module
+from cortix import Network
+from cortix import Port
+from cortix.src.inprocess_channel import BoundaryChannel
+
+class Solver(Module):
+    """Computes on alternating steps, exchanging its step index every step."""
+
+    def __init__(self, odd, num_steps=20, compute_time=0.02):
+        super().__init__()
+        self.odd = odd
+        self.num_steps = num_steps
+        self.compute_time = compute_time
+        self.received = list()
+        self.last = None
+        self.elapsed = None
+
+    def run(self, *args):
+        start = time.perf_counter()
+        for step in range(self.num_steps):
+            self.send(step, 'coupling')
+            self.received.append(self.recv('coupling'))
+            if step % 2 == self.odd:
+                time.sleep(self.compute_time)
+        self.last = self.sync('coupling')
+        self.send('done', 'coupling')
+        assert self.recv('coupling') == 'done'
+        self.elapsed = time.perf_counter() - start
+
+def test_lag_order():
+    (a, b) = (Port('a'), Port('b'))
+    a.connect(b)
+    (a.lag, b.lag) = (1, 1)
+    a.open_pipe()
+
+    def peer():
+        for i in range(5):
+            b.send(i)
+        b.send('end')
+        b.flush()
+    thread = threading.Thread(target=peer)
+    thread.start()
+
+    assert [a.recv() for i in range(5)] == [0, 0, 1, 2, 3]
+    assert a.sync() == 4
+    assert a.recv() == 'end'
+    thread.join()
+
+def test_lag_close():
+    threads = set(threading.enumerate())
+    (outer, peer) = (Port('outer'), Port('peer'))
+    outer.connect(peer)
+    outer.open_pipe()
+    nested = Port('nested') # a port of a nested module standing for the outer port
+    nested.channel = BoundaryChannel(outer)
+    nested.lag = 1
+
+    for message in [0, 1, 2, 'end', 'after']:
+        peer.send(message)
+
+    assert [nested.recv() for i in range(3)] == [0, 0, 1]
+    assert nested.sync() == 2
+    assert nested.recv() == 'end'
+    nested.close() # the nested module is done
+
+    # The parent module receives the messages that follow
+    assert outer.recv() == 'after'
+    assert set(threading.enumerate()) <= threads # the transfer threads ended
+
+def network_run(lag, **options):
+    c = Cortix(use_mpi=False, log_filename_stem='ctx-lag', loglevel_console='error',
+               **options)
+    c.network = Network()
+    solvers = [Solver(0), Solver(1)]
+    for solver in solvers:
+        solver.save = True
+        c.network.module(solver)
+    c.network.connect([solvers[0], 'coupling'], [solvers[1], 'coupling'], lag=lag)
+    if options.get('use_sockets'):
+        c.network.placement = {0: 0, 1: 1}
+    c.run()
+    c.close()
+    return c.network.modules
+
+def test_overlap(tmp_path):
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        lockstep = network_run(0)
+        for solver in lockstep:
+            assert solver.received == list(range(20))
+            assert solver.last is None # nothing in flight
+
+        lagged = network_run(1)
+        for solver in lagged:
+            assert solver.received == [0] + list(range(19))
+            assert solver.last == 19
+
+        # Each solver computes on every other step: lock-step waits on every step,
+        # the lag lets both run their half of the work side by side
+        assert max(s.elapsed for s in lagged) < 0.8 * min(s.elapsed for s in lockstep)
+    finally:
+        os.chdir(cwd)
+
+def test_socket_lag(tmp_path):
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        lagged = network_run(1, use_sockets=True, num_workers=2)
+    finally:
+        os.chdir(cwd)
+
+    for solver in lagged:
+        assert solver.received == [0] + list(range(19))
+        assert solver.last == 19
+
+if __name__ == "__main__":
+    import tempfile, pathlib
+    test_lag_order()
+    test_lag_close()
+    with tempfile.TemporaryDirectory() as tmp:
+        test_overlap(pathlib.Path(tmp))
+        test_socket_lag(pathlib.Path(tmp))
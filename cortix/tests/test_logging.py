@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+
+import os
+
+from cortix import Cortix
+from cortix import Module
+from cortix import Network
+
+class LoggingModule(Module):
+    def __init__(self):
+        super().__init__()
+
+    def run(self, *args):
+        self.log.debug('debug from {}'.format(self.name))
+        self.log.info('info from {}'.format(self.name))
+
+def test_logging_queue(tmp_path):
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        c = Cortix(log_filename_stem='ctx-logging', loglevel_console='info', loglevel_file='info')
+        c.network = Network()
+
+        for i in range(3):
+            m = LoggingModule()
+            m.name = 'logger-{}'.format(i)
+            c.network.module(m)
+
+        c.run()
+        c.close()
+
+        with open('ctx-logging.log') as fin:
+            text = fin.read()
+    finally:
+        os.chdir(cwd)
+
+    # Child records reach the single root handler; debug is filtered before formatting
+    for i in range(3):
+        assert 'info from logger-{}'.format(i) in text
+        assert 'debug from logger-{}'.format(i) not in text
+
+    assert not os.path.isfile(os.path.join(tmp_path, 'ctx-logging-rank1.log'))
+
+if __name__ == "__main__":
+    import tempfile
+    test_logging_queue(tempfile.mkdtemp())
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+import os
+import pytest
+
+from cortix import Cortix
+from cortix import Module
+from cortix import Network
+
+class Reactor(Module):
+    def __init__(self, num_steps=5):
+        super().__init__()
+        self.num_steps = num_steps
+        self.pid = None
+
+    def run(self, *args):
+        self.pid = os.getpid()
+        for i in range(self.num_steps):
+            self.send(float(i), 'heat')
+            self.recv('heat')
+
+class Turbine(Module):
+    def __init__(self, num_steps=5):
+        super().__init__()
+        self.num_steps = num_steps
+        self.pid = None
+        self.demands = list()
+
+    def run(self, *args):
+        self.pid = os.getpid()
+        for i in range(self.num_steps):
+            heat = self.recv('heat')
+            self.send(heat, 'heat')
+            self.send(2*heat, 'grid')
+            self.demands.append(self.recv('grid'))
+
+class Grid(Module):
+    def __init__(self, num_steps=5):
+        super().__init__()
+        self.num_steps = num_steps
+        self.power = list()
+
+    def run(self, *args):
+        for i in range(self.num_steps):
+            self.power.append(self.recv('plant'))
+            self.send(-i, 'plant')
+
+class Failing(Module):
+    def run(self, *args):
+        self.recv('x')
+
+class Raising(Module):
+    def run(self, *args):
+        raise ValueError('bad input')
+
+def make_plant():
+    plant = Module()
+    plant.name = 'Plant'
+    plant.network = Network()
+    reactor = Reactor()
+    turbine = Turbine()
+    plant.network.module(reactor)
+    plant.network.module(turbine)
+    plant.network.connect([reactor, 'heat'], [turbine, 'heat'])
+    plant.boundary_port(turbine, 'grid', name='plant')
+    return plant
+
+def test_nested_network(tmp_path):
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        c = Cortix(use_mpi=False, log_filename_stem='ctx-nested', loglevel_console='error')
+        c.network = Network()
+        plant = make_plant()
+        plant.save = True
+        grid = Grid()
+        grid.save = True
+        c.network.module(plant)
+        c.network.module(grid)
+        c.network.connect([plant, 'plant'], [grid, 'plant'])
+        c.run()
+        c.close()
+
+        (plant, grid) = c.network.modules
+        (reactor, turbine) = plant.network.modules
+        assert grid.power == [0.0, 2.0, 4.0, 6.0, 8.0]
+        assert turbine.demands == [0, -1, -2, -3, -4]
+        # Nested modules ran in the parent module process
+        assert reactor.pid == turbine.pid and reactor.pid != os.getpid()
+    finally:
+        os.chdir(cwd)
+
+def test_nested_failure():
+    parent = Module()
+    parent.network = Network()
+    (waiting, raising) = (Failing(), Raising())
+    parent.network.module(waiting)
+    parent.network.module(raising)
+    parent.network.connect([waiting, 'x'], [raising, 'x'])
+
+    with pytest.raises(RuntimeError, match='bad input'):
+        parent.run()
+
+if __name__ == "__main__":
+    import tempfile, pathlib
+    with tempfile.TemporaryDirectory() as tmp:
+        test_nested_network(pathlib.Path(tmp))
+    test_nested_failure()
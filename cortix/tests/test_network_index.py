@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+from cortix import Network
+from cortix import Port
+from cortix.tests.dummy_module import DummyModule
+from cortix.tests.benchmark_network import build
+
+def test_network_index():
+    (net, _) = build(2000)
+
+    assert [mod.id for mod in net.modules] == list(range(2000))
+    # Inferred connections are not repeated in the graph edges; explicit ones are
+    assert len(net.gv_edges) == 4000
+    net.connect(net.modules[0], net.modules[1])
+    assert len(net.gv_edges) == 4000
+
+    # Adding a module twice is a no-op
+    net.module(net.modules[5])
+    assert len(net.modules) == 2000
+
+    # Modules replaced in the list are found again
+    mod = DummyModule()
+    net.modules[7] = mod
+    net.connect([mod, 'a'], [net.modules[8], 'b'])
+    assert ('7', '8', None) in net.gv_edges
+
+    # Edges list reset elsewhere is re-indexed
+    net.gv_edges = list()
+    net.connect(net.modules[0], net.modules[1])
+    net.connect(net.modules[0], net.modules[1])
+    assert net.gv_edges == [('0', '1', None)]
+
+def test_port_index():
+    mod = DummyModule()
+    port = mod.get_port('a')
+    assert mod.get_port('a') is port
+    assert mod.get_port('b') is not port
+    assert len(mod.ports) == 2
+
+    # Ports list reset (as when a module is saved) is re-indexed
+    mod.ports = list()
+    assert mod.get_port('a') is not port
+    assert len(mod.ports) == 1
+
+    mod.ports.append(Port('c'))
+    assert mod.get_port('c') is mod.ports[-1]
+
+def test_lazy_pipe():
+    (a, b) = (Port('a'), Port('b'))
+    a.connect(b)
+    assert a.pipe is None and b.pipe is None
+    a.send(1)
+    assert b.recv() == 1
+
+    # Once a network run opened the pipes, a missing pipe is an error: a pipe opened
+    # in a module process would reach no other process
+    (c, d) = (Port('c'), Port('d'))
+    c.connect(d)
+    c.pipe_required = True
+    try:
+        c.send(1)
+    except RuntimeError as error:
+        assert 'Network.run()' in str(error)
+    else:
+        assert False, 'the missing pipe was not reported'
+
+if __name__ == "__main__":
+    test_network_index()
+    test_port_index()
+    test_lazy_pipe()
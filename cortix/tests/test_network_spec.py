@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+import os
+import json
+import numpy as np
+
+from cortix import Cortix
+from cortix import Module
+from cortix import Network
+from cortix.src.network_spec import compile_spec
+from cortix.tests.dummy_module import DummyModule
+
+class Token(Module):
+    def __init__(self, start=0):
+        super().__init__()
+        self.start = start
+        self.received = None
+
+    def run(self, *args):
+        self.send(self.start, 'next')
+        self.received = self.recv('prev')
+
+def count_pairs(net):
+    return sum(1 for mod in net.modules for port in mod.ports if port.connected_port)//2
+
+def test_patterns():
+    cls = 'cortix.tests.dummy_module.DummyModule'
+    spec = {'modules': [{'name': 'hub', 'class': cls},
+                        {'name': 'cell', 'class': cls, 'count': 12,
+                         'attributes': {'save': True}}],
+            'connections': [{'pattern': 'star', 'hub': 'hub', 'modules': 'cell'}]}
+    net = Network()
+    mods = net.build(spec)
+    assert len(net.modules) == 13 and count_pairs(net) == 12
+    assert mods['cell_3'].save and not mods['hub'].save
+    assert mods['hub'].get_port('cell_3').connected_port is mods['cell_3'].get_port('hub')
+
+    spec['connections'] = [{'pattern': 'all-to-all', 'modules': ['hub', 'cell']}]
+    net = Network()
+    net.build(spec)
+    assert count_pairs(net) == 13*12//2
+
+    spec['connections'] = [{'pattern': 'ring', 'modules': 'cell',
+                            'ports': ['{side_a}', '{side_b}']}]
+    net = Network()
+    mods = net.build(spec)
+    assert count_pairs(net) == 12
+    assert mods['cell_11'].get_port('next').connected_port is mods['cell_0'].get_port('prev')
+
+    spec['connections'] = [{'pattern': 'grid', 'modules': 'cell', 'shape': [3, 4],
+                            'ports': ['{side_a}', '{side_b}']}]
+    net = Network()
+    mods = net.build(spec)
+    assert count_pairs(net) == 3*3 + 2*4
+    assert mods['cell_1'].get_port('south').connected_port is mods['cell_5'].get_port('north')
+
+    spec['connections'][0]['periodic'] = True
+    net = Network()
+    net.build(spec)
+    assert count_pairs(net) == 3*4 + 3*4
+
+def test_spec_files_and_cache(tmp_path):
+    spec = {'modules': [{'name': 'a', 'class': 'cortix.tests.dummy_module.DummyModule'},
+                        {'name': 'b', 'class': DummyModule}],
+            'connections': [{'from': 'a', 'to': 'b', 'info': 'directional'},
+                            {'from': ['a', 'x'], 'to': ['b', 'y'], 'depth': 2}]}
+
+    assert compile_spec(spec) is compile_spec(dict(spec))
+    net = Network()
+    net.build(spec)
+    assert net.gv_edges == [('0', '1', 'directional'), ('0', '1', None)]
+
+    spec['modules'][1]['class'] = 'cortix.tests.dummy_module.DummyModule'
+    file_name = str(tmp_path / 'net.json')
+    with open(file_name, 'w') as fout:
+        json.dump(spec, fout)
+    assert compile_spec(file_name) is compile_spec(file_name)
+    assert len(compile_spec(file_name).connections) == 2
+
+    import yaml
+    file_name = str(tmp_path / 'net.yaml')
+    with open(file_name, 'w') as fout:
+        yaml.safe_dump(spec, fout)
+    net = Network()
+    mods = net.build(file_name)
+    assert mods['a'].get_port('x').connected_port is mods['b'].get_port('y')
+
+def test_cache_keys():
+    from cortix.src import network_spec
+
+    def spec(value):
+        return {'modules': [{'name': 'a', 'class': DummyModule,
+                             'attributes': {'value': value}}]}
+
+    assert compile_spec(spec(np.arange(3))) is compile_spec(spec(np.arange(3)))
+    assert compile_spec(spec(np.arange(3))) is not compile_spec(spec(np.arange(4)))
+    assert compile_spec(spec({1: 'x'})) is not compile_spec(spec({'1': 'x'}))
+
+    class Opaque:
+        pass
+    value = Opaque()
+    assert compile_spec(spec(value)) is not compile_spec(spec(value)) # not cached
+    assert compile_spec(spec(value)).modules[0][4]['value'] is value
+
+    for i in range(2 * network_spec._cache_size):
+        compile_spec(spec(i))
+    assert len(network_spec._cache) == network_spec._cache_size
+
+def test_build_run(tmp_path):
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        c = Cortix(use_mpi=False, log_filename_stem='ctx-spec', loglevel_console='error')
+        c.network = Network()
+        c.network.build({'modules': [{'name': 'token', 'class': Token, 'count': 4,
+                                      'attributes': {'save': True}}],
+                         'connections': [{'pattern': 'ring', 'modules': 'token',
+                                          'ports': ['{side_a}', '{side_b}']}]})
+        for (i, mod) in enumerate(c.network.modules):
+            mod.start = i
+        c.run()
+        c.close()
+        assert [mod.received for mod in c.network.modules] == [3, 0, 1, 2]
+    finally:
+        os.chdir(cwd)
+
+if __name__ == "__main__":
+    import tempfile, pathlib
+    test_patterns()
+    with tempfile.TemporaryDirectory() as tmp:
+        test_spec_files_and_cache(pathlib.Path(tmp))
+    test_cache_keys()
+    with tempfile.TemporaryDirectory() as tmp:
+        test_build_run(pathlib.Path(tmp))
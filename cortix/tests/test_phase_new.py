@@ -0,0 +1,419 @@
+#!/usr/bin/env python
+
+import os
+import time
+import pickle
+import numpy as np
+
+from cortix.support.phase_new import PhaseNew
+from cortix.support.phase_history import PhaseHistory, read_spill
+from cortix.support.species import Species
+from cortix.support.quantity import Quantity
+
+def make_phase():
+    water = Species(name='water', formula_name='H2O(l)', atoms=['2*H', 'O'])
+    quantities = [Quantity(name='temp', formal_name='T', value=300.0, unit='K'),
+                  Quantity(name='position', formal_name='x', value=np.zeros(3), unit='m')]
+    return PhaseNew(name='liquid', time_stamp=0.0, species=[water],
+                    quantities=quantities)
+
+def test_history():
+    phase = make_phase()
+    for i in range(1, 41):
+        phase.add_row(float(i), [0.1*i, 300.0 + i, np.full(3, float(i))])
+
+    assert phase.num_time_stamps == 41
+    assert phase.time_stamps == [float(i) for i in range(41)]
+    assert phase.actors == ['water', 'temp', 'position']
+    assert phase.get_value('temp', 7) == 307.0
+    assert isinstance(phase.get_value('temp'), float)
+    assert np.array_equal(phase.get_value('position', 40.0), np.full(3, 40.0))
+    assert phase.get_row(2)[:2] == [0.2, 302.0]
+
+    phase.set_value('temp', 1.0, 3.0)
+    vector = np.ones(3)
+    phase.set_value('position', vector, 3.0)
+    vector[0] = 5.0 # the history keeps a copy
+    assert phase.get_value('temp', 3.0) == 1.0
+    assert np.array_equal(phase.get_value('position', 3.0), np.ones(3))
+    assert not phase.has_time_stamp(3.5)
+    phase.set_value('water', np.array([0.5]), 3.0) # stored as its element
+    assert phase.get_value('water', 3.0) == 0.5
+
+    # Data frame built on access and rebuilt after a change
+    df = phase.df
+    assert df is phase.df
+    assert list(df.index) == phase.time_stamps
+    assert df['temp'].dtype == np.float64
+    assert df.loc[3.0, 'temp'] == 1.0
+    phase.add_row(41.0, [0.0, 0.0, np.zeros(3)])
+    assert phase.df is not df
+    assert len(phase.df.index) == 42
+    assert list(phase.history_frame(40).index) == [40.0, 41.0]
+
+    (quant, unit) = phase.get_quantity_history('temp')
+    assert unit == 's'
+    assert list(quant.value.index) == phase.time_stamps
+    assert quant.value[7.0] == 307.0
+
+    phase.scale_row(7.0, 2.0)
+    assert phase.get_value('temp', 7.0) == 614.0
+    assert np.array_equal(phase.get_value('position', 7.0), np.full(3, 14.0))
+
+    phase.add_single_species(Species(name='salt', formula_name='NaCl(aq)',
+                                     atoms=['Na', 'Cl']))
+    assert phase.get_column('salt') == [0.0] * 42
+
+    copy = pickle.loads(pickle.dumps(phase))
+    assert copy.time_stamps == phase.time_stamps
+    assert copy.get_value('temp', 7.0) == 614.0
+    copy.add_row(42.0, [0.0, 0.0, np.zeros(3), 0.0])
+    assert copy.num_time_stamps == 43
+
+    phase.ResetHistory(7.0)
+    assert phase.time_stamps == [7.0]
+    assert phase.get_value('temp') == 614.0
+
+def test_vector():
+    phase = make_phase()
+    phase.declare_vector('position')
+    for i in range(1, 41):
+        phase.add_row(float(i), [0.0, 300.0, np.full(3, float(i))])
+
+    values = phase.get_column_array('position')
+    assert values.shape == (41, 3) and values.dtype == np.float64
+    assert np.array_equal(values[:, 1], np.arange(41.0))
+
+    vector = phase.get_value('position', 5.0)
+    vector[0] = -1.0 # a copy
+    assert phase.get_value('position', 5.0)[0] == 5.0
+    phase.set_value('position', [1, 2, 3], 5.0)
+    assert np.array_equal(phase.get_value('position', 5.0), [1.0, 2.0, 3.0])
+    phase.scale_row(5.0, 2.0)
+    assert np.array_equal(phase.get_column('position')[5], [2.0, 4.0, 6.0])
+
+    (quant, unit) = phase.get_quantity_history('position')
+    assert np.array_equal(quant.value[40.0], np.full(3, 40.0))
+    assert np.array_equal(phase.df.loc[40.0, 'position'], np.full(3, 40.0))
+
+    copy = pickle.loads(pickle.dumps(phase))
+    copy.add_row(41.0, [0.0, 0.0, np.ones(3)])
+    assert copy.get_column_array('position').shape == (42, 3)
+
+    try:
+        phase.set_value('position', np.zeros(2))
+    except ValueError:
+        pass
+    else:
+        assert False, 'a vector of another shape was stored'
+
+def test_copy_policy():
+    phase = make_phase()
+    assert phase.copy_policy == 'deep'
+    value = [1.0, 2.0]
+    phase.set_value('temp', value)
+    value[0] = 5.0
+    assert phase.get_value('temp') == [1.0, 2.0]
+
+    phase.set_value('temp', value, copy='none')
+    assert phase.get_value('temp') is value
+
+    array = np.arange(3.0)
+    phase.copy_policy = 'none'
+    phase.set_value('temp', array)
+    stored = phase.get_value('temp')
+    assert stored is array and not stored.flags.writeable
+    # The phase took the array over: neither the caller nor a reader changes it
+    for holder in (array, stored):
+        try:
+            holder[0] = 1.0
+        except ValueError:
+            pass
+        else:
+            assert False, 'the stored array was changed in place'
+    changed = stored.copy() # copy on write
+    changed[0] = 1.0
+    phase.set_value('temp', changed)
+    assert phase.get_value('temp')[0] == 1.0 and array[0] == 0.0
+
+    # A view is copied: its base stays writable and does not change the history
+    buffer = np.zeros((2, 3))
+    phase.set_value('temp', buffer[0])
+    buffer[0, 0] = 7.0
+    assert phase.get_value('temp')[0] == 0.0 and buffer.flags.writeable
+
+    quant = Quantity(name='mass', formal_name='m', value=1.0, unit='kg')
+    shared = PhaseNew(quantities=[quant], copy='none')
+    assert shared.get_quantity('mass') is quant
+    assert PhaseNew(quantities=[quant]).get_quantity('mass') is not quant
+
+def test_batch():
+    phase = make_phase()
+    phase.declare_vector('position')
+    phase.append_step(1.0, position=np.ones(3), temp=301.0)
+    phase.append_step(2.0, temp=302.0)
+    assert phase.get_row(2.0)[:2] == [0.0, 302.0]
+    assert np.array_equal(phase.get_value('position', 2.0), np.ones(3))
+
+    phase.set_values({'water': 0.5, 'position': [1.0, 2.0, 3.0]}, 1.0)
+    assert phase.get_value('water', 1.0) == 0.5
+    assert np.array_equal(phase.get_value('position', 1.0), [1.0, 2.0, 3.0])
+
+    times = np.arange(3.0, 1003.0)
+    trajectory = np.stack([np.cos(times), np.sin(times), times], axis=1)
+    phase.add_rows(times, {'water': np.zeros(times.size), 'temp': 300.0 + times,
+                           'position': trajectory})
+    assert phase.num_time_stamps == 1003
+    assert phase.get_value('temp', 500.0) == 800.0
+    assert np.array_equal(phase.get_column_array('position')[3:], trajectory)
+
+    phase.add_rows([1003.0, 1004.0], [[0.0, 0.0], ['hot', 'cold'], np.zeros((2, 3))])
+    assert phase.get_value('temp') == 'cold'
+
+    try:
+        phase.add_rows([1004.0], [[0.0], [0.0], np.zeros((1, 3))])
+    except AssertionError:
+        pass
+    else:
+        assert False, 'a used time stamp was added'
+    assert phase.num_time_stamps == 1005
+
+def test_retention(tmp_path):
+    spill = str(tmp_path / 'liquid.spill')
+    phase = make_phase()
+    phase.declare_vector('position')
+    phase.retain(last=50, spill=spill)
+    for i in range(1, 1000):
+        phase.add_row(float(i), [0.0, 300.0 + i, np.full(3, float(i))])
+        assert phase.get_value('temp') == 300.0 + i
+    assert phase.time_stamps == [float(i) for i in range(950, 1000)]
+    assert np.array_equal(phase.get_column_array('position')[0], np.full(3, 950.0))
+
+    copy = pickle.loads(pickle.dumps(phase))
+    assert copy.time_stamps == phase.time_stamps
+    df = read_spill(spill)
+    assert list(df.index) == [float(i) for i in range(950)]
+    assert list(df['temp'])[1:] == [300.0 + i for i in range(1, 950)]
+    assert np.array_equal(df.loc[949.0, 'position'], np.full(3, 949.0))
+
+    history = PhaseHistory(['a'], capacity=1)
+    history.retain(last=100)
+    for i in range(100000):
+        history.append(float(i), [float(i)])
+    assert len(history) == 100 and history.capacity <= 256
+    assert history.get(0, 'a') == 99900.0
+
+    # Time stamps are told apart at the time step of the rows added, not at the
+    # spacing of the rows kept
+    phase = make_phase()
+    phase.retain(every=2000)
+    for i in range(1, 1002):
+        phase.add_row(float(i), [0.0, 300.0 + i, None])
+    assert phase.time_stamps == [0.0, 1001.0]
+    assert phase.get_value('temp', 1001.0) == 1301.0
+
+    # Rows are numbered from the first row stored; a row still replaced is not final
+    assert phase.num_rows_stored == 2 and not phase.last_row_final
+    phase.retain(last=1)
+    assert phase.num_rows_stored == 2 and phase.num_time_stamps == 1
+    assert phase.last_row_final
+
+    history = PhaseHistory(['a', 'b'])
+    history.retain(every=10)
+    for i in range(95):
+        history.append(float(i), [float(i), str(i)])
+    assert list(history.times) == [float(i) for i in range(0, 95, 10)] + [94.0]
+
+    for (aggregate, expected) in (('mean', [1.5, 5.5]), ('min', [0.0, 4.0]),
+                                  ('max', [3.0, 7.0])):
+        history = PhaseHistory(['a', 'b', 'x'])
+        history.set_shape('x', (2,))
+        history.retain(interval=4.0, aggregate=aggregate)
+        for i in range(11):
+            history.append(float(i), [float(i), str(i), [i, -i]])
+        assert list(history.times) == [0.0, 4.0, 10.0] # the last interval is open
+        assert list(history.column('a')[:2]) == expected
+        assert list(history.column('b')) == ['3', '7', '10']
+        assert list(history.column('x')[:2, 0]) == expected
+        assert history.get(-1, 'a') == 10.0 # the last row is kept as it is
+
+def test_mapped(tmp_path):
+    phase = make_phase()
+    phase.declare_vector('position')
+    phase.map_history(str(tmp_path / 'liquid'))
+    for i in range(1, 1000):
+        phase.add_row(float(i), [0.0, 300.0 + i, np.full(3, float(i))])
+    phase.set_value('water', 'wet', 5.0) # an object column in memory
+    assert isinstance(phase.get_column_array('temp'), np.ndarray)
+    assert phase.get_value('temp', 500.0) == 800.0
+
+    data = pickle.dumps(phase)
+    assert len(data) < 20000 # the history stays in the files
+    copy = pickle.loads(data)
+    assert copy.time_stamps == phase.time_stamps
+    assert copy.get_value('water', 5.0) == 'wet'
+    assert np.array_equal(copy.get_column_array('position')[:, 0], np.arange(1000.0))
+    copy.add_row(1000.0, [0.0, 1300.0, np.zeros(3)])
+    assert copy.get_value('temp') == 1300.0
+
+    history = PhaseHistory(['a', 'b'], capacity=1)
+    history.map_to(str(tmp_path / 'ring'))
+    history.retain(last=10)
+    for i in range(1000):
+        history.append(float(i), [float(i), float(-i)])
+    history.set(0, 'b', None)
+    assert list(history.column('a')) == [float(i) for i in range(990, 1000)]
+    assert history.capacity <= 32
+    assert len(os.listdir(str(tmp_path / 'ring'))) == 2 # times and column a
+
+def test_save_load(tmp_path):
+    file_name = str(tmp_path / 'liquid.phase')
+    phase = make_phase()
+    phase.declare_vector('position')
+    times = np.arange(1.0, 1000.0)
+    phase.add_rows(times, {'water': np.sin(times), 'temp': 300.0 + times,
+                           'position': np.stack([times, -times, 0.0*times], axis=1)})
+    phase.set_value('water', 'wet', 5.0)
+    phase.save(file_name, chunk_rows=100)
+
+    copy = PhaseNew.load(file_name)
+    assert copy.name == 'liquid' and copy.actors == phase.actors
+    assert copy.time_stamps == phase.time_stamps
+    assert copy.get_column('water') == phase.get_column('water')
+    assert np.array_equal(copy.get_column_array('position'),
+                          phase.get_column_array('position'))
+    assert copy.get_quantity('temp').unit == 'K'
+
+    part = PhaseNew.load(file_name, columns=['temp'], time_range=(250.0, 420.0))
+    assert part.actors == ['temp']
+    assert part.time_stamps == [float(i) for i in range(250, 421)]
+    assert part.get_value('temp', 300.0) == 600.0
+    part = PhaseNew.load(file_name, columns=['position'], time_range=(990.0, None))
+    assert part.get_column_array('position').shape == (10, 3)
+
+def test_interpolate():
+    phase = make_phase()
+    phase.declare_vector('position')
+    times = np.arange(1.0, 11.0)
+    phase.add_rows(times, {'water': ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'i', 'j'],
+                           'temp': 300.0 + times**2,
+                           'position': np.stack([times, 2.0*times, 0.0*times], axis=1)})
+
+    queries = np.array([2.5, 0.25, -1.0, 12.0, 7.0])
+    assert np.allclose(phase.interpolate('temp', queries, 'linear'),
+                       [306.5, 300.25, 300.0, 400.0, 349.0])
+    assert list(phase.interpolate('temp', queries, 'previous')) == \
+        [304.0, 300.0, 300.0, 400.0, 349.0]
+    assert np.allclose(phase.interpolate('temp', queries[:2], 'cubic'), [306.25, 300.0625])
+    assert phase.interpolate('temp', 2.5) == 306.5
+    assert np.allclose(phase.interpolate('position', [2.5, 3.0]), [[2.5, 5.0, 0.0],
+                                                                    [3.0, 6.0, 0.0]])
+    assert list(phase.interpolate('water', [0.5, 2.9], 'previous')) == [0.0, 'b']
+
+    coarse = phase.resample(2.0)
+    assert coarse.time_stamps == [0.0, 2.0, 4.0, 6.0, 8.0, 10.0]
+    assert coarse.get_column('temp') == [300.0, 304.0, 316.0, 336.0, 364.0, 400.0]
+    assert coarse.get_column('water') == [0.0, 'b', 'd', 'f', 'h', 'j']
+    assert coarse.get_column_array('position').shape == (6, 3)
+    fine = phase.resample(0.5, start=1.0, end=2.0)
+    assert fine.time_stamps == [1.0, 1.5, 2.0]
+
+    try:
+        phase.interpolate('water', [1.0])
+    except AssertionError:
+        pass
+    else:
+        assert False, 'strings were interpolated'
+
+def test_window():
+    phase = make_phase()
+    phase.declare_vector('position')
+    times = np.arange(1.0, 101.0)
+    phase.add_rows(times, {'water': np.zeros(100), 'temp': 300.0 + times,
+                           'position': np.stack([times, -times, 0.0*times], axis=1)})
+
+    (stamps, values) = phase.window(10.0, 20.5, ['temp', 'position'])
+    assert list(stamps) == [float(i) for i in range(10, 21)]
+    assert list(values['temp']) == [300.0 + i for i in range(10, 21)]
+    assert values['position'].shape == (11, 3)
+    assert not values['temp'].flags.writeable
+    assert np.shares_memory(values['temp'], phase.window()[1]['temp'])
+    assert len(phase.window(200.0)[0]) == 0
+    assert list(phase.window(end=1.0)[0]) == [0.0, 1.0]
+
+    assert phase.reduce_window('temp', 'min', 10.0, 20.0) == 310.0
+    assert phase.reduce_window('temp', 'max', 10.0, 20.0) == 320.0
+    assert phase.reduce_window('temp', 'mean', 10.0, 20.0) == 315.0
+    assert phase.reduce_window('temp', 'integral', 10.0, 20.0) == 3150.0
+    assert np.array_equal(phase.reduce_window('position', 'integral', 0.0, 2.0),
+                          [2.0, -2.0, 0.0])
+
+    shuffled = PhaseHistory(['a'])
+    for t in [3.0, 1.0, 2.0, 5.0, 4.0]:
+        shuffled.append(t, [10.0*t])
+    rows = shuffled.window(2.0, 4.0)
+    assert list(shuffled.column('a')[rows]) == [20.0, 30.0, 40.0]
+
+def test_capacity():
+    history = PhaseHistory(['a', 'b'], capacity=1)
+    for i in range(100):
+        history.append(float(i), [float(i), i])
+    assert len(history) == 100
+    assert history.capacity == 128
+    assert history.column('a').dtype == np.float64
+    assert history.column('b').dtype == object # ints kept as they are
+    assert history.get(-1, 'b') == 99
+    assert np.array_equal(history.times, np.arange(100.0))
+
+def test_nearest():
+    rng = np.random.default_rng(7)
+    times = np.cumsum(rng.uniform(0.5, 1.5, 200))
+    history = PhaseHistory(['a'])
+    for t in times:
+        history.append(t, [t])
+    for order in ('in order', 'shuffled'):
+        for query in rng.uniform(-1.0, times[-1] + 1.0, 500):
+            distance = np.abs(history.times - query)
+            expected = int(distance.argmin()) if distance.min() <= 0.2 else None
+            assert history.nearest(query, 0.2) == expected, (order, query)
+        assert history.nearest(times[-1] + 0.1, 0.2) == int(history.times.argmax())
+        history = PhaseHistory(['a'])
+        for t in rng.permutation(times):
+            history.append(t, [t])
+
+    phase = make_phase()
+    for i in range(1, 11):
+        phase.add_row(0.1*i, [0.0, 300.0, np.zeros(3)])
+    assert phase.has_time_stamp(0.5 + 1e-6)
+    assert not phase.has_time_stamp(0.5 + 1e-3)
+    assert phase.get_value('temp', 0.3) == 300.0
+
+def test_append_scaling():
+    def run(num_steps):
+        phase = make_phase()
+        start = time.perf_counter()
+        for i in range(1, num_steps + 1):
+            phase.add_row(float(i), [0.0, 300.0, np.zeros(3)])
+        return time.perf_counter() - start
+
+    run(500) # warm up
+    short = run(2000)
+    long = run(8000)
+    # Linear growth: 4x the steps in well under 16x the time
+    assert long < 8.0 * short, (short, long)
+
+if __name__ == "__main__":
+    test_history()
+    test_vector()
+    test_copy_policy()
+    test_batch()
+    import tempfile, pathlib
+    with tempfile.TemporaryDirectory() as tmp:
+        test_retention(pathlib.Path(tmp))
+        test_mapped(pathlib.Path(tmp))
+        test_save_load(pathlib.Path(tmp))
+    test_interpolate()
+    test_window()
+    test_capacity()
+    test_nearest()
+    test_append_scaling()
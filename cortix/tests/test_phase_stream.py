@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+import os
+import time
+
+from cortix import Cortix
+from cortix import Module
+from cortix import Network
+from cortix import Quantity
+from cortix.support.phase_new import PhaseNew
+from cortix.src.phase_stream import StreamCollector
+
+class Decay(Module):
+    def __init__(self, num_steps=40, pause=0.0, every=None):
+        super().__init__()
+        self.num_steps = num_steps
+        self.pause = pause
+        self.end_time = None
+        self.phase = PhaseNew(time_stamp=0.0, time_unit='s',
+                              quantities=[Quantity(name='n', formal_name='n', value=1.0)])
+        self.phase.set_value('n', 1.0, 0.0)
+        if every is not None:
+            self.phase.retain(every=every)
+
+    def run(self, *args):
+        for i in range(1, self.num_steps + 1):
+            values = self.phase.get_row()
+            self.phase.add_row(float(i), values)
+            self.phase.set_value('n', 0.5**i, float(i))
+            self.stream_phase(self.phase, 'decay')
+        time.sleep(self.pause)
+        self.end_time = time.time()
+
+def network_run(path, pause=0.0, callback=None, every=None):
+    c = Cortix(use_mpi=False, log_filename_stem='ctx-streams', loglevel_console='error')
+    c.network = Network()
+    collector = c.network.stream(path, batch_size=8, callback=callback)
+    for i in range(2):
+        decay = Decay(num_steps=40 + i, pause=pause, every=every)
+        decay.name = 'decay{}'.format(i)
+        decay.save = True
+        c.network.module(decay)
+    c.run()
+    c.close()
+    return (collector, c.network.modules)
+
+def test_stream_queue(tmp_path):
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    arrivals = list()
+    try:
+        (collector, modules) = network_run(None, pause=1.0,
+                                           callback=lambda m, p, rows: arrivals.append(time.time()))
+        assert collector.streams() == [('decay0', 'decay'), ('decay1', 'decay')]
+        for mod in modules:
+            rows = collector.view(mod.name)
+            # The whole history, initial row included
+            assert collector.num_rows(mod.name, 'decay') == mod.num_steps + 1
+            assert list(rows.index) == [float(i) for i in range(mod.num_steps + 1)]
+            assert rows['n'].tolist() == [0.5**i for i in range(mod.num_steps + 1)]
+            assert mod.stream_sink is None
+        # Batches of 8 rows arrived while the modules were still running
+        assert len(arrivals) == 2 * 6
+        assert min(arrivals) < min(mod.end_time for mod in modules) - 0.5
+    finally:
+        os.chdir(cwd)
+
+def test_stream_files(tmp_path):
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        (collector, modules) = network_run(str(tmp_path / 'streams'))
+        assert sorted(os.listdir(tmp_path / 'streams')) == ['decay0_0.stream', 'decay1_1.stream']
+        rows = collector.view('decay1', 'decay')
+        assert len(rows.index) == 42
+        assert rows.loc[41.0, 'n'] == 0.5**41
+        # Views are incremental; a finished stream gives the same frame back
+        assert collector.view('decay1') is rows
+    finally:
+        os.chdir(cwd)
+
+def test_stream_retained(tmp_path):
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        (collector, modules) = network_run(None, every=4)
+        for mod in modules:
+            # Each row kept is streamed once, with its final values
+            rows = collector.view(mod.name)
+            assert list(rows.index) == mod.phase.time_stamps
+            assert rows['n'].tolist() == [0.5**t for t in mod.phase.time_stamps]
+        assert modules[0].phase.time_stamps == [float(i) for i in range(0, 41, 4)]
+        assert modules[1].phase.time_stamps[-2:] == [40.0, 41.0]
+    finally:
+        os.chdir(cwd)
+
+if __name__ == "__main__":
+    import tempfile, pathlib
+    with tempfile.TemporaryDirectory() as tmp:
+        test_stream_queue(pathlib.Path(tmp))
+    with tempfile.TemporaryDirectory() as tmp:
+        test_stream_files(pathlib.Path(tmp))
+    with tempfile.TemporaryDirectory() as tmp:
+        test_stream_retained(pathlib.Path(tmp))
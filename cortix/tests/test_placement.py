@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+import os
+
+from cortix import Cortix
+from cortix import Module
+from cortix import Network
+from cortix.src import placement as plc
+
+class Chatter(Module):
+    def __init__(self, num_msgs=0):
+        super().__init__()
+        self.num_msgs = num_msgs
+
+    def run(self, *args):
+        for port in self.ports:
+            for i in range(self.num_msgs):
+                self.send(i, port)
+            for i in range(self.num_msgs):
+                self.recv(port)
+
+def cliques(size):
+    edges = dict()
+    for offset in (0, size):
+        for i in range(size):
+            for j in range(i+1, size):
+                edges[(offset+i, offset+j)] = 1.0
+    edges[(size-1, size)] = 1.0 # bridge
+    return edges
+
+def test_partition_cliques():
+    edges = cliques(8)
+    assignment = plc.partition(2, edges, [1.0]*16)
+
+    assert plc.cut_weight(edges, assignment) == 1.0
+    assert assignment.count(0) == 8
+
+def test_place_by_node():
+    edges = cliques(4)
+    workers = ['n0', 'n0', 'n1', 'n1']
+    placement = plc.place(edges, [1.0]*8, workers)
+
+    nodes = [{workers[placement[m]] for m in range(4)}, {workers[placement[m]] for m in range(4, 8)}]
+    assert len(nodes[0]) == 1 and len(nodes[1]) == 1 and nodes[0] != nodes[1]
+
+    summary = plc.report(edges, [1.0]*8, placement, workers)
+    assert summary['node_cut_weight'] == 1.0
+    assert summary['worker_loads'] == [2.0]*4
+
+def test_network_graph(tmp_path):
+    net = Network()
+    mods = [Chatter() for i in range(3)]
+    for mod in mods:
+        net.module(mod)
+    net.connect([mods[0], 'a'], [mods[1], 'a'], volume=10)
+    net.connect([mods[1], 'b'], [mods[2], 'b'])
+    net.module_loads[2] = 3.0
+
+    (edges, loads) = plc.network_graph(net)
+    assert edges == {(0, 1): 10.0, (1, 2): 1.0}
+    assert loads == [1.0, 1.0, 3.0]
+
+    file_name = str(tmp_path / 'placement.json')
+    plc.write_placement(file_name, plc.report(edges, loads, {0: 0, 1: 0, 2: 1}, ['h', 'h']))
+    assert plc.read_placement(file_name) == {0: 0, 1: 0, 2: 1}
+
+def test_measured_volumes(tmp_path):
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        c = Cortix(use_mpi=False, log_filename_stem='ctx-placement', loglevel_console='error')
+        c.network = Network()
+        mods = [Chatter(num_msgs=n) for n in (5, 5, 2, 2)]
+        for mod in mods:
+            mod.save = True
+            c.network.module(mod)
+        c.network.connect([mods[0], 'x'], [mods[1], 'x'])
+        c.network.connect([mods[2], 'y'], [mods[3], 'y'])
+        c.run()
+        c.close()
+
+        assert c.network.measured_volumes == {(0, 1): 10.0, (2, 3): 4.0}
+    finally:
+        os.chdir(cwd)
+
+def test_auto_placement_sockets(tmp_path):
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        c = Cortix(use_sockets=True, num_workers=2, log_filename_stem='ctx-placement',
+                   loglevel_console='error')
+        c.network = Network()
+        mods = [Chatter(num_msgs=3) for i in range(4)]
+        for mod in mods:
+            c.network.module(mod)
+        # Heavy pairs (0, 2) and (1, 3) should each share a worker
+        c.network.connect([mods[0], 'x'], [mods[2], 'x'], volume=100)
+        c.network.connect([mods[1], 'y'], [mods[3], 'y'], volume=100)
+        c.network.connect([mods[0], 'z'], [mods[1], 'z'], volume=1)
+        c.network.auto_placement = True
+        c.network.placement_file = 'placement.json'
+        c.run()
+        c.close()
+
+        placement = c.network.placement_report['placement']
+        assert placement[0] == placement[2] and placement[1] == placement[3]
+        assert placement[0] != placement[1]
+        assert c.network.placement_report['cut_weight'] == 1.0
+        assert plc.read_placement('placement.json') == placement
+    finally:
+        os.chdir(cwd)
+
+if __name__ == "__main__":
+    import tempfile, pathlib
+    test_partition_cliques()
+    test_place_by_node()
+    with tempfile.TemporaryDirectory() as tmp:
+        test_network_graph(pathlib.Path(tmp))
+    with tempfile.TemporaryDirectory() as tmp:
+        test_measured_volumes(pathlib.Path(tmp))
+    with tempfile.TemporaryDirectory() as tmp:
+        test_auto_placement_sockets(pathlib.Path(tmp))
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+import os
+import time
+import multiprocessing as multiproc
+
+from cortix import Cortix
+from cortix import Module
+from cortix import Network
+from cortix.src.queue_channel import QueueChannel
+
+class Producer(Module):
+    def __init__(self, num_steps=100, lossy=False):
+        super().__init__()
+        self.num_steps = num_steps
+        self.lossy = lossy
+
+    def run(self, *args):
+        for i in range(self.num_steps):
+            self.send(i, 'visualization')
+        if self.lossy:
+            # An end marker could discard the last value; the last value is never
+            # discarded and ends the consumer, which acknowledges it on a plain pipe
+            assert self.recv('ack') == 'done'
+        else:
+            self.send(None, 'visualization')
+
+class SlowConsumer(Module):
+    def __init__(self, last=None):
+        super().__init__()
+        self.last = last
+        self.received = list()
+
+    def run(self, *args):
+        while True:
+            data = self.recv('data')
+            if data is None:
+                break
+            self.received.append(data)
+            if data == self.last:
+                self.send('done', 'ack')
+                break
+            time.sleep(0.01)
+
+def test_policies():
+    ctx = multiproc.get_context('spawn')
+
+    (a, b) = QueueChannel.pair(ctx, 3, 'drop-oldest')
+    for i in range(6):
+        a.send(i)
+    assert a.num_dropped == 3
+    assert [b.recv() for i in range(3)] == [3, 4, 5]
+
+    (a, b) = QueueChannel.pair(ctx, 3, 'coalesce-latest')
+    for i in range(4):
+        a.send(i)
+    assert a.num_coalesced == 3
+    assert b.poll(1.0)
+    assert b.recv() == 3
+    assert not b.poll(0.05)
+
+    # Both directions are independent
+    b.send('back')
+    assert a.recv() == 'back'
+
+def network_run(depth, policy, num_steps=100):
+    c = Cortix(use_mpi=False, log_filename_stem='ctx-queues', loglevel_console='error')
+    c.network = Network()
+    lossy = policy != 'block'
+    producer = Producer(num_steps, lossy)
+    producer.save = True
+    consumer = SlowConsumer(num_steps-1 if lossy else None)
+    consumer.save = True
+    c.network.module(producer)
+    c.network.module(consumer)
+    c.network.connect([producer, 'visualization'], [consumer, 'data'], depth=depth,
+                      policy=policy)
+    if lossy:
+        c.network.connect([consumer, 'ack'], [producer, 'ack'])
+    c.run()
+    c.close()
+    return c.network.modules
+
+def test_backpressure(tmp_path):
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        (producer, consumer) = network_run(4, 'block', num_steps=30)
+        stats = producer.port_stats['visualization']
+        assert consumer.received == list(range(30))
+        assert stats['num_blocked'] > 0 and stats['blocked_time'] > 0.0
+
+        (producer, consumer) = network_run(4, 'drop-oldest')
+        stats = producer.port_stats['visualization']
+        assert stats['num_dropped'] > 0 and stats['num_blocked'] == 0
+        assert len(consumer.received) + stats['num_dropped'] == 100
+        assert consumer.received == sorted(consumer.received)
+        assert consumer.received[-1] == 99
+
+        (producer, consumer) = network_run(4, 'coalesce-latest')
+        stats = producer.port_stats['visualization']
+        assert stats['num_coalesced'] > 0
+        assert len(consumer.received) + stats['num_coalesced'] == 100
+        assert consumer.received == sorted(consumer.received)
+        assert consumer.received[-1] == 99
+    finally:
+        os.chdir(cwd)
+
+if __name__ == "__main__":
+    import tempfile, pathlib
+    test_policies()
+    with tempfile.TemporaryDirectory() as tmp:
+        test_backpressure(pathlib.Path(tmp))
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+import os
+import time
+import numpy as np
+
+from cortix import Cortix
+from cortix import Module
+from cortix import Network
+from cortix.src.replay import Recording, replay
+
+class Source(Module):
+    def __init__(self, num_steps=10):
+        super().__init__()
+        self.num_steps = num_steps
+        self.results = list()
+
+    def run(self, *args):
+        rng = np.random.default_rng(7)
+        for step in range(self.num_steps):
+            self.send(rng.random(1000), 'field')
+            time.sleep(0.01)
+            self.results.append(self.recv('field'))
+        self.send(None, 'field')
+
+class Reactor(Module):
+    def __init__(self, power=2.0):
+        super().__init__()
+        self.power = power
+        self.num_steps = 0
+
+    def run(self, *args):
+        while True:
+            field = self.recv('field')
+            if field is None:
+                break
+            self.num_steps += 1
+            self.send(float(np.sum(field**self.power)), 'field')
+
+def test_record_replay(tmp_path):
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        c = Cortix(use_mpi=False, log_filename_stem='ctx-replay', loglevel_console='error')
+        c.network = Network()
+        (source, reactor) = (Source(), Reactor())
+        source.save = True
+        c.network.module(source)
+        c.network.module(reactor)
+        c.network.connect([source, 'field'], [reactor, 'field'])
+        c.network.record('recordings', modules=[reactor])
+        c.run()
+        c.close()
+        source = c.network.modules[0]
+
+        assert os.listdir('recordings') == ['Reactor_1.rec']
+        recording = Recording('recordings/Reactor_1.rec')
+        assert recording.port_names == ['field']
+        assert len(recording.messages) == 11
+        offsets = [offset for (_, offset, _) in recording.messages]
+        assert offsets == sorted(offsets) and offsets[-1] >= 0.09
+
+        # The module is rebuilt as it was when the run started
+        result = replay('recordings/Reactor_1.rec')
+        assert result.module.num_steps == 10 and result.module.power == 2.0
+        assert result.num_received == 11 and result.num_left == 0
+        assert result.sent['field'] == source.results # bit-identical inputs
+        assert result.elapsed < offsets[-1]
+
+        slow = replay('recordings/Reactor_1.rec', module=Reactor(), realtime=True)
+        assert slow.sent['field'] == source.results
+        assert slow.elapsed >= offsets[-1]
+    finally:
+        os.chdir(cwd)
+
+if __name__ == "__main__":
+    import tempfile, pathlib
+    with tempfile.TemporaryDirectory() as tmp:
+        test_record_replay(pathlib.Path(tmp))
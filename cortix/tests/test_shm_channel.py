@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import subprocess
+import multiprocessing as multiproc
+
+import numpy as np
+
+from cortix.src.shm_channel import SharedMemoryRing, SharedMemoryChannel
+
+def echo(out_name, in_name, n_msgs):
+    out_ring = SharedMemoryRing.attach(out_name)
+    in_ring = SharedMemoryRing.attach(in_name)
+    channel = SharedMemoryChannel(out_ring, in_ring)
+    for _ in range(n_msgs):
+        channel.send(channel.recv())
+    channel.close()
+
+def test_shm_channel():
+    token = os.urandom(4).hex()
+    # Small rings: messages wrap around and are larger than the ring
+    to_child = SharedMemoryRing.create('ctx-test-{}-a'.format(token), capacity=4096)
+    to_parent = SharedMemoryRing.create('ctx-test-{}-b'.format(token), capacity=1000)
+    channel = SharedMemoryChannel(to_child, to_parent)
+
+    msgs = ['hello', 3.14, {'a': [1, 2]}, np.arange(10000, dtype=np.float64), b'x'*999]
+
+    ctx = multiproc.get_context('spawn')
+    proc = ctx.Process(target=echo, args=(to_parent.name, to_child.name, len(msgs)))
+    proc.start()
+
+    assert not channel.poll(0.01)
+    for msg in msgs:
+        channel.send(msg)
+        back = channel.recv()
+        if isinstance(msg, np.ndarray):
+            assert np.array_equal(back, msg)
+        else:
+            assert back == msg
+
+    proc.join()
+    assert proc.exitcode == 0
+    channel.close()
+
+def test_attach_untracked():
+    ring = SharedMemoryRing.create('ctx-test-{}'.format(os.urandom(4).hex()), capacity=64)
+
+    # A process with its own resource tracker, as an MPI rank, attaches and exits; the
+    # tracker must not unlink the segment of the creator
+    code = ('from cortix.src.shm_channel import SharedMemoryRing\n'
+            'ring = SharedMemoryRing.attach({!r})\n'
+            'ring.write(b"ok")\n'
+            'ring.close()\n'.format(ring.name))
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                         env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
+    assert out.returncode == 0, out.stderr
+    assert 'leaked' not in out.stderr
+
+    assert bytes(ring.read(2)) == b'ok'
+    ring.unlink() # raises if the segment was unlinked
+    ring.close()
+
+if __name__ == "__main__":
+    test_shm_channel()
+    test_attach_untracked()
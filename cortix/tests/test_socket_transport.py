@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+
+import os
+import socket
+import threading
+import multiprocessing as multiproc
+
+from cortix import Cortix
+from cortix import Module
+from cortix import Network
+from cortix.src.socket_transport import SocketChannel, recv_frame
+from cortix.src.worker import Worker
+
+class Pinger(Module):
+    def __init__(self):
+        super().__init__()
+        self.replies = list()
+
+    def run(self, *args):
+        for i in range(20):
+            self.send(i, 'pong')
+            self.replies.append(self.recv('pong'))
+        self.log.info('pinger done')
+
+class Ponger(Module):
+    def __init__(self):
+        super().__init__()
+
+    def run(self, *args):
+        for i in range(20):
+            self.send(2*self.recv('ping'), 'ping')
+
+class Flaky(Module):
+    def __init__(self):
+        super().__init__()
+        self.fail = True
+
+    def run(self, *args):
+        if self.fail:
+            raise ValueError('flaky module failed')
+
+def test_socket_channel_batching():
+    (a, b) = socket.socketpair()
+    ch_a = SocketChannel(a, batch_size=3)
+    ch_b = SocketChannel(b)
+
+    ch_a.send('x')
+    ch_a.send({'y': 1})
+    assert not ch_b.poll(0.05) # still batched
+
+    ch_a.send([3])
+    assert ch_b.poll(1.0)
+    assert ch_b.recv() == 'x'
+    assert ch_b.recv() == {'y': 1}
+    assert ch_b.recv() == [3]
+
+    # Pending batches are flushed before a channel blocks on a receive
+    ch_a.send('ping')
+    assert not ch_b.poll(0.05)
+    ch_b.send('pong')
+    assert ch_a.recv() == 'pong'
+    assert ch_b.recv() == 'ping'
+
+    a.close()
+    b.close()
+    SocketChannel._channels.clear()
+
+def test_socket_channel_threads():
+    (a, b) = socket.socketpair()
+    ch_a = SocketChannel(a, batch_size=7)
+    ch_b = SocketChannel(b)
+
+    # Sends from one thread while another flushes: no message is lost
+    def send():
+        for i in range(2000):
+            ch_a.send(i)
+    def flush():
+        for i in range(2000):
+            SocketChannel.flush_all()
+    threads = [threading.Thread(target=send), threading.Thread(target=flush)]
+    for thread in threads:
+        thread.start()
+    received = [ch_b.recv() for i in range(2000)]
+    for thread in threads:
+        thread.join()
+    assert received == list(range(2000))
+
+    a.close()
+    b.close()
+    SocketChannel._channels.clear()
+
+def test_socket_transport(tmp_path):
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        c = Cortix(use_sockets=True, num_workers=2, log_filename_stem='ctx-sockets',
+                   loglevel_console='error')
+        c.network = Network()
+
+        pingers = list()
+        for i in range(2):
+            pinger = Pinger()
+            pinger.save = True
+            ponger = Ponger()
+            c.network.module(pinger)
+            c.network.module(ponger)
+            c.network.connect([pinger, 'pong'], [ponger, 'ping'])
+            pingers.append(pinger)
+
+        # Each pair straddles the two workers
+        c.network.placement = {0: 0, 1: 1, 2: 1, 3: 0}
+
+        c.run()
+        c.close()
+
+        with open('ctx-sockets.log') as fin:
+            text = fin.read()
+    finally:
+        os.chdir(cwd)
+
+    results = [m for m in c.network.modules if isinstance(m, Pinger)]
+    assert len(results) == 2
+    for pinger in results:
+        assert pinger.replies == [2*i for i in range(20)]
+
+    # Module records are forwarded to the root log
+    assert text.count('pinger done') == 2
+
+def test_worker_pool_reuse(tmp_path):
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        c = Cortix(use_sockets=True, num_workers=2, log_filename_stem='ctx-reuse',
+                   loglevel_console='critical')
+        c.network = Network()
+        pinger = Pinger()
+        pinger.save = True
+        ponger = Ponger()
+        flaky = Flaky()
+        c.network.module(pinger)
+        c.network.module(ponger)
+        c.network.module(flaky)
+        c.network.connect([pinger, 'pong'], [ponger, 'ping'])
+        c.network.placement = {0: 0, 1: 1, 2: 0}
+
+        try:
+            c.run()
+        except RuntimeError as error:
+            assert 'flaky module failed' in str(error)
+        else:
+            assert False, 'the module error was not raised'
+
+        # The failed run leaves no message behind: the same workers run the network
+        flaky.fail = False
+        c.run()
+        c.close()
+    finally:
+        os.chdir(cwd)
+
+    assert c.network.modules[0].replies == [2*i for i in range(20)]
+
+def test_worker_cleanup():
+    server = socket.create_server(('127.0.0.1', 0))
+    worker = Worker('127.0.0.1:{}'.format(server.getsockname()[1]), timeout=5.0)
+    (root, _) = server.accept()
+    assert recv_frame(root)[0] == 'hello'
+
+    threads = set(threading.enumerate()) # threads of earlier tests may still end
+    worker.host = '203.0.113.1' # not an address of this host: the endpoint step fails
+    job = {'modules': [(0, Ponger())], 'ports': {0: dict()}, 'log_level': 'error',
+           'affinity': None}
+    try:
+        worker._Worker__run(job)
+    except RuntimeError:
+        pass
+    else:
+        assert False, 'the module error was not raised'
+
+    # The module processes and the log listener thread are gone
+    assert multiproc.active_children() == []
+    assert set(threading.enumerate()) <= threads
+
+    worker.sock.close()
+    root.close()
+    server.close()
+
+if __name__ == "__main__":
+    import tempfile
+    test_socket_channel_batching()
+    test_socket_channel_threads()
+    test_worker_cleanup()
+    test_socket_transport(tempfile.mkdtemp())
+    test_worker_pool_reuse(tempfile.mkdtemp())
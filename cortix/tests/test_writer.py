@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+import os
+import numpy as np
+import pytest
+
+from cortix import Cortix
+from cortix import Module
+from cortix import Network
+from cortix.support.writer import Writer, read_series
+
+class Orbit(Module):
+    def __init__(self, num_steps=100, batch=7):
+        super().__init__()
+        self.num_steps = num_steps
+        self.batch = batch
+
+    def run(self, *args):
+        time = np.arange(self.num_steps, dtype=float)
+        position = np.stack([np.cos(time), np.sin(time), np.zeros_like(time)], axis=1)
+        for start in range(0, self.num_steps, self.batch):
+            end = start + self.batch
+            self.send({'time': time[start:end], 'position': position[start:end]}, 'output')
+        self.send(('energy', {'time': 0.0, 'energy': -1.0}), 'output') # one-row batch
+        self.send(None, 'output')
+
+def test_chunks(tmp_path):
+    writer = Writer(str(tmp_path), chunk_rows=10, max_buffered_rows=15, file_format='npz')
+    for i in range(8):
+        writer.write({'t': [3.0*i, 3.0*i+1, 3.0*i+2], 'x': [i, i, i]}, 'a')
+    writer.write(('b', {'t': 0.5, 'x': 9}))
+    writer.write(('b', {'t': 1.5, 'x': 9}))
+    # 24 rows of a: two full chunks, 4 rows left with the 2 of b
+    assert writer.num_rows == {'a': 20}
+    writer.close()
+    assert writer.num_rows == {'a': 24, 'b': 2}
+    assert len(writer.files['a']) == 3
+
+    a = read_series(str(tmp_path), 'a')
+    assert np.array_equal(a['t'], np.arange(24.0))
+    assert np.array_equal(a['x'], np.repeat(np.arange(8), 3))
+
+    # Memory bound: the largest buffer is written before a chunk fills up
+    writer = Writer(str(tmp_path / 'bounded'), chunk_rows=100, max_buffered_rows=15,
+                    file_format='npz')
+    for series in ('c', 'd'):
+        writer.write({'t': np.arange(8.0)}, series)
+    assert writer.num_rows == {'c': 8}
+    writer.close()
+    assert np.array_equal(read_series(str(tmp_path / 'bounded'), 'd')['t'], np.arange(8.0))
+
+    # Series names are file names in the output directory
+    for series in ('../escape', 'a/b', '', '.hidden'):
+        try:
+            writer.write({'t': [0.0]}, series)
+        except AssertionError:
+            pass
+        else:
+            assert False, 'series %r was written'%series
+    assert not os.path.exists(str(tmp_path / 'escape.00000.npz'))
+
+def test_parquet_types(tmp_path):
+    pytest.importorskip('pyarrow')
+
+    writer = Writer(str(tmp_path), chunk_rows=2, file_format='parquet')
+    writer.write({'t': [0.0, 1.0], 'n': [1, 2], 'x': [1, 2]}, 'a')
+    writer.write({'t': [2.0, 3.0], 'n': [3, 4], 'x': [2.5, 3.5]}, 'a') # floats
+    writer.write({'t': [4.0, 5.0], 'n': [5, 6], 'x': [None, 6]}, 'a')  # missing value
+    writer.close()
+
+    # Integers stay integers; the mixed column is widened to float64
+    a = read_series(str(tmp_path), 'a')
+    assert a['n'].dtype == np.int64
+    assert np.array_equal(a['n'], np.arange(1, 7))
+    assert a['x'].dtype == np.float64
+    assert np.array_equal(a['x'][[0, 1, 2, 3, 5]], [1.0, 2.0, 2.5, 3.5, 6.0])
+    assert np.isnan(a['x'][4])
+    assert np.array_equal(a['t'], np.arange(6.0))
+
+    import pyarrow.parquet as pq
+    assert pq.ParquetFile(writer.files['a'][0]).num_row_groups == 3
+
+    # Values that fit no common type are rejected
+    writer = Writer(str(tmp_path / 'text'), chunk_rows=1, file_format='parquet')
+    writer.write({'x': [1.0]}, 'b')
+    with pytest.raises(ValueError):
+        writer.write({'x': ['one']}, 'b')
+
+def test_network(tmp_path):
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        c = Cortix(use_mpi=False, log_filename_stem='ctx-writer', loglevel_console='error')
+        c.network = Network()
+        writer = Writer('output', chunk_rows=32, file_format='npz')
+        writer.save = True
+        c.network.module(writer)
+        for name in ('earth', 'mars'):
+            orbit = Orbit(num_steps=100)
+            orbit.name = name
+            c.network.module(orbit)
+            c.network.connect([orbit, 'output'], [writer, name])
+        c.run()
+        c.close()
+
+        writer = c.network.modules[0]
+        assert writer.num_rows == {'earth': 100, 'mars': 100, 'energy': 2}
+        earth = read_series('output', 'earth')
+        assert earth['position'].shape == (100, 3)
+        assert np.allclose(earth['position'][:, 0], np.cos(earth['time']))
+        assert np.array_equal(read_series('output', 'energy')['energy'], [-1.0, -1.0])
+    finally:
+        os.chdir(cwd)
+
+if __name__ == "__main__":
+    import tempfile, pathlib
+    with tempfile.TemporaryDirectory() as tmp:
+        test_chunks(pathlib.Path(tmp))
+    with tempfile.TemporaryDirectory() as tmp:
+        test_parquet_types(pathlib.Path(tmp))
+    with tempfile.TemporaryDirectory() as tmp:
+        test_network(pathlib.Path(tmp))
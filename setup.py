@@ -29,6 +29,9 @@ setuptools.setup(
     install_requires=REQ,
     url="https://cortix.org",
     packages=setuptools.find_namespace_packages(),
+    entry_points={
+        'console_scripts': ['cortix-worker=cortix.src.worker:main']
+    },
     keywords = ['simulation', 'math'],
     classifiers=[
         "Programming Language :: Python :: 3",